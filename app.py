@@ -1,8 +1,8 @@
 import streamlit as st
-import pandas as pd
 from datetime import date, timedelta, datetime
 import db_manager as db
-from main import run_data_update
+import sync_jobs
+import data_service
 import auth_manager
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
@@ -74,15 +74,25 @@ if st.sidebar.button("🚪 تسجيل الخروج", use_container_width=True):
 st.sidebar.divider()
 
 if st.sidebar.button("🔄 تحديث وسحب البيانات", type="primary", use_container_width=True):
-    with st.spinner("جاري سحب البيانات من Google Sheet الخاص بك..."):
-        update_log = run_data_update(gc, user_id)
-        st.session_state['update_log'] = update_log
-    st.toast("اكتملت عملية المزامنة بنجاح!", icon="✅")
-    st.cache_data.clear()
+    # تعمل المزامنة في الخلفية، ويمكن متابعة تقدمها أدناه أثناء تصفح باقي الصفحات
+    job, started = sync_jobs.start_sync_job(gc, user_id)
+    if started:
+        st.toast("بدأت المزامنة في الخلفية.", icon="🔄")
+    else:
+        st.toast("توجد مزامنة قيد التشغيل بالفعل.", icon="⏳")
+
+with st.sidebar:
+    sync_jobs.render_sync_status(user_id)
 
 
 if 'update_log' in st.session_state:
-    st.sidebar.info("اكتملت عملية المزامنة الأخيرة.")
+    update_status = st.session_state.pop('update_status', 'done')
+    if update_status == 'failed':
+        st.sidebar.error("فشلت عملية المزامنة الأخيرة.")
+    elif update_status == 'partial':
+        st.sidebar.warning("اكتملت عملية المزامنة الأخيرة مع وجود أخطاء.")
+    else:
+        st.sidebar.info("اكتملت عملية المزامنة الأخيرة.")
     with st.sidebar.expander("عرض تفاصيل سجل التحديث"):
         for message in st.session_state.update_log:
             st.text(message)
@@ -91,9 +101,8 @@ if 'update_log' in st.session_state:
 
 # --- Check if setup is complete ---
 user_settings = db.get_user_settings(user_id)
-all_data = db.get_all_data_for_stats(user_id)
-members_df = pd.DataFrame(all_data.get('members', []))
-periods_df = pd.DataFrame(all_data.get('periods', []))
+workspace = data_service.get_workspace(user_id)
+members_df, periods_df = workspace['members'], workspace['periods']
 
 setup_complete = (
     user_settings.get("spreadsheet_url") and
@@ -119,6 +128,7 @@ if not setup_complete:
                 if names:
                     with st.spinner("جاري إضافة الأعضاء..."):
                         db.add_members(user_id, names)
+                        data_service.invalidate(user_id)
                     st.success("تمت إضافة الأعضاء بنجاح! سيتم تحديث الصفحة للمتابعة إلى الخطوة التالية.")
                     st.balloons()
                     time.sleep(2)
@@ -230,6 +240,7 @@ if not setup_complete:
                     if default_rules:
                         success, message = db.add_book_and_challenge(user_id, book_info, challenge_info, default_rules)
                         if success:
+                            data_service.invalidate(user_id)
                             st.success("🎉 اكتمل الإعداد! تم إنشاء أول تحدي بنجاح.")
                             st.balloons()
                             time.sleep(2)
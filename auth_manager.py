@@ -33,16 +33,12 @@ def _get_flow():
         redirect_uri="https://reading-marathon.streamlit.app"
     )
 
-def _rebuild_credentials_from_db(user_id):
+def build_credentials(refresh_token: str, client_config: dict):
     """
-    Attempts to rebuild a valid credential object using the refresh token
-    stored in Firestore. This is the core of the F5-proof logic.
+    Builds and refreshes a credential object from a stored refresh token and
+    the OAuth client config. Does not depend on Streamlit, so it is shared by
+    the app and the headless sync CLI. Returns None if the refresh fails.
     """
-    refresh_token = db.get_refresh_token(user_id)
-    if not refresh_token:
-        return None
-
-    client_config = dict(st.secrets["google_oauth_credentials"])
     try:
         creds = Credentials(
             token=None,
@@ -57,6 +53,17 @@ def _rebuild_credentials_from_db(user_id):
     except Exception:
         return None
 
+def _rebuild_credentials_from_db(user_id):
+    """
+    Attempts to rebuild a valid credential object using the refresh token
+    stored in Firestore. This is the core of the F5-proof logic.
+    """
+    refresh_token = db.get_refresh_token(user_id)
+    if not refresh_token:
+        return None
+
+    return build_credentials(refresh_token, dict(st.secrets["google_oauth_credentials"]))
+
 def authenticate():
     """
     Handles the complete Google OAuth 2.0 flow with Firestore-backed persistence
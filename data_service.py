@@ -0,0 +1,361 @@
+import os
+import threading
+import time
+import pandas as pd
+import streamlit as st
+import db_manager as db
+import snapshot_cache
+from main import load_daily_rollup
+
+# أقل مدة بين فحصين لإصدارات بيانات المستخدم (قراءة مستند واحد)، وأقصى مدة يبقى فيها مستخدم غير نشط في الذاكرة
+VERSION_CHECK_SECONDS = 30
+IDLE_EVICT_SECONDS = 1800
+# المدة بين جولتين لخيط الإخلاء الخلفي، فيُخلى المستخدم غير النشط حتى دون طلبات جديدة
+EVICT_CHECK_SECONDS = 60
+
+# وضع اختياري (عند ضبط هذا المتغير إلى 1): مستمعات Firestore تُبقي نسخة كل مساحة عمل نشطة محدثة في الذاكرة
+LIVE_UPDATES_ENV = "READING_MARATHON_LIVE_UPDATES"
+# أقصى انتظار لوصول اللقطة الأولى من المستمعات، ولوصول تعديل إليها بعد invalidate
+LIVE_SYNC_TIMEOUT_SECONDS = 10
+# أقصى انتظار لمستمع مجموعة تغيّر إصدارها قبل قراءتها مباشرة مرة واحدة بدلاً منه
+LIVE_FRESHNESS_WAIT_SECONDS = 2
+# أقصى عدد لمساحات العمل المتصلة بمستمعات في الوقت نفسه؛ يُفصل الأقدم استخداماً عند تجاوزه
+MAX_LIVE_WORKSPACES = 50
+
+# حقول الإنجازات التي تعرضها الصفحات (تُقرأ وحدها بدلاً من المستندات كاملة)
+ACHIEVEMENT_FIELDS = ['member_id', 'period_id', 'achievement_type', 'achievement_date']
+
+# المجموعات الصغيرة التي تبقى في الذاكرة كما قُرئت، لإعادة بناء الأجزاء المعتمدة عليها دون قراءتها من جديد
+_RAW_COLLECTIONS = ('members', 'books', 'periods', 'member_stats')
+# المجموعات التي يستمع إليها الوضع الحي (السجلات الخام لا تُعرض إلا عبر الملخص اليومي)
+_LIVE_COLLECTIONS = _RAW_COLLECTIONS + ('daily_rollup', 'achievements')
+# المجموعات التي يُبنى منها كل جزء من مساحة العمل: يُعاد بناء الجزء فقط إذا تغيّرت إحداها
+_PART_COLLECTIONS = {
+    'members': ('members',),
+    'periods': ('periods', 'books'),
+    'logs': ('daily_rollup', 'logs', 'periods', 'books'),
+    'achievements': ('achievements',),
+    'member_stats': ('member_stats', 'members'),
+}
+
+def _changed_collections(data_versions: dict, previous_versions: dict):
+    return {name for name in db.VERSIONED_COLLECTIONS if data_versions.get(name) != previous_versions.get(name)}
+
+def _stale_parts(changed: set):
+    return {part for part, collections in _PART_COLLECTIONS.items() if changed.intersection(collections)}
+
+def _build_parts(user_id: str, data_versions: dict, stale_parts: set, frames: dict, data: dict):
+    """
+    Returns a copy of the workspace `data` with its `stale_parts` rebuilt from the
+    collection `frames`: the raw members, books, periods and member_stats, plus
+    the daily rollup and the achievements when their parts are stale.
+    """
+    data = dict(data)
+    if 'members' in stale_parts:
+        data['members'] = frames['members']
+    if 'periods' in stale_parts:
+        data['periods'] = db.merge_periods_with_books(frames['periods'], frames['books'])
+    if 'logs' in stale_parts:
+        rollup_df = frames['daily_rollup']
+        if rollup_df.empty:
+            # لم يُكتب الملخص اليومي بعد: يُبنى من السجلات بعد معرفة التحديات، كما في main.load_daily_rollup
+            rollup_df = load_daily_rollup(user_id, data['periods'].to_dict('records'), data_versions)
+        data['logs'] = db.compact_logs_frame(rollup_df)
+    if 'achievements' in stale_parts:
+        data['achievements'] = db.compact_achievements_frame(frames['achievements'])
+    if 'member_stats' in stale_parts:
+        member_stats_df, members_df = frames['member_stats'], frames['members']
+        if not member_stats_df.empty and not members_df.empty:
+            member_stats_df = member_stats_df.rename(columns={'member_stats_id': 'members_id'})
+            member_stats_df = pd.merge(member_stats_df, members_df[['members_id', 'name']], on='members_id', how='left')
+        data['member_stats'] = member_stats_df
+    data['data_versions'] = data_versions
+    return data
+
+def _load_workspace(user_id: str, data_versions: dict, previous: dict = None):
+    """
+    Reads everything the pages display for one workspace. Given the `previous`
+    load, only the parts built from collections whose version changed are
+    re-read; the rest are reused as they are. The reads run concurrently.
+    """
+    changed = _changed_collections(data_versions, previous['data_versions']) if previous else set(db.VERSIONED_COLLECTIONS)
+    stale_parts = _stale_parts(changed)
+
+    reads = {
+        name: lambda name=name: db.get_subcollection_as_df(user_id, name, data_versions.get(name))
+        for name in _RAW_COLLECTIONS if name in changed
+    }
+    if 'logs' in stale_parts:
+        reads['daily_rollup'] = lambda: db.get_daily_rollup_df(user_id, data_versions.get('daily_rollup'))
+    if 'achievements' in stale_parts:
+        reads['achievements'] = lambda: db.get_subcollection_as_df(user_id, 'achievements', data_versions.get('achievements'), fields=ACHIEVEMENT_FIELDS)
+    frames = db.fetch_concurrently(reads)
+    raw = {**(previous['raw'] if previous else {}), **{name: frames[name] for name in _RAW_COLLECTIONS if name in frames}}
+
+    data = _build_parts(user_id, data_versions, stale_parts, {**frames, **raw}, previous['data'] if previous else {})
+    return {'data_versions': data_versions, 'raw': raw, 'data': data}
+
+def _frame_from_docs(collection_name: str, docs: dict):
+    if collection_name == 'daily_rollup':
+        # أيام كل شهر (أو كل جزء منه) مخزنة كأعمدة في مستند واحد، كما في db.get_daily_rollup_df
+        months = [pd.DataFrame(docs[doc_id]) for doc_id in sorted(docs, key=db.rollup_doc_order)]
+        return pd.concat(months, ignore_index=True) if months else pd.DataFrame()
+    return pd.DataFrame([{**doc_data, f'{collection_name}_id': doc_id} for doc_id, doc_data in sorted(docs.items())])
+
+class WorkspaceListener:
+    """
+    Keeps one workspace's data current from Firestore `on_snapshot` listeners,
+    for the live-updates mode of `WorkspaceCache`.
+
+    Each listener holds its collection's documents in memory. A change updates
+    those documents, rebuilds that collection's frame and then only the parts
+    of the workspace built from it, so after the first snapshot pages read the
+    workspace without any Firestore reads.
+
+    A collection is known to be current once its listener delivered a snapshot
+    read at or after the commit of the version bump that last changed it.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.data = None
+        self._docs = {name: {} for name in _LIVE_COLLECTIONS}
+        self._frames = {}
+        self._data_versions = None
+        # وقت آخر لقطة وصلت لكل مجموعة، ووقت الزيادة التي غيّرت إصدارها آخر مرة
+        self._read_times = {}
+        self._commit_times = {}
+        # المستمعات التي لم تصل لقطتها الأولى بعد
+        self._pending = set(_LIVE_COLLECTIONS) | {'versions'}
+        self._condition = threading.Condition()
+        self._watches = [db.watch_data_versions(user_id, self._on_versions)]
+        for collection_name in _LIVE_COLLECTIONS:
+            self._watches.append(db.watch_subcollection(
+                user_id, collection_name,
+                lambda changes, read_time, collection_name=collection_name: self._on_changes(collection_name, changes, read_time),
+            ))
+
+    def _on_changes(self, collection_name: str, changes: list, read_time):
+        with self._condition:
+            last_read_time = self._read_times.get(collection_name)
+            if last_read_time is not None and read_time is not None and read_time < last_read_time:
+                # تعديلات سبقت قراءة مباشرة لهذه المجموعة (_refresh) وهي متضمنة فيها
+                return
+            docs = self._docs[collection_name]
+            for change_type, doc_id, doc_data in changes:
+                if change_type == 'REMOVED':
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = doc_data
+            self._frames[collection_name] = _frame_from_docs(collection_name, docs)
+            self._read_times[collection_name] = read_time
+            self._pending.discard(collection_name)
+            self._rebuild({collection_name})
+
+    def _on_versions(self, data_versions: dict, commit_time):
+        with self._condition:
+            for collection_name in _LIVE_COLLECTIONS:
+                if self._data_versions is None or data_versions.get(collection_name) != self._data_versions.get(collection_name):
+                    self._commit_times[collection_name] = commit_time
+            self._data_versions = data_versions
+            self._pending.discard('versions')
+            self._rebuild(set())
+
+    def _behind_collections(self):
+        # المجموعات التي تغيّر إصدارها ولم تصل من مستمعها لقطة مقروءة بعد ذلك التغيير
+        return [
+            collection_name for collection_name in _LIVE_COLLECTIONS
+            if self._commit_times.get(collection_name) is not None
+            and (self._read_times.get(collection_name) is None or self._read_times[collection_name] < self._commit_times[collection_name])
+        ]
+
+    def _refresh(self, collection_names: list):
+        """
+        Re-reads collections whose listener has not caught up, once and directly,
+        and replaces their documents with the result.
+        """
+        with self._condition:
+            commit_times = {collection_name: self._commit_times[collection_name] for collection_name in collection_names}
+        docs = db.fetch_concurrently({
+            collection_name: lambda collection_name=collection_name: db.get_subcollection_documents(self.user_id, collection_name)
+            for collection_name in collection_names
+        })
+        with self._condition:
+            for collection_name, collection_docs in docs.items():
+                self._docs[collection_name] = collection_docs
+                self._frames[collection_name] = _frame_from_docs(collection_name, collection_docs)
+                # القراءة بدأت بعد الزيادة، فهي تعكس المجموعة عند وقتها على الأقل
+                self._read_times[collection_name] = max(self._read_times.get(collection_name) or commit_times[collection_name], commit_times[collection_name])
+            self._rebuild(set(docs))
+
+    def _rebuild(self, changed: set):
+        if self._pending:
+            return
+        stale_parts = set(_PART_COLLECTIONS) if self.data is None else _stale_parts(changed)
+        self.data = _build_parts(self.user_id, self._data_versions, stale_parts, self._frames, self.data or {})
+        self._condition.notify_all()
+
+    def wait_ready(self, timeout: float):
+        """
+        Waits for the first snapshot of every listener; returns False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.data is not None, timeout)
+
+    def wait_for_versions(self, data_versions: dict, timeout: float):
+        """
+        Waits until the listeners have received the given collection versions
+        (as returned by `db.get_data_versions` after a write); returns False on timeout.
+
+        Receiving the versions alone does not mean the collections they changed
+        were delivered too, so it then waits up to `LIVE_FRESHNESS_WAIT_SECONDS`
+        for each changed collection's listener to deliver a snapshot read at or
+        after the version bump, and re-reads the collections still behind once.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.data is not None and self.data['data_versions'] == data_versions, timeout):
+                return False
+            if self._condition.wait_for(lambda: not self._behind_collections(), LIVE_FRESHNESS_WAIT_SECONDS):
+                return True
+            behind = self._behind_collections()
+        self._refresh(behind)
+        return True
+
+    def close(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+
+class WorkspaceCache:
+    """
+    Process-wide cache of loaded workspaces: one in-memory copy per user, shared
+    by every page and session, tagged with the collection versions it was loaded at.
+
+    The user's collection versions (`db.get_data_versions`) are checked at most
+    every `VERSION_CHECK_SECONDS`; when some changed, only the parts built from
+    those collections are reloaded (a member toggle re-reads the members alone).
+    `invalidate` drops the whole entry for that user; other users' entries are
+    never touched.
+
+    With `live_updates`, each active user's workspace is instead kept current by
+    a `WorkspaceListener`, and `invalidate` waits for the listeners to receive
+    the change. A listener that cannot deliver its first snapshot in time falls
+    back to the polled copy. At most `MAX_LIVE_WORKSPACES` workspaces keep
+    listeners; attaching another evicts the least recently used one.
+
+    Users idle for `IDLE_EVICT_SECONDS` are evicted in both modes, which
+    detaches their listeners, by a daemon thread that checks every
+    `EVICT_CHECK_SECONDS`, so an idle process releases them too.
+    """
+
+    def __init__(self, live_updates: bool = False):
+        self.live_updates = live_updates
+        self._entries = {}
+        self._user_locks = {}
+        # يزداد مع كل invalidate، حتى لا يُحفظ تحميل بدأ قبل التعديل
+        self._generations = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._evict_idle_forever, name='workspace-cache-evict', daemon=True).start()
+
+    def _user_lock(self, user_id: str):
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    def _evict(self, user_ids: list):
+        with self._lock:
+            evicted = [self._entries.pop(user_id) for user_id in user_ids if user_id in self._entries]
+        for entry in evicted:
+            if 'listener' in entry:
+                entry['listener'].close()
+
+    def _evict_idle(self, now: float):
+        with self._lock:
+            idle_users = [user_id for user_id, entry in self._entries.items() if now - entry['used_at'] > IDLE_EVICT_SECONDS]
+        self._evict(idle_users)
+
+    def _evict_idle_forever(self):
+        while True:
+            time.sleep(EVICT_CHECK_SECONDS)
+            self._evict_idle(time.monotonic())
+
+    def _make_room_for_listener(self):
+        with self._lock:
+            live_users = sorted(
+                (entry['used_at'], user_id) for user_id, entry in self._entries.items() if 'listener' in entry
+            )
+        self._evict([user_id for _, user_id in live_users[:max(0, len(live_users) - MAX_LIVE_WORKSPACES + 1)]])
+
+    def get(self, user_id: str):
+        now = time.monotonic()
+        self._evict_idle(now)
+        # قفل لكل مستخدم حتى لا تحمّل عدة جلسات نفس مساحة العمل في الوقت نفسه
+        with self._user_lock(user_id):
+            with self._lock:
+                entry = self._entries.get(user_id)
+                generation = self._generations.get(user_id, 0)
+            if entry is None and self.live_updates:
+                self._make_room_for_listener()
+                listener = WorkspaceListener(user_id)
+                if listener.wait_ready(LIVE_SYNC_TIMEOUT_SECONDS):
+                    entry = {'listener': listener, 'used_at': now}
+                    with self._lock:
+                        self._entries[user_id] = entry
+                else:
+                    listener.close()
+            if entry is not None and 'listener' in entry:
+                entry['used_at'] = now
+                return entry['listener'].data
+
+            if entry is None or now - entry['checked_at'] >= VERSION_CHECK_SECONDS:
+                data_versions = db.get_data_versions(user_id)
+                if entry is None or _changed_collections(data_versions, entry['data_versions']):
+                    entry = {**_load_workspace(user_id, data_versions, entry), 'used_at': now}
+                    with self._lock:
+                        if self._generations.get(user_id, 0) == generation:
+                            self._entries[user_id] = entry
+                entry['checked_at'] = now
+            entry['used_at'] = now
+            return entry['data']
+
+    def invalidate(self, user_id: str, remove_snapshots: bool = False):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        # المستمعات تستقبل التعديل بنفسها: يكفي انتظار وصوله بدلاً من إعادة تحميل مساحة العمل
+        if entry is not None and 'listener' in entry and not remove_snapshots:
+            if entry['listener'].wait_for_versions(db.get_data_versions(user_id), LIVE_SYNC_TIMEOUT_SECONDS):
+                return
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        if entry is not None and 'listener' in entry:
+            entry['listener'].close()
+        if remove_snapshots:
+            snapshot_cache.remove_workspace(user_id)
+
+@st.cache_resource
+def _workspace_cache():
+    return WorkspaceCache(live_updates=os.environ.get(LIVE_UPDATES_ENV) == "1")
+
+def get_workspace(user_id: str):
+    """
+    Returns the user's workspace data, loading it only when the cached copy is stale.
+
+    Returns:
+        dict: 'data_versions' and the 'members', 'periods' (merged with their books),
+            'logs' (the compact daily rollup), 'achievements' (compact) and 'member_stats'
+            (with member names) DataFrames. The frames are shallow copies of the shared
+            copy: pages may add or rename columns but must not edit values in place.
+    """
+    workspace = _workspace_cache().get(user_id)
+    return {key: value.copy(deep=False) if isinstance(value, pd.DataFrame) else value for key, value in workspace.items()}
+
+def invalidate(user_id: str, remove_snapshots: bool = False):
+    """
+    Makes the user's next read reflect a change just written, leaving other users'
+    caches intact: drops the cached workspace or, in live-updates mode, waits for
+    the listeners to receive the change.
+
+    With `remove_snapshots` (e.g. after the workspace is deleted) the cached
+    workspace is always dropped, its listeners detached and its local Arrow
+    snapshots removed.
+    """
+    _workspace_cache().invalidate(user_id, remove_snapshots)
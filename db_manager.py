@@ -1,10 +1,17 @@
+import time
+import uuid
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
 from firebase_config import db # استيراد عميل قاعدة البيانات المهيأ
+import snapshot_cache
 
 # --- بنية قاعدة البيانات في Firestore ---
 # users (collection)
 #  └── {user_id} (document) - يمثل مساحة عمل كل مشرف
 #      ├── settings (document) - يحتوي على إعدادات المشرف مثل رابط الشيت و refresh_token
+#      │    └── versions (document) - عداد إصدار لكل مجموعة توسم به اللقطات المحلية (snapshot_cache.py)
 #      ├── global_rules (document) - يحتوي على نظام النقاط الافتراضي للمشرف
 #      │
 #      ├── members (subcollection)
@@ -22,8 +29,14 @@ from firebase_config import db # استيراد عميل قاعدة البيان
 #      ├── achievements (subcollection)
 #      │    └── {achievement_id} (document)
 #      │
-#      └── member_stats (subcollection)
-#           └── {member_id} (document)
+#      ├── member_stats (subcollection)
+#      │    └── {member_id} (document)
+#      │
+#      ├── daily_rollup (subcollection) - ملخص يومي لكل عضو يُكتب عند المزامنة
+#      │    └── {YYYY-MM} أو {YYYY-MM-pN} (document) - أيام الشهر مخزنة كأعمدة (قوائم متوازية)، مقسّمة إلى أجزاء إن تجاوزت حد حجم المستند
+#      │
+#      └── challenge_snapshots (subcollection) - لقطة تحليلات كل تحدي تُكتب عند المزامنة
+#           └── {period_id} (document)
 # -------------------------------------------------
 
 
@@ -76,6 +89,15 @@ def create_new_user_workspace(user_id: str, user_email: str):
         'attend_discussion_points': 25
     })
 
+    _versions_ref(user_id).set({'workspace_epoch': uuid.uuid4().hex})
+
+def list_user_ids():
+    """
+    يعيد معرّفات جميع مساحات العمل (المشرفين) المسجلة في Firestore.
+    """
+    # list_documents يشمل المستندات التي لها مجموعات فرعية فقط دون قراءة محتواها
+    return [doc_ref.id for doc_ref in db.collection('users').list_documents()]
+
 # --- دوال الإعدادات الخاصة بكل مستخدم ---
 
 def set_user_setting(user_id: str, key: str, value: str):
@@ -93,6 +115,61 @@ def get_user_settings(user_id: str):
     doc = settings_ref.get()
     return doc.to_dict() if doc.exists else {}
 
+def save_sync_state(user_id: str, sync_state: dict):
+    """
+    يحفظ علامة آخر مزامنة ناجحة (عدد الصفوف وآخر Timestamp وبصمات البيانات) في مستند الإعدادات.
+    """
+    settings_ref = db.collection('users').document(user_id).collection('settings').document('config')
+    settings_ref.update({'sync_state': sync_state})
+
+# المجموعات التي يُسجَّل لكل منها عداد إصدار مستقل في settings/versions
+VERSIONED_COLLECTIONS = ('members', 'books', 'periods', 'logs', 'achievements', 'member_stats', 'daily_rollup', 'challenge_snapshots')
+
+def _versions_ref(user_id: str):
+    return db.collection('users').document(user_id).collection('settings').document('versions')
+
+def get_data_versions(user_id: str):
+    """
+    يعيد إصدار كل مجموعة في مساحة العمل، ويتغير إصدار المجموعة بعد كل تعديل عليها فقط.
+
+    Returns:
+        dict: {اسم المجموعة: الإصدار}.
+    """
+    doc = _versions_ref(user_id).get()
+    versions = doc.to_dict() if doc.exists else {}
+    missing = [name for name in VERSIONED_COLLECTIONS if name not in versions]
+    if missing:
+        # مساحة عمل سابقة لعدادات الإصدار: تبدأ عداداتها من الصفر (Increment(0) لا يغيّر عداداً زاده كاتب في الأثناء)
+        _versions_ref(user_id).set({name: firestore.Increment(0) for name in missing}, merge=True)
+        versions.update({name: 0 for name in missing})
+    return _version_tags(versions)
+
+def _version_tags(versions: dict):
+    # معرّف المساحة يميّز عدادات مساحة عمل حُذفت ثم أُعيد إنشاؤها عن عدادات سابقتها
+    workspace_epoch = versions.get('workspace_epoch', '')
+    return {name: f"{workspace_epoch}-{versions.get(name, 0)}" for name in VERSIONED_COLLECTIONS}
+
+def watch_data_versions(user_id: str, on_change):
+    """
+    يرفق مستمع on_snapshot بمستند الإصدارات: تُستدعى on_change(data_versions, commit_time) بالإصدارات
+    الحالية أول مرة ثم بعد كل تغيير، بنفس صيغة get_data_versions. commit_time هو وقت آخر كتابة
+    على مستند الإصدارات (update_time)، أي وقت آخر زيادة للعدادات، أو None إن لم يوجد المستند.
+
+    Returns:
+        Watch: المستمع، ويُفصل بـ unsubscribe().
+    """
+    def callback(doc_snapshots, changes, read_time):
+        for doc in doc_snapshots:
+            on_change(_version_tags(doc.to_dict() or {}), doc.update_time if doc.exists else None)
+    return _versions_ref(user_id).on_snapshot(callback)
+
+def bump_data_versions(user_id: str, collection_names: list):
+    """
+    يزيد عداد إصدار المجموعات المحددة بعد اكتمال تعديلها، فتصبح لقطاتها المحلية قديمة
+    دون المساس بلقطات بقية المجموعات.
+    """
+    _versions_ref(user_id).set({name: firestore.Increment(1) for name in collection_names}, merge=True)
+
 def load_user_global_rules(user_id: str):
     """
     يقوم بتحميل نظام النقاط الافتراضي للمستخدم المحدد.
@@ -111,51 +188,321 @@ def update_user_global_rules(user_id: str, settings_dict: dict):
 
 # --- دوال القراءة (Read Functions) ---
 
-def get_subcollection_as_df(user_id: str, collection_name: str):
+# عدد المستندات في كل صفحة عند قراءة مجموعة فرعية، وأخطاء Firestore العابرة التي تُستأنف بعدها القراءة
+READ_PAGE_SIZE = 1000
+TRANSIENT_READ_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.Aborted,
+)
+
+def _stream_in_pages(query, page_size: int = READ_PAGE_SIZE, max_retries: int = 3):
+    """
+    يمر على مستندات استعلام مستنداً مستنداً، مقروءة صفحةً صفحة بترتيب معرّف المستند (order_by / start_after).
+    عند خطأ عابر تُستأنف القراءة من آخر مستند وصل، ويُرفع الخطأ بعد max_retries محاولة متتالية دون تقدم.
+    """
+    query = query.order_by(firestore.FieldPath.document_id())
+    last_doc = None
+    retries = 0
+    while True:
+        page_query = query.limit(page_size) if last_doc is None else query.start_after(last_doc).limit(page_size)
+        received = 0
+        try:
+            for doc in page_query.stream():
+                received += 1
+                last_doc = doc
+                yield doc
+        except TRANSIENT_READ_ERRORS:
+            retries = 0 if received else retries + 1
+            if retries > max_retries:
+                raise
+            time.sleep(0.5 * 2 ** retries)
+            continue
+
+        retries = 0
+        if received < page_size:
+            return
+
+def iter_subcollection_chunks(user_id: str, collection_name: str, fields: list = None, page_size: int = READ_PAGE_SIZE, max_retries: int = 3):
+    """
+    يقرأ مجموعة فرعية صفحةً صفحة بترتيب معرّف المستند (order_by / start_after)، ويعيد كل صفحة
+    كـ DataFrame بأعمدة تُبنى مستنداً بمستند، فلا تُحمَّل المجموعة كلها في الذاكرة كقائمة قواميس.
+
+    عند خطأ عابر تُستأنف القراءة من آخر مستند وصل، بدلاً من إعادة قراءة المجموعة من بدايتها.
+
+    Args:
+        fields (list): الحقول المطلوبة فقط (إسقاط select)، كما في get_subcollection_as_df.
+        page_size (int): عدد المستندات في كل صفحة (وفي كل جزء يُعاد).
+        max_retries (int): عدد المحاولات المتتالية دون تقدم قبل رفع الخطأ.
+
+    Yields:
+        pd.DataFrame: جزء من المجموعة مع عمود معرّف المستند '{collection_name}_id'.
+    """
+    id_column = f'{collection_name}_id'
+    query = db.collection('users').document(user_id).collection(collection_name)
+    if fields is not None:
+        query = query.select(fields)
+
+    columns, row_count = {}, 0
+    for doc in _stream_in_pages(query, page_size, max_retries):
+        doc_data = doc.to_dict()
+        doc_data[id_column] = doc.id
+        for key in doc_data:
+            if key not in columns:
+                columns[key] = [None] * row_count
+        for key, values in columns.items():
+            values.append(doc_data.get(key))
+        row_count += 1
+        if row_count == page_size:
+            yield pd.DataFrame(columns)
+            columns, row_count = {}, 0
+    if row_count:
+        yield pd.DataFrame(columns)
+
+def get_subcollection_as_df(user_id: str, collection_name: str, data_version: str = None, fields: list = None):
     """
     يجلب مجموعة فرعية كاملة للمستخدم المحدد ويعيدها كـ Pandas DataFrame.
+
+    Args:
+        data_version (str): إصدار المجموعة الحالي (من get_data_versions). عند تمريره تُقرأ المجموعة من
+            اللقطة المحلية إن كانت لنفس الإصدار، وإلا تُقرأ من Firestore وتُحفظ لقطتها.
+        fields (list): الحقول المطلوبة فقط (إسقاط select في Firestore)، فلا تُنقل بقية حقول المستندات.
+            يُضاف عمود معرّف المستند دائماً.
+    """
+    id_column = f'{collection_name}_id'
+    if fields is None:
+        cached_df = snapshot_cache.read_frame(user_id, collection_name, data_version)
+    else:
+        # اللقطة الكاملة للمجموعة تكفي لأي إسقاط، وإلا فلقطة هذا الإسقاط نفسه
+        cached_df = snapshot_cache.read_frame(user_id, collection_name, data_version, [*fields, id_column])
+        if cached_df is None:
+            cached_df = snapshot_cache.read_frame(user_id, snapshot_cache.projection_name(collection_name, fields), data_version)
+    if cached_df is not None:
+        return cached_df
+
+    chunks = list(iter_subcollection_chunks(user_id, collection_name, fields))
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    cache_name = collection_name if fields is None else snapshot_cache.projection_name(collection_name, fields)
+    snapshot_cache.write_frames(user_id, data_version, {cache_name: df})
+    return df
+
+def get_documents(user_id: str, collection_name: str, doc_ids: list):
+    """
+    يجلب مستندات محددة بمعرّفاتها من مجموعة فرعية في طلب واحد، بدلاً من قراءة المجموعة كاملة.
+
+    Returns:
+        dict: {معرّف المستند: بياناته} للمستندات الموجودة فقط.
     """
-    collection_ref = db.collection('users').document(user_id).collection(collection_name)
-    docs = collection_ref.stream()
-    data = []
-    for doc in docs:
-        doc_data = doc.to_dict()
-        doc_data[f'{collection_name}_id'] = doc.id # إضافة معرّف المستند
-        data.append(doc_data)
-    return pd.DataFrame(data)
+    coll_ref = db.collection('users').document(user_id).collection(collection_name)
+    doc_refs = [coll_ref.document(doc_id) for doc_id in doc_ids]
+    if not doc_refs:
+        return {}
+    return {doc.id: doc.to_dict() for doc in db.get_all(doc_refs) if doc.exists}
 
-def get_all_data_for_stats(user_id: str):
+def get_subcollection_documents(user_id: str, collection_name: str):
     """
-    يجلب جميع البيانات اللازمة لمحرك الحسابات لمستخدم معين.
+    يقرأ مستندات مجموعة فرعية كاملة مرة واحدة (صفحةً صفحة كما في iter_subcollection_chunks).
+
+    Returns:
+        dict: {معرّف المستند: بياناته}.
     """
-    members_df = get_subcollection_as_df(user_id, 'members')
-    logs_df = get_subcollection_as_df(user_id, 'logs')
-    achievements_df = get_subcollection_as_df(user_id, 'achievements')
-    periods_df = get_subcollection_as_df(user_id, 'periods')
-    books_df = get_subcollection_as_df(user_id, 'books')
+    query = db.collection('users').document(user_id).collection(collection_name)
+    return {doc.id: doc.to_dict() for doc in _stream_in_pages(query)}
+
+# أقصى عدد قيم يقبله عامل 'in' في استعلام Firestore واحد
+MAX_IN_QUERY_VALUES = 30
+
+def get_documents_where_in(user_id: str, collection_name: str, field: str, values):
+    """
+    يجلب مستندات مجموعة فرعية تساوي قيمة حقلها field إحدى القيم values، باستعلامات 'in'
+    (MAX_IN_QUERY_VALUES قيمة لكل استعلام) تُنفذ في الوقت نفسه، بدلاً من قراءة المجموعة كاملة.
+
+    Returns:
+        list: المستندات كقواميس مع معرّف المستند '{collection_name}_id'، كما في get_all_data_for_stats.
+    """
+    coll_ref = db.collection('users').document(user_id).collection(collection_name)
+    values = sorted(set(values))
+    chunks = [values[i:i + MAX_IN_QUERY_VALUES] for i in range(0, len(values), MAX_IN_QUERY_VALUES)]
+    results = fetch_concurrently({
+        i: lambda chunk=chunk: [
+            {**doc.to_dict(), f'{collection_name}_id': doc.id}
+            for doc in _stream_in_pages(coll_ref.where(field, 'in', chunk))
+        ]
+        for i, chunk in enumerate(chunks)
+    })
+    return [doc for i in range(len(chunks)) for doc in results[i]]
+
+def watch_subcollection(user_id: str, collection_name: str, on_change):
+    """
+    يرفق مستمع on_snapshot بمجموعة فرعية: تُستدعى on_change(changes, read_time) بجميع المستندات أول مرة،
+    ثم بالمستندات التي تغيّرت فقط بعد كل تعديل.
+
+    Args:
+        on_change: دالة تستقبل قائمة (نوع التغيير 'ADDED' أو 'MODIFIED' أو 'REMOVED'، معرّف المستند،
+            بياناته أو None عند الحذف)، ووقت القراءة الذي تعكس المجموعة حالتها عنده.
+            تُستدعى من خيط المستمع وليس من خيط الصفحة.
+
+    Returns:
+        Watch: المستمع، ويُفصل بـ unsubscribe().
+    """
+    def callback(doc_snapshots, changes, read_time):
+        on_change([
+            (change.type.name, change.document.id, None if change.type.name == 'REMOVED' else change.document.to_dict())
+            for change in changes
+        ], read_time)
+    return db.collection('users').document(user_id).collection(collection_name).on_snapshot(callback)
+
+def merge_periods_with_books(periods_df: pd.DataFrame, books_df: pd.DataFrame):
+    """
+    يدمج بيانات الكتاب المشترك (book_title, book_author, book_year) مع كل تحدي.
+    """
+    if periods_df.empty or books_df.empty:
+        return periods_df
+    # إعادة تسمية الأعمدة لتجنب التضارب
+    books_df = books_df.rename(columns={'title': 'book_title', 'author': 'book_author', 'publication_year': 'book_year'})
+    return pd.merge(periods_df, books_df, left_on='common_book_id', right_on='books_id', how='left')
+
+def fetch_concurrently(reads: dict, max_workers: int = 8):
+    """
+    ينفذ عدة قراءات مستقلة في الوقت نفسه وينتظر اكتمالها جميعاً، فيقترب زمن الانتظار من
+    زمن أبطأ قراءة بدلاً من مجموع أزمنتها. أي استثناء في إحدى القراءات يُرفع كما هو.
+
+    Args:
+        reads (dict): {اسم: دالة بلا وسائط تنفذ القراءة}.
+
+    Returns:
+        dict: {اسم: نتيجة القراءة}.
+    """
+    if len(reads) <= 1:
+        return {name: read() for name, read in reads.items()}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(reads))) as executor:
+        futures = {name: executor.submit(read) for name, read in reads.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+def get_sync_config(user_id: str, data_versions: dict = None):
+    """
+    يجلب الأعضاء والتحديات (مدمجة مع بيانات كتبها) فقط، دون السجلات والإنجازات.
+    """
+    data_versions = data_versions or {}
+    frames = fetch_concurrently({
+        name: lambda name=name: get_subcollection_as_df(user_id, name, data_versions.get(name))
+        for name in ['members', 'periods', 'books']
+    })
+    periods_df = merge_periods_with_books(frames['periods'], frames['books'])
 
-    # دمج بيانات الكتب مع التحديات
-    if not periods_df.empty and not books_df.empty:
-        # إعادة تسمية الأعمدة لتجنب التضارب
-        books_df.rename(columns={'title': 'book_title', 'author': 'book_author', 'publication_year': 'book_year'}, inplace=True)
-        periods_df = pd.merge(periods_df, books_df, left_on='common_book_id', right_on='books_id', how='left')
-    
     return {
-        "members": members_df.to_dict('records'),
-        "logs": logs_df.to_dict('records'),
-        "achievements": achievements_df.to_dict('records'),
+        "members": frames['members'].to_dict('records'),
         "periods": periods_df.to_dict('records')
     }
 
-def has_achievement(user_id: str, member_id: str, achievement_type: str, period_id: str):
+def get_all_data_for_stats(user_id: str, config: dict = None):
     """
-    يتحقق مما إذا كان لدى العضو إنجاز معين في تحدي معين.
+    يجلب جميع البيانات اللازمة لمحرك الحسابات لمستخدم معين، بقراءة مجموعاته في الوقت نفسه.
+
+    Args:
+        config (dict): نتيجة get_sync_config إن كانت قد جُلبت مسبقاً، لتجنب قراءتها مرة أخرى.
+    """
+    reads = {name: lambda name=name: get_subcollection_as_df(user_id, name) for name in ['logs', 'achievements']}
+    if config is None:
+        reads.update({name: lambda name=name: get_subcollection_as_df(user_id, name) for name in ['members', 'periods', 'books']})
+    frames = fetch_concurrently(reads)
+    if config is None:
+        config = {
+            "members": frames['members'].to_dict('records'),
+            "periods": merge_periods_with_books(frames['periods'], frames['books']).to_dict('records'),
+        }
+
+    return {
+        "members": config["members"],
+        "logs": frames['logs'].to_dict('records'),
+        "achievements": frames['achievements'].to_dict('records'),
+        "periods": config["periods"]
+    }
+
+# --- المخطط المضغوط لبيانات النشاط (Compact Activity Schema) ---
+
+# أعمدة العدّ (دقائق، أعلام اقتباسات، عدد السجلات) تُخزن كأصغر نوع عددي بلا إشارة يتسع لقيمها،
+# وأعمدة النقاط كأصغر نوع عددي بإشارة
+LOG_COUNT_COLUMNS = ['logs_count', 'common_book_minutes', 'other_book_minutes', 'submitted_common_quote', 'submitted_other_quote']
+LOG_POINTS_COLUMNS = ['common_reading_points', 'other_reading_points', 'common_quote_points', 'other_quote_points']
+
+def _compact_ints(values: pd.Series, downcast: str):
+    return pd.to_numeric(pd.to_numeric(values, errors='coerce').fillna(0).astype('int64'), downcast=downcast)
+
+def compact_logs_frame(logs_df: pd.DataFrame):
+    """
+    يحوّل السجلات (أو الملخص اليومي) إلى مخطط ثابت مضغوط: member_id كفئة (category)،
+    submission_date_dt كتاريخ datetime64[s]، والأعمدة العددية كأصغر نوع يتسع لقيمها،
+    مع حساب العمودين المشتقين total_minutes و total_quotes_submitted مرة واحدة.
+
+    Args:
+        logs_df (pd.DataFrame): الملخص اليومي (عمود 'date' بصيغة YYYY-MM-DD) أو السجلات الخام
+            (عمود 'submission_date' بصيغة DD/MM/YYYY).
+    """
+    if logs_df.empty:
+        return pd.DataFrame()
+
+    if 'date' in logs_df.columns:
+        dates = pd.to_datetime(logs_df['date'], format='%Y-%m-%d', errors='coerce')
+    else:
+        dates = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce')
+
+    compact = pd.DataFrame({
+        'member_id': logs_df['member_id'].astype('category'),
+        'submission_date_dt': dates.astype('datetime64[s]'),
+    })
+    for col in LOG_COUNT_COLUMNS:
+        if col in logs_df.columns:
+            compact[col] = _compact_ints(logs_df[col], 'unsigned')
+    for col in LOG_POINTS_COLUMNS:
+        if col in logs_df.columns:
+            compact[col] = _compact_ints(logs_df[col], 'integer')
+
+    # تُجمع بنوع أوسع قبل الضغط حتى لا يفيض مجموع عمودين من نوع صغير
+    compact['total_minutes'] = pd.to_numeric(compact['common_book_minutes'].astype('int64') + compact['other_book_minutes'].astype('int64'), downcast='unsigned')
+    compact['total_quotes_submitted'] = pd.to_numeric(compact['submitted_common_quote'].astype('int64') + compact['submitted_other_quote'].astype('int64'), downcast='unsigned')
+    return compact
+
+def compact_achievements_frame(achievements_df: pd.DataFrame):
+    """
+    يحوّل الإنجازات إلى مخطط ثابت مضغوط: member_id و period_id و achievement_type كفئات،
+    و achievement_date_dt كتاريخ datetime64[s].
+    """
+    if achievements_df.empty:
+        return pd.DataFrame()
+
+    compact = pd.DataFrame({
+        col: achievements_df[col].astype('category')
+        for col in ['achievements_id', 'member_id', 'period_id', 'achievement_type', 'book_id'] if col in achievements_df.columns
+    })
+    compact['achievement_date'] = achievements_df['achievement_date'].astype('category')
+    compact['achievement_date_dt'] = pd.to_datetime(achievements_df['achievement_date'], errors='coerce').astype('datetime64[s]')
+    return compact
+
+def memory_usage_report(frames: dict):
     """
-    achievements_ref = db.collection('users').document(user_id).collection('achievements')
-    query = achievements_ref.where('member_id', '==', member_id)\
-                            .where('achievement_type', '==', achievement_type)\
-                            .where('period_id', '==', period_id)
-    return len(query.get()) > 0
+    يقارن استهلاك الذاكرة لكل جدول قبل الضغط وبعده.
+
+    Args:
+        frames (dict): {اسم الجدول: (DataFrame كما قُرئ، DataFrame بالمخطط المضغوط)}.
+
+    Returns:
+        pd.DataFrame: عدد الصفوف والحجم بالميغابايت قبل الضغط وبعده ونسبة الحجم الجديد.
+    """
+    rows = []
+    for name, (loaded_df, compact_df) in frames.items():
+        loaded_bytes = loaded_df.memory_usage(deep=True).sum()
+        compact_bytes = compact_df.memory_usage(deep=True).sum()
+        rows.append({
+            'table': name,
+            'rows': len(loaded_df),
+            'loaded_mb': round(loaded_bytes / 2**20, 3),
+            'compact_mb': round(compact_bytes / 2**20, 3),
+            'ratio': round(compact_bytes / loaded_bytes, 3) if loaded_bytes else None,
+        })
+    return pd.DataFrame(rows)
 
 # --- دوال الكتابة والتحديث (Write/Update Functions) ---
 
@@ -166,6 +513,7 @@ def add_members(user_id: str, names_list: list):
     members_ref = db.collection('users').document(user_id).collection('members')
     for name in names_list:
         members_ref.add({'name': name, 'is_active': True})
+    bump_data_versions(user_id, ['members'])
 
 def set_member_status(user_id: str, member_id: str, is_active: bool):
     """
@@ -173,6 +521,7 @@ def set_member_status(user_id: str, member_id: str, is_active: bool):
     """
     member_ref = db.collection('users').document(user_id).collection('members').document(member_id)
     member_ref.update({'is_active': is_active})
+    bump_data_versions(user_id, ['members'])
     return True
 
 def add_book_and_challenge(user_id: str, book_info: dict, challenge_info: dict, rules_info: dict):
@@ -197,55 +546,364 @@ def add_book_and_challenge(user_id: str, book_info: dict, challenge_info: dict,
         # إضافة التحدي مع ربطه بمعرف الكتاب
         challenge_data = {**challenge_info, **rules_info, 'common_book_id': book_id}
         db.collection('users').document(user_id).collection('periods').add(challenge_data)
+        bump_data_versions(user_id, ['books', 'periods'])
         
         return True, "تمت إضافة التحدي بنجاح."
     except Exception as e:
         return False, f"خطأ في قاعدة البيانات: {e}"
 
-def add_log_and_achievements(user_id: str, log_data: dict, achievements_to_add: list):
+def _same_value(old, new):
+    """
+    يقارن قيمتين مع اعتبار None و NaN متساويتين (قد تظهر NaN بعد المرور عبر DataFrame).
+    """
+    old_missing = old is None or (isinstance(old, float) and pd.isna(old))
+    new_missing = new is None or (isinstance(new, float) and pd.isna(new))
+    if old_missing or new_missing:
+        return old_missing and new_missing
+    return old == new
+
+class BatchWriter:
+    """
+    خط كتابة مخزَّن مؤقتاً: يجمع عمليات الكتابة والحذف عبر عدة صفوف ويرسلها في دفعات
+    كاملة (500 عملية لكل دفعة) مع عدة دفعات قيد الإرسال في الوقت نفسه.
+
+    يُستخدم كـ context manager، وبعد الإغلاق يحتوي `written` و `failed` على عدد العمليات
+    التي نجحت أو فشلت، و `errors` على أخطاء الدفعات الفاشلة.
+    """
+    MAX_BATCH_SIZE = 500 # الحد الأقصى لعمليات الدفعة الواحدة في Firestore
+
+    def __init__(self, max_in_flight: int = 4):
+        self._ops = []
+        self._max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._pending = set()
+        self.written = 0
+        self.failed = 0
+        self.errors = []
+
+    def set(self, doc_ref, data: dict):
+        self._ops.append(('set', doc_ref, data))
+        if len(self._ops) >= self.MAX_BATCH_SIZE:
+            self._submit()
+
+    def delete(self, doc_ref):
+        self._ops.append(('delete', doc_ref, None))
+        if len(self._ops) >= self.MAX_BATCH_SIZE:
+            self._submit()
+
+    def _commit(self, ops):
+        batch = db.batch()
+        for op, doc_ref, data in ops:
+            if op == 'set':
+                batch.set(doc_ref, data)
+            else:
+                batch.delete(doc_ref)
+        try:
+            batch.commit()
+            return len(ops), 0, None
+        except Exception as e:
+            # الدفعة ذرّية: إما أن تنجح جميع عملياتها أو تفشل جميعها
+            return 0, len(ops), e
+
+    def _collect(self, futures):
+        for future in futures:
+            written, failed, error = future.result()
+            self.written += written
+            self.failed += failed
+            if error is not None:
+                self.errors.append(error)
+
+    def _submit(self):
+        ops, self._ops = self._ops, []
+        if not ops:
+            return
+        # عدم تجاوز الحد الأقصى للدفعات المتزامنة
+        while len(self._pending) >= self._max_in_flight:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+        self._pending.add(self._executor.submit(self._commit, ops))
+
+    def flush(self):
+        """
+        يرسل ما تبقى من العمليات وينتظر اكتمال جميع الدفعات.
+        """
+        self._submit()
+        done, _ = wait(self._pending)
+        self._pending = set()
+        self._collect(done)
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def changed_documents(documents: dict, existing: dict = None):
     """
-    يضيف سجل قراءة ومجموعة من الإنجازات دفعة واحدة.
+    يعيد من بين المستندات المطلوبة ما هو جديد أو تغيّر محتواه مقارنةً بالمستندات الحالية، دون أي كتابة.
+
+    Args:
+        documents (dict): {معرّف المستند: بياناته المطلوبة}.
+        existing (dict): {معرّف المستند: بياناته الحالية} كما قُرئت من قاعدة البيانات.
     """
-    logs_ref = db.collection('users').document(user_id).collection('logs')
-    achievements_ref = db.collection('users').document(user_id).collection('achievements')
-    
-    # استخدام batch لضمان تنفيذ جميع العمليات معًا أو فشلها معًا
-    batch = db.batch()
-    
-    # إضافة سجل القراءة
-    new_log_ref = logs_ref.document()
-    batch.set(new_log_ref, log_data)
-    
-    # إضافة الإنجازات
-    for ach_data in achievements_to_add:
-        new_ach_ref = achievements_ref.document()
-        batch.set(new_ach_ref, ach_data)
-        
-    batch.commit()
+    existing = existing or {}
+    return {
+        doc_id: data for doc_id, data in documents.items()
+        if doc_id not in existing or not all(_same_value(existing[doc_id].get(k), v) for k, v in data.items())
+    }
 
-def clear_subcollection(user_id: str, collection_name: str):
+def upsert_documents(user_id: str, collection_name: str, documents: dict, existing: dict = None, writer: BatchWriter = None):
     """
-    يمسح جميع المستندات من مجموعة فرعية معينة لمستخدم.
+    يكتب مجموعة من المستندات بمعرّفات ثابتة، متجاوزاً المستندات التي لم يتغير محتواها.
+
+    Args:
+        documents (dict): {معرّف المستند: بياناته}.
+        existing (dict): {معرّف المستند: بياناته الحالية} كما قُرئت من قاعدة البيانات.
+        writer (BatchWriter): خط كتابة مشترك اختياري؛ إن لم يُمرَّر تُرسل العمليات فوراً.
+
+    Returns:
+        int: عدد المستندات التي أُرسلت للكتابة.
     """
     coll_ref = db.collection('users').document(user_id).collection(collection_name)
-    docs = coll_ref.stream()
-    for doc in docs:
-        doc.reference.delete()
-    return True
+    to_write = list(changed_documents(documents, existing).items())
+    if writer is None:
+        with BatchWriter() as own_writer:
+            for doc_id, data in to_write:
+                own_writer.set(coll_ref.document(doc_id), data)
+    else:
+        for doc_id, data in to_write:
+            writer.set(coll_ref.document(doc_id), data)
+    return len(to_write)
+
+def delete_documents(user_id: str, collection_name: str, doc_ids: list, writer: BatchWriter = None):
+    """
+    يحذف مستندات محددة بمعرّفاتها من مجموعة فرعية لمستخدم.
+
+    Returns:
+        int: عدد المستندات التي أُرسلت للحذف.
+    """
+    coll_ref = db.collection('users').document(user_id).collection(collection_name)
+    doc_ids = list(doc_ids)
+    if writer is None:
+        with BatchWriter() as own_writer:
+            for doc_id in doc_ids:
+                own_writer.delete(coll_ref.document(doc_id))
+    else:
+        for doc_id in doc_ids:
+            writer.delete(coll_ref.document(doc_id))
+    return len(doc_ids)
+
+def bulk_delete(query, progress=None, page_size: int = BatchWriter.MAX_BATCH_SIZE, max_in_flight: int = 4):
+    """
+    يحذف جميع المستندات التي يعيدها استعلام (مجموعة كاملة أو استعلام where). تُقرأ مراجع المستندات
+    فقط (دون حقولها) صفحةً صفحة، وتُحذف في دفعات من 500 عملية مع عدة دفعات قيد الإرسال.
+
+    الحذف قابل للاستئناف: إن انقطع أو فشلت بعض دفعاته، فإعادة الاستدعاء تحذف ما تبقى فقط.
+
+    Args:
+        progress: دالة اختيارية تُستدعى بعدد المستندات المرسلة للحذف حتى الآن بعد كل صفحة.
+
+    Returns:
+        dict: عدد المستندات المحذوفة وعدد عمليات الحذف الفاشلة.
+    """
+    refs_query = query.select([firestore.FieldPath.document_id()])
+    sent = 0
+    with BatchWriter(max_in_flight=max_in_flight) as writer:
+        for doc in _stream_in_pages(refs_query, page_size):
+            writer.delete(doc.reference)
+            sent += 1
+            if progress is not None and sent % page_size == 0:
+                progress(sent)
+    if progress is not None and sent % page_size:
+        progress(sent)
+    return {'deleted': writer.written, 'failed': writer.failed}
 
 def rebuild_stats_tables(user_id: str, member_stats_data: list):
     """
-    يعيد بناء جدول إحصائيات الأعضاء.
+    يعيد بناء جدول إحصائيات الأعضاء بمقارنته بالإحصائيات الحالية: تُكتب في دفعات فقط
+    المستندات الجديدة أو التي تغيّرت، وتُحذف إحصائيات الأعضاء الذين لم يعودوا موجودين.
+
+    Returns:
+        dict: عدد المستندات المكتوبة والمحذوفة وعدد العمليات الفاشلة.
     """
-    # أولاً، مسح الإحصائيات القديمة
-    clear_subcollection(user_id, 'member_stats')
-    
-    # ثانياً، إضافة الإحصائيات الجديدة
     stats_ref = db.collection('users').document(user_id).collection('member_stats')
+    current_stats = {doc.id: doc.to_dict() for doc in stats_ref.stream()}
+
+    # استخدام member_id كمعرف للمستند لسهولة الوصول
+    desired_stats = {}
     for stats in member_stats_data:
-        # استخدام member_id كمعرف للمستند لسهولة الوصول
-        member_id = stats.pop('member_id') 
-        stats_ref.document(member_id).set(stats)
+        stats = dict(stats)
+        desired_stats[stats.pop('member_id')] = stats
+
+    # المستند الذي يحتوي حقولاً لم تعد موجودة يُعامل كمستند جديد حتى يُستبدل بالكامل
+    comparable_stats = {
+        member_id: stats for member_id, stats in current_stats.items()
+        if set(stats) == set(desired_stats.get(member_id, stats))
+    }
+
+    with BatchWriter() as writer:
+        written = upsert_documents(user_id, 'member_stats', desired_stats, comparable_stats, writer=writer)
+        removed = delete_documents(user_id, 'member_stats', [member_id for member_id in current_stats if member_id not in desired_stats], writer=writer)
+
+    if written or removed:
+        bump_data_versions(user_id, ['member_stats'])
+    return {'written': written, 'removed': removed, 'failed': writer.failed}
+
+# حد Firestore لحجم المستند 1 MiB؛ يُترك هامش لاسم المستند وتقريب الحساب
+MAX_ROLLUP_DOCUMENT_BYTES = 900_000
+
+def _document_size(value):
+    """
+    يقدّر حجم القيمة كما يحسبه Firestore: النص بطوله بـ UTF-8 زائد بايت، والأرقام 8 بايت،
+    والقوائم والخرائط مجموع عناصرها (مع أسماء الحقول).
+    """
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, dict):
+        return sum(_document_size(key) + _document_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_document_size(item) for item in value)
+    if value is None or isinstance(value, bool):
+        return 1
+    return 8
+
+def _split_rollup_month(month: str, month_df: pd.DataFrame):
+    """
+    يحوّل صفوف شهر واحد إلى مستند {عمود: قائمة}، أو إلى أجزاء {YYYY-MM-pN} متساوية عدد
+    الصفوف إن تجاوز المستند الواحد MAX_ROLLUP_DOCUMENT_BYTES.
+    """
+    def to_doc(part_df):
+        return {col: part_df[col].tolist() for col in month_df.columns}
+
+    doc = to_doc(month_df)
+    size = _document_size(doc)
+    if size <= MAX_ROLLUP_DOCUMENT_BYTES:
+        return {month: doc}
+
+    part_count = -(-size // MAX_ROLLUP_DOCUMENT_BYTES)
+    while True:
+        part_rows = -(-len(month_df) // part_count)
+        parts = [to_doc(month_df.iloc[start:start + part_rows]) for start in range(0, len(month_df), part_rows)]
+        if all(_document_size(part) <= MAX_ROLLUP_DOCUMENT_BYTES for part in parts) or part_rows == 1:
+            return {f"{month}-p{index}": part for index, part in enumerate(parts)}
+        part_count += 1
+
+def _read_rollup_docs(user_id: str, months: list = None):
+    """
+    يقرأ مستندات الملخص اليومي كلها، أو مستندات الأشهر المحددة فقط (الشهر وأجزاؤه):
+    لكل شهر استعلام بمدى معرّفات المستندات [YYYY-MM, YYYY-MM.) لأن '-' يسبق '.'.
+
+    Returns:
+        dict: {معرّف المستند: بياناته}.
+    """
+    rollup_ref = db.collection('users').document(user_id).collection('daily_rollup')
+    if months is None:
+        return {doc.id: doc.to_dict() for doc in rollup_ref.stream()}
+
+    def read_month(month):
+        month_query = (
+            rollup_ref.where(firestore.FieldPath.document_id(), '>=', rollup_ref.document(month))
+                      .where(firestore.FieldPath.document_id(), '<', rollup_ref.document(f'{month}.'))
+        )
+        return {doc.id: doc.to_dict() for doc in month_query.stream()}
+
+    docs = {}
+    for month_docs in fetch_concurrently({month: lambda month=month: read_month(month) for month in months}).values():
+        docs.update(month_docs)
+    return docs
+
+def save_daily_rollup(user_id: str, rollup_df: pd.DataFrame, months: list = None):
+    """
+    يحفظ الملخص اليومي (صف لكل عضو لكل يوم) مجمّعاً في مستند واحد لكل شهر، بحيث يكون كل
+    عمود قائمة قيم. الشهر الذي يتجاوز حد حجم المستند يُقسّم إلى أجزاء {YYYY-MM-pN}.
+    تُكتب فقط المستندات التي تغيّرت، وتُحذف المستندات التي لم تعد فيها سجلات.
+
+    Args:
+        rollup_df (pd.DataFrame): الملخص كما يعيده main.build_daily_rollup، وفيه عمود 'date' بصيغة YYYY-MM-DD.
+        months (list): أشهر YYYY-MM يغطيها rollup_df وحدها (كما في المزامنة التزايدية)؛ تُقرأ
+            مستنداتها فقط ولا تُمس بقية الأشهر. إن لم تُحدد فإن rollup_df هو الملخص كاملاً.
+
+    Returns:
+        dict: عدد مستندات الأشهر (أو أجزائها) المكتوبة والمحذوفة وعدد العمليات الفاشلة.
+    """
+    month_docs = {}
+    if not rollup_df.empty:
+        for month, month_df in rollup_df.groupby(rollup_df['date'].str[:7]):
+            month_docs.update(_split_rollup_month(month, month_df))
+
+    current_docs = _read_rollup_docs(user_id, months)
+    with BatchWriter() as writer:
+        written = upsert_documents(user_id, 'daily_rollup', month_docs, current_docs, writer=writer)
+        removed = delete_documents(user_id, 'daily_rollup', [doc_id for doc_id in current_docs if doc_id not in month_docs], writer=writer)
+
+    if written or removed:
+        bump_data_versions(user_id, ['daily_rollup'])
+    return {'written': written, 'removed': removed, 'failed': writer.failed}
+
+def rollup_doc_order(doc_id: str):
+    """
+    مفتاح ترتيب مستندات الملخص: حسب الشهر ثم رقم الجزء (حتى يأتي p10 بعد p9).
+    """
+    month, _, part = doc_id.partition('-p')
+    return month, int(part) if part else 0
+
+def get_daily_rollup_df(user_id: str, data_version: str = None, months: list = None):
+    """
+    يجلب الملخص اليومي للمستخدم ويعيده كـ DataFrame بصف لكل عضو لكل يوم (فارغ إن لم يُكتب بعد).
+    يُقرأ من اللقطة المحلية عند تمرير إصدار daily_rollup كما في get_subcollection_as_df.
+    عند تحديد months (أشهر YYYY-MM) تُقرأ مستندات تلك الأشهر فقط، دون اللقطة المحلية.
+    """
+    if months is None:
+        cached_df = snapshot_cache.read_frame(user_id, 'daily_rollup', data_version)
+        if cached_df is not None:
+            return cached_df
+
+    docs = _read_rollup_docs(user_id, months)
+    frames = [pd.DataFrame(docs[doc_id]) for doc_id in sorted(docs, key=rollup_doc_order)]
+    if not frames:
+        return pd.DataFrame()
+    rollup_df = pd.concat(frames, ignore_index=True)
+    if months is None:
+        snapshot_cache.write_frames(user_id, data_version, {'daily_rollup': rollup_df})
+    return rollup_df
+
+def save_challenge_snapshots(user_id: str, snapshots: dict, partial: bool = False):
+    """
+    يحفظ لقطات تحليلات التحديات (مستند لكل تحدي). تُكتب فقط اللقطات التي تغيّرت،
+    وتُحذف لقطات التحديات التي لم تعد موجودة.
+
+    Args:
+        snapshots (dict): اللقطات حسب معرف التحدي كما يعيدها main.build_challenge_snapshots.
+        partial (bool): snapshots تخص بعض التحديات فقط (كما في المزامنة التزايدية)؛ تُقرأ لقطاتها
+            وحدها للمقارنة ولا يُحذف شيء.
+
+    Returns:
+        dict: عدد اللقطات المكتوبة والمحذوفة وعدد العمليات الفاشلة.
+    """
+    if partial:
+        current_snapshots = get_documents(user_id, 'challenge_snapshots', sorted(snapshots))
+    else:
+        snapshots_ref = db.collection('users').document(user_id).collection('challenge_snapshots')
+        current_snapshots = {doc.id: doc.to_dict() for doc in snapshots_ref.stream()}
+    with BatchWriter() as writer:
+        written = upsert_documents(user_id, 'challenge_snapshots', snapshots, current_snapshots, writer=writer)
+        removed = 0 if partial else delete_documents(user_id, 'challenge_snapshots', [period_id for period_id in current_snapshots if period_id not in snapshots], writer=writer)
+
+    if written or removed:
+        bump_data_versions(user_id, ['challenge_snapshots'])
+    return {'written': written, 'removed': removed, 'failed': writer.failed}
+
+def get_challenge_snapshot(user_id: str, period_id: str):
+    """
+    يجلب لقطة تحليلات تحدي واحد، أو None إن لم تُكتب بعد.
+    """
+    doc = db.collection('users').document(user_id).collection('challenge_snapshots').document(period_id).get()
+    return doc.to_dict() if doc.exists else None
 
 def delete_challenge(user_id: str, period_id: str):
     """
@@ -259,14 +917,18 @@ def delete_challenge(user_id: str, period_id: str):
 
     book_id = period_doc.to_dict().get('common_book_id')
 
-    # حذف الإنجازات المرتبطة بهذا التحدي
+    # حذف الإنجازات المرتبطة بهذا التحدي؛ يبقى التحدي إن فشل جزء منها حتى يُعاد الحذف
     ach_ref = db.collection('users').document(user_id).collection('achievements')
-    ach_to_delete = ach_ref.where('period_id', '==', period_id).stream()
-    for doc in ach_to_delete:
-        doc.reference.delete()
+    result = bulk_delete(ach_ref.where('period_id', '==', period_id))
+    if result['deleted']:
+        bump_data_versions(user_id, ['achievements'])
+    if result['failed']:
+        return False
     
-    # حذف التحدي نفسه
+    # حذف التحدي نفسه ولقطة تحليلاته
+    changed_collections = ['periods', 'challenge_snapshots']
     period_ref.delete()
+    db.collection('users').document(user_id).collection('challenge_snapshots').document(period_id).delete()
     
     # التحقق مما إذا كان الكتاب مرتبطًا بتحديات أخرى قبل حذفه
     if book_id:
@@ -275,7 +937,9 @@ def delete_challenge(user_id: str, period_id: str):
         if len(other_periods) == 0:
             # إذا لم يكن مرتبطًا، احذف الكتاب
             db.collection('users').document(user_id).collection('books').document(book_id).delete()
-            
+            changed_collections.append('books')
+
+    bump_data_versions(user_id, changed_collections)
     return True
 
 # --- NEW FUNCTIONS FOR PERSISTENT AUTHENTICATION ---
@@ -308,20 +972,33 @@ def get_refresh_token(user_id: str):
         return None
 
 
-def delete_user_workspace(user_id: str):
+def delete_user_workspace(user_id: str, progress=None):
     """
     Deletes a user's entire workspace from Firestore, including all subcollections.
     This is a destructive and irreversible action.
+
+    Each subcollection is removed with `bulk_delete`. The main user document is
+    only deleted once every subcollection is empty, so an interrupted or
+    partly failed deletion can simply be run again. The workspace's local
+    Arrow snapshots are removed as well.
+
+    Args:
+        progress: Optional callback, called as progress(collection_name, documents_sent).
+
+    Returns:
+        bool: True when the whole workspace was deleted.
     """
     user_doc_ref = db.collection('users').document(user_id)
 
     # It's important to delete subcollections recursively first
-    collections = user_doc_ref.collections()
-    for collection in collections:
-        docs = collection.stream()
-        for doc in docs:
-            doc.reference.delete()
+    failed = 0
+    for collection in user_doc_ref.collections():
+        collection_progress = None if progress is None else lambda sent, name=collection.id: progress(name, sent)
+        failed += bulk_delete(collection, collection_progress)['failed']
+    snapshot_cache.remove_workspace(user_id)
+    if failed:
+        return False
 
     # Finally, delete the main user document
     user_doc_ref.delete()
-    return True
\ No newline at end of file
+    return True
@@ -1,6 +1,33 @@
+import os
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore
+try:
+    import tomllib
+except ModuleNotFoundError: # Python < 3.11
+    import toml as tomllib
+
+# عند ضبط هذا المتغير (مسار ملف secrets.toml) تُهيأ قاعدة البيانات دون Streamlit، كما في sync_cli.py
+HEADLESS_SECRETS_ENV = "READING_MARATHON_SECRETS"
+
+def load_secrets_file(path: str):
+    """
+    Reads a secrets.toml file (same layout as .streamlit/secrets.toml) outside of Streamlit.
+    """
+    with open(path, encoding='utf-8') as f:
+        return tomllib.loads(f.read())
+
+def initialize_firebase_headless(secrets: dict):
+    """
+    Initializes the Firebase Admin SDK from an already-loaded secrets dict,
+    for command-line tools that run without a Streamlit runtime.
+    """
+    if not firebase_admin._apps:
+        if "firebase_credentials" not in secrets:
+            raise KeyError("firebase_credentials block not found in the secrets file.")
+        cred = credentials.Certificate(dict(secrets["firebase_credentials"]))
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
 
 @st.cache_resource
 def initialize_firebase_app():
@@ -26,5 +53,15 @@ def initialize_firebase_app():
         st.error(f"🔥 خطأ في تهيئة Firebase: {e}")
         st.stop()
 
-# Initialize the database client
-db = initialize_firebase_app()
+def __getattr__(name):
+    # يُهيأ عميل قاعدة البيانات عند أول استيراد لـ db (from firebase_config import db) وليس عند استيراد
+    # الوحدة، حتى يستورد sync_cli.py الثابت HEADLESS_SECRETS_ENV قبل ضبطه دون تهيئة Streamlit
+    if name != 'db':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Initialize the database client
+    if os.environ.get(HEADLESS_SECRETS_ENV):
+        client = initialize_firebase_headless(load_secrets_file(os.environ[HEADLESS_SECRETS_ENV]))
+    else:
+        client = initialize_firebase_app()
+    globals()['db'] = client
+    return client
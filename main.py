@@ -1,19 +1,218 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime, date, timedelta
+import hashlib
+import json
 import db_manager as db
+import snapshot_cache
 import gspread
+from period_index import PeriodIndex
 
-def run_data_update(gc: gspread.Client, user_id: str):
+def _fingerprint_values(values):
+    """
+    Returns a stable hash of a list of raw cell values (a header or a sheet row).
+    """
+    return hashlib.sha256(json.dumps([str(v) for v in values], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _fingerprint_config(all_data):
+    """
+    Returns a hash of the members and challenges a sync was computed against.
+    Rows skipped for an unknown member or outside every challenge must be
+    re-evaluated when these change, so a different fingerprint forces a full rebuild.
+    """
+    members = sorted((m['members_id'], str(m.get('name', ''))) for m in all_data['members'])
+    periods = sorted(
+        (p['periods_id'], json.dumps({k: str(v) for k, v in p.items()}, sort_keys=True, ensure_ascii=False))
+        for p in all_data['periods']
+    )
+    return hashlib.sha256(json.dumps([members, periods], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _pad_row(row, width: int):
+    """
+    The Sheets API trims trailing empty cells, so rows are padded to the header width.
+    """
+    row = list(row[:width])
+    return row + [''] * (width - len(row))
+
+def _rows_to_df(header, rows):
+    """
+    Builds the same DataFrame `worksheet.get_all_records()` would return from raw cell values.
+    """
+    width = len(header)
+    records = [gspread.utils.numericise_all(_pad_row(row, width)) for row in rows]
+    return pd.DataFrame(records, columns=header)
+
+def _fetch_all_rows(worksheet):
+    """
+    Reads the whole sheet. Returns the header and the raw rows padded to its width.
+    """
+    values = worksheet.get_all_values()
+    if not values:
+        return [], []
+    header = list(values[0])
+    return header, [_pad_row(row, len(header)) for row in values[1:]]
+
+def _fetch_new_rows(worksheet, sync_state: dict):
+    """
+    Reads only the header and the rows appended after the last synced row.
+
+    The last synced row is re-read as an anchor: if it is gone (the sheet shrank)
+    or no longer matches its stored fingerprint, or if the header changed, the
+    already-synced rows cannot be trusted and None is returned so the caller
+    falls back to a full read.
+
+    Returns:
+        tuple[list, list] | None: The header and the new raw rows, or None.
+    """
+    synced_rows = int(sync_state.get("row_count", 0))
+    if synced_rows < 1 or not sync_state.get("header_fingerprint") or not sync_state.get("last_row_fingerprint"):
+        return None
+
+    anchor_row = synced_rows + 1 # الصف الأول هو صف العناوين
+    if anchor_row > worksheet.row_count:
+        return None
+
+    header_range, tail_range = worksheet.batch_get(["1:1", f"{anchor_row}:{worksheet.row_count}"])
+    header = list(header_range[0]) if header_range else []
+    if not header or _fingerprint_values(header) != sync_state["header_fingerprint"]:
+        return None
+
+    tail = [_pad_row(row, len(header)) for row in tail_range]
+    if not tail or _fingerprint_values(tail[0]) != sync_state["last_row_fingerprint"]:
+        return None
+    return header, tail[1:]
+
+def _probe_sheet_modified_time(spreadsheet):
+    """
+    Returns the spreadsheet's Drive `modifiedTime`, a single cheap metadata call,
+    or None when it is unavailable (older gspread or missing Drive permission).
+    """
+    try:
+        return spreadsheet.get_lastUpdateTime()
+    except Exception:
+        return None
+
+def _write_local_snapshot(user_id: str, data_versions: dict, summary: dict, rollup_df):
+    """
+    Refreshes the workspace's local Arrow snapshot after a successful sync, so
+    dashboard loads memory-map it instead of re-streaming Firestore. Logs,
+    achievements and the daily rollup are taken from memory; the small
+    collections are read through the cache, which only re-reads those whose
+    version changed since their snapshot was written.
+    """
+    frames = {
+        'logs': pd.DataFrame([{**log, 'logs_id': doc_id} for doc_id, log in summary['logs'].items()]),
+        'achievements': pd.DataFrame([{**ach, 'achievements_id': doc_id} for doc_id, ach in summary['achievements'].items()]),
+        'daily_rollup': rollup_df,
+    }
+    for collection_name, df in frames.items():
+        snapshot_cache.write_frames(user_id, data_versions.get(collection_name), {collection_name: df})
+    for collection_name in ['members', 'books', 'periods', 'member_stats']:
+        db.get_subcollection_as_df(user_id, collection_name, data_versions.get(collection_name))
+
+# إصدار بنية علامة المزامنة: العلامات الأقدم كُتبت قبل أن يُحدَّث الملخص اليومي ولقطات التحديات
+# تزايدياً (وقد لا يوجد لها ملخص بعد)، فتبدأ بمطابقة كاملة واحدة
+SYNC_STATE_VERSION = 2
+
+def read_data_for_new_rows(user_id: str, df, sync_config: dict):
+    """
+    Reads only the stored documents that processing `df` incrementally depends
+    on, instead of every log and achievement: the logs sharing a Timestamp with
+    a new row (for occurrence numbering and upserts) and the achievements of the
+    members the new rows belong to (for de-duplication).
+
+    Returns:
+        dict: Shaped like `db.get_all_data_for_stats`, with 'logs' and 'achievements'
+            limited to those documents.
+    """
+    rows = normalize_sheet_rows(df)
+    member_map = {member['name']: member['members_id'] for member in sync_config['members']}
+    member_ids = rows['member_name'].map(member_map).dropna()
+    docs = db.fetch_concurrently({
+        'logs': lambda: db.get_documents_where_in(user_id, 'logs', 'timestamp', rows['timestamp']),
+        'achievements': lambda: db.get_documents_where_in(user_id, 'achievements', 'member_id', member_ids),
+    })
+    return {
+        "members": sync_config["members"],
+        "logs": docs['logs'],
+        "achievements": docs['achievements'],
+        "periods": sync_config["periods"],
+    }
+
+def update_views_for_new_documents(user_id: str, all_data: dict, summary: dict):
+    """
+    Folds the logs and achievements added by an incremental sync into the
+    stored daily rollup and challenge snapshots. Only the rollup months the new
+    logs fall in are rewritten, and only the challenges they (or the new
+    achievements) belong to are re-snapshotted, reading just those months and
+    those challenges' achievements.
+
+    Returns:
+        tuple[dict, dict]: The `db.save_daily_rollup` and `db.save_challenge_snapshots` summaries.
+    """
+    period_index = PeriodIndex(all_data['periods'])
+    new_rollup = build_daily_rollup(pd.DataFrame(list(summary['new_logs'].values())), all_data['periods'])
+    new_months = sorted(set(new_rollup['date'].str[:7]))
+
+    affected_ids = {period_index.periods[position]['periods_id'] for position in period_index.positions(new_rollup['date']) if position >= 0}
+    affected_ids |= {ach['period_id'] for ach in summary['new_achievements'].values()}
+    affected_periods = [period for period in period_index.periods if period['periods_id'] in affected_ids]
+    # لقطة التحدي تحتاج ملخص جميع أيامه، لا الأشهر التي أُضيفت فيها سجلات فقط
+    period_months = {
+        month for period in affected_periods
+        for month in pd.period_range(period['start_date'][:7], period['end_date'][:7], freq='M').strftime('%Y-%m')
+    }
+
+    reads = db.fetch_concurrently({
+        'rollup': lambda: db.get_daily_rollup_df(user_id, months=sorted(set(new_months) | period_months)),
+        'achievements': lambda: pd.DataFrame(db.get_documents_where_in(user_id, 'achievements', 'period_id', affected_ids)),
+    })
+    rollup_df = merge_daily_rollups([reads['rollup'], new_rollup])
+
+    rollup_summary = db.save_daily_rollup(user_id, rollup_df[rollup_df['date'].str[:7].isin(new_months)], months=new_months)
+    snapshots = build_challenge_snapshots(all_data['members'], rollup_df, reads['achievements'], affected_periods)
+    snapshots_summary = db.save_challenge_snapshots(user_id, snapshots, partial=True)
+    return rollup_summary, snapshots_summary
+
+def run_data_update(gc: gspread.Client, user_id: str, full_rebuild: bool = False, progress=None):
     """
     The main data synchronization engine, now tailored for a specific user.
 
+    Before anything is downloaded, a cheap probe compares the spreadsheet's
+    Drive `modifiedTime` and the members/challenges configuration with the
+    values stored after the previous successful sync; when both match the sync
+    stops with "no changes" without reading the sheet or the stored logs.
+
+    Otherwise only the rows appended to the sheet since the last successful
+    sync are downloaded and ingested: the header and the range starting at the
+    last synced row are fetched instead of the whole sheet. Only the stored
+    documents the new rows touch are read (see `read_data_for_new_rows` and
+    `update_views_for_new_documents`). A full read and rebuild happens when
+    `full_rebuild` is set, when no previous sync state exists (or it predates
+    `SYNC_STATE_VERSION`), when the sheet shrank, when the header or the last synced row
+    changed, when the sheet's known `modifiedTime` changed without any
+    appended rows (an edit to an already-synced row), or when the
+    members/challenges configuration changed. Without a `modifiedTime` to
+    compare, fetching the tail is the only probe, and finding no appended rows
+    ends the sync with "no changes".
+
     Args:
         gc (gspread.Client): The authenticated gspread client.
         user_id (str): The unique ID of the user (admin) to sync data for.
+        full_rebuild (bool): Skips the change probe and forces a full read and reconciliation
+            of logs and achievements, e.g. after rows that were already synced are edited in the sheet.
+        progress (callable): Optional `progress(step, **counters)` callback invoked as the sync
+            moves through its steps ('fetching', 'fetched', 'writing', 'written', 'stats'),
+            used by background sync jobs to report progress.
     """
+    def report(step, **counters):
+        if progress is not None:
+            progress(step, **counters)
+
     update_log = ["--- بدء عملية تحديث بيانات التحدي ---"]
+    report('fetching')
 
-    # الخطوة 1: جلب إعدادات المستخدم المحدد (رابط الشيت)
+    # الخطوة 1: جلب إعدادات المستخدم المحدد (رابط الشيت) والأعضاء والتحديات من Firestore
     user_settings = db.get_user_settings(user_id)
     spreadsheet_url = user_settings.get("spreadsheet_url")
 
@@ -21,13 +220,56 @@ def run_data_update(gc: gspread.Client, user_id: str):
         update_log.append("❌ خطأ: لم يتم العثور على رابط جدول البيانات في إعداداتك. يرجى إكمال الإعداد أولاً.")
         return update_log
 
+    sync_config = db.get_sync_config(user_id)
+    setup_complete = bool(sync_config.get("members") and sync_config.get("periods"))
+    config_fingerprint = _fingerprint_config(sync_config) if setup_complete else None
+
+    # الخطوة 2: تحديد نمط المزامنة (تزايدية أو إعادة بناء كاملة) بناءً على آخر علامة مزامنة
+    sync_state = user_settings.get("sync_state") or {}
+    try_incremental = (
+        not full_rebuild
+        and setup_complete
+        and bool(sync_state)
+        and sync_state.get("config_fingerprint") == config_fingerprint
+        and sync_state.get("state_version") == SYNC_STATE_VERSION
+    )
+
     update_log.append(f"جاري سحب البيانات من Google Sheet الخاص بك...")
     try:
         spreadsheet = gc.open_by_url(spreadsheet_url)
+
+        # فحص سريع: إذا لم يتغير الجدول ولا الإعدادات منذ آخر مزامنة فلا داعي لأي قراءة أو كتابة
+        sheet_modified_time = _probe_sheet_modified_time(spreadsheet)
+        if try_incremental and sheet_modified_time and sheet_modified_time == sync_state.get("sheet_modified_time"):
+            update_log.append("ℹ️ لا توجد تغييرات في الجدول أو الإعدادات منذ آخر مزامنة.")
+            update_log.append("\n--- ✅ انتهت عملية مزامنة البيانات بنجاح ---")
+            return update_log
+
         worksheet = spreadsheet.worksheet("Form Responses 1")
-        records = worksheet.get_all_records()
-        raw_data_df = pd.DataFrame(records)
-        update_log.append(f"✅ تم العثور على {len(raw_data_df)} صف في الجدول.")
+        tail = _fetch_new_rows(worksheet, sync_state) if try_incremental else None
+        if tail is not None and not tail[1]:
+            stored_modified_time = sync_state.get("sheet_modified_time")
+            if sheet_modified_time and stored_modified_time and sheet_modified_time != stored_modified_time:
+                # تغيّر الملف دون إضافة صفوف: قد يكون التعديل في صفوف سبقت مزامنتها، فتُعاد المطابقة كاملة
+                tail = None
+            else:
+                # لا يوجد وقت تعديل معروف للمقارنة، فجلب الصفوف الأخيرة هو الفحص الوحيد ولم يجد صفوفاً جديدة
+                if sheet_modified_time:
+                    db.save_sync_state(user_id, {**sync_state, "sheet_modified_time": sheet_modified_time})
+                update_log.append("ℹ️ لا توجد صفوف جديدة منذ آخر مزامنة.")
+                update_log.append("\n--- ✅ انتهت عملية مزامنة البيانات بنجاح ---")
+                return update_log
+        incremental = tail is not None
+        if incremental:
+            header, rows = tail
+            row_count = int(sync_state["row_count"]) + len(rows)
+            update_log.append(f"✅ تم جلب {len(rows)} صف جديد فقط بعد آخر صف تمت مزامنته (إجمالي الصفوف: {row_count}).")
+        else:
+            header, rows = _fetch_all_rows(worksheet)
+            row_count = len(rows)
+            update_log.append(f"✅ تم العثور على {row_count} صف في الجدول.")
+        raw_data_df = _rows_to_df(header, rows)
+        report('fetched', rows_fetched=len(raw_data_df), incremental=incremental)
     except gspread.exceptions.WorksheetNotFound:
         update_log.append("❌ خطأ: لم يتم العثور على ورقة 'Form Responses 1'. يرجى التأكد من إعدادات الربط وإعادة تسمية الورقة.")
         return update_log
@@ -36,177 +278,838 @@ def run_data_update(gc: gspread.Client, user_id: str):
         return update_log
 
     if not raw_data_df.empty:
-        # الخطوة 2: جلب البيانات الحالية للمستخدم من Firestore
-        all_data = db.get_all_data_for_stats(user_id)
-        if not all_data or not all_data.get("members") or not all_data.get("periods"):
+        if not setup_complete:
             update_log.append("❌ خطأ: لم تكتمل عملية إعداد التحديات أو الأعضاء. يرجى إضافتهم من صفحة الإدارة.")
             return update_log
 
-        # الخطوة 3: مسح السجلات والإنجازات القديمة للمستخدم المحدد
-        update_log.append("🔄 جاري مسح السجلات القديمة استعداداً للمزامنة الكاملة...")
-        db.clear_subcollection(user_id, 'logs')
-        db.clear_subcollection(user_id, 'achievements')
-        update_log.append("👍 تم مسح السجلات بنجاح.")
+        # الخطوة 3: جلب السجلات والإنجازات الحالية (لا تُقرأ إلا عند وجود صفوف لمعالجتها)،
+        # وفي المزامنة التزايدية ما تعتمد عليه الصفوف الجديدة منها فقط
+        report('writing', rows_fetched=len(raw_data_df), incremental=incremental)
+        if incremental:
+            all_data = read_data_for_new_rows(user_id, raw_data_df, sync_config)
+        else:
+            all_data = db.get_all_data_for_stats(user_id, config=sync_config)
+
+        # تُمسح العلامة قبل أي كتابة حتى تُعاد المطابقة كاملة إذا انقطعت المزامنة في منتصفها،
+        # بدلاً من أن يجد الفحص السريع العلامة القديمة فيتجاهل مساحة عمل لم تكتمل مطابقتها
+        if sync_state:
+            db.save_sync_state(user_id, {})
 
-        # الخطوة 4: معالجة وإعادة إدخال البيانات للمستخدم المحدد
-        entries_processed = process_all_data(raw_data_df, all_data, user_id)
-        update_log.append(f"🔄 تمت معالجة وإعادة إدخال {entries_processed} تسجيل.")
+        if incremental:
+            # الخطوة 4: معالجة الصفوف الجديدة فقط
+            update_log.append(f"➕ مزامنة تزايدية: {len(raw_data_df)} صف جديد منذ آخر مزامنة.")
+            summary = process_all_data(raw_data_df, all_data, user_id)
+            update_log.append(f"🔄 تمت معالجة {summary['processed']} تسجيل جديد.")
+        else:
+            if try_incremental:
+                update_log.append("⚠️ تغيّر الجدول دون إضافة صفوف جديدة فقط (تعديل أو حذف في صفوف سبقت مزامنتها أو في عناوين الأعمدة)، لذا تمت قراءة الجدول كاملاً.")
+            elif sync_state and not full_rebuild:
+                update_log.append("⚠️ تم اكتشاف تغيير في الأعضاء أو التحديات.")
 
-        # الخطوة 5: حساب وتحديث إحصائيات المستخدم المحدد
-        update_log.append("🧮 جاري حساب وتحديث جميع الإحصائيات...")
-        calculate_and_update_stats(user_id)
-        update_log.append("✅ اكتمل حساب الإحصائيات.")
+            # الخطوة 4: مطابقة جميع الصفوف مع السجلات الحالية (كتابة الجديد والمعدّل فقط وحذف ما لم يعد موجوداً)
+            update_log.append("🔄 جاري المزامنة الكاملة ومطابقة جميع الصفوف مع السجلات الحالية...")
+            summary = process_all_data(raw_data_df, all_data, user_id, prune=True)
+            update_log.append(f"🔄 تمت معالجة {summary['processed']} تسجيل ({summary['logs_unchanged']} دون تغيير).")
+            update_log.append(f"🗑️ تم حذف {summary['logs_removed']} سجل و {summary['achievements_removed']} إنجاز لم تعد موجودة في الجدول.")
+        update_log.append(f"💾 تم إرسال {summary['logs_written']} سجل و {summary['achievements_written']} إنجاز للكتابة.")
+        update_log.append(f"📦 عمليات قاعدة البيانات: {summary['ops_written']} ناجحة، {summary['ops_failed']} فاشلة.")
+        report('written', rows_processed=summary['processed'], ops_written=summary['ops_written'], ops_failed=summary['ops_failed'])
+
+        # الخطوة 5: تحديث إحصائيات المستخدم المحدد
+        report('stats')
+        deltas_summary = None
+        # في المزامنة التزايدية الناجحة تكفي إضافة فروقات السجلات الجديدة لإحصائيات أصحابها
+        if (
+            incremental
+            and not summary['ops_failed']
+            and summary['logs_written'] == len(summary['new_logs'])
+            and summary['achievements_written'] == len(summary['new_achievements'])
+        ):
+            deltas_summary = apply_stats_deltas(
+                user_id, all_data['members'], all_data['periods'],
+                list(summary['new_logs'].values()), list(summary['new_achievements'].values()),
+            )
+        if deltas_summary is not None:
+            update_log.append(f"📈 تم تحديث إحصائيات {deltas_summary['updated']} عضو فقط بناءً على السجلات الجديدة.")
+            if deltas_summary['failed']:
+                # تُبنى الفروقات القادمة على إحصائيات لم تُكتب، لذا تُمسح العلامة (الخطوة 6) لتُعاد المطابقة كاملة
+                update_log.append(f"⚠️ فشلت كتابة {deltas_summary['failed']} من مستندات إحصائيات الأعضاء.")
+            summary['ops_failed'] += deltas_summary['failed']
+        else:
+            update_log.append("🧮 جاري حساب وتحديث جميع الإحصائيات...")
+            stats_summary = calculate_and_update_stats(user_id)
+            if stats_summary['failed']:
+                update_log.append(f"⚠️ فشلت كتابة {stats_summary['failed']} من مستندات إحصائيات الأعضاء.")
+            else:
+                update_log.append("✅ اكتمل حساب الإحصائيات.")
+            summary['ops_failed'] += stats_summary['failed']
+
+        # تحديث الملخص اليومي الذي تقرأ منه لوحات المتابعة (تُكتب الأشهر المتغيرة فقط)، ثم
+        # اللقطة المُحتسبة مسبقاً لكل تحدي التي تعرضها صفحة تحليلات التحديات من مستند واحد
+        if incremental:
+            rollup_summary, snapshots_summary = update_views_for_new_documents(user_id, all_data, summary)
+        else:
+            rollup_df = build_daily_rollup(pd.DataFrame(list(summary['logs'].values())), all_data['periods'])
+            rollup_summary = db.save_daily_rollup(user_id, rollup_df)
+            snapshots = build_challenge_snapshots(all_data['members'], rollup_df, pd.DataFrame(list(summary['achievements'].values())), all_data['periods'])
+            snapshots_summary = db.save_challenge_snapshots(user_id, snapshots)
+        update_log.append(f"🗓️ تم تحديث الملخص اليومي ({rollup_summary['written']} شهر).")
+        update_log.append(f"🎯 تم تحديث لقطات التحديات ({snapshots_summary['written']} تحدي).")
+        summary['ops_failed'] += rollup_summary['failed'] + snapshots_summary['failed']
+
+        # إصدار جديد للسجلات والإنجازات إن تغيّرت يجعل لقطاتها المحلية السابقة قديمة (حتى لو فشل جزء من الكتابة)
+        changed_collections = [
+            name for name in ['logs', 'achievements']
+            if summary[f'{name}_written'] or summary[f'{name}_removed']
+        ]
+        if changed_collections:
+            db.bump_data_versions(user_id, changed_collections)
+
+        # الخطوة 6: حفظ علامة المزامنة الجديدة (آخر صف تمت مزامنته وبصمته ووقت تعديل الملف)
+        if summary['ops_failed']:
+            # مسح العلامة يضمن أن المزامنة التالية ستكون كاملة وتعيد كتابة ما فشل
+            db.save_sync_state(user_id, {})
+            update_log.append("⚠️ فشلت بعض عمليات الكتابة؛ ستتم إعادة المطابقة الكاملة في المزامنة القادمة.")
+            update_log.append("\n--- ⚠️ انتهت عملية المزامنة مع وجود أخطاء ---")
+            return update_log
+
+        db.save_sync_state(user_id, {
+            "row_count": row_count,
+            "last_timestamp": str(raw_data_df['Timestamp'].iloc[-1]) if 'Timestamp' in raw_data_df.columns else None,
+            "header_fingerprint": _fingerprint_values(header),
+            "last_row_fingerprint": _fingerprint_values(rows[-1]),
+            "config_fingerprint": config_fingerprint,
+            "sheet_modified_time": sheet_modified_time,
+            "synced_at": datetime.now().isoformat(timespec='seconds'),
+            "state_version": SYNC_STATE_VERSION,
+        })
+        if not incremental:
+            # المزامنة التزايدية لا تحمل السجلات والإنجازات كاملة في الذاكرة، فتُحدَّث لقطاتها عند القراءة التالية
+            _write_local_snapshot(user_id, db.get_data_versions(user_id), summary, rollup_df)
     else:
         update_log.append("ℹ️ لا توجد بيانات جديدة في الجدول.")
 
     update_log.append("\n--- ✅ انتهت عملية مزامنة البيانات بنجاح ---")
     return update_log
 
-def parse_duration_to_minutes(duration_str):
-    if not isinstance(duration_str, str) or not duration_str: return 0
+def preview_data_update(gc: gspread.Client, user_id: str):
+    """
+    Dry run of `run_data_update`: compares the whole sheet with the current
+    Firestore state in memory and summarises what a full sync would change,
+    without writing anything.
+
+    The same cheap probe as a real sync runs first, so when neither the sheet
+    nor the members/challenges changed since the last successful sync the
+    preview returns without reading the sheet or the stored logs.
+
+    Args:
+        gc (gspread.Client): The authenticated gspread client.
+        user_id (str): The unique ID of the user (admin) to preview the sync for.
+
+    Returns:
+        dict: 'status' ('unchanged', 'changes' or 'error'), a 'message', the counts
+            'new_logs', 'changed_logs', 'removed_logs', 'new_achievements',
+            'changed_achievements' and 'removed_achievements', and 'points': one entry per member whose total
+            points would change, with 'member_id', 'name', 'old_points', 'new_points'
+            and 'delta', largest change first.
+    """
+    preview = {
+        "status": "unchanged", "message": "",
+        "new_logs": 0, "changed_logs": 0, "removed_logs": 0,
+        "new_achievements": 0, "changed_achievements": 0, "removed_achievements": 0,
+        "points": [],
+    }
+
+    user_settings = db.get_user_settings(user_id)
+    spreadsheet_url = user_settings.get("spreadsheet_url")
+    if not spreadsheet_url:
+        preview.update(status="error", message="❌ خطأ: لم يتم العثور على رابط جدول البيانات في إعداداتك. يرجى إكمال الإعداد أولاً.")
+        return preview
+
+    sync_config = db.get_sync_config(user_id)
+    if not sync_config.get("members") or not sync_config.get("periods"):
+        preview.update(status="error", message="❌ خطأ: لم تكتمل عملية إعداد التحديات أو الأعضاء. يرجى إضافتهم من صفحة الإدارة.")
+        return preview
+
+    sync_state = user_settings.get("sync_state") or {}
     try:
-        parts = list(map(int, duration_str.split(':')))
-        h, m, s = (parts + [0, 0, 0])[:3]
-        return h * 60 + m
-    except (ValueError, TypeError): return 0
+        spreadsheet = gc.open_by_url(spreadsheet_url)
+        sheet_modified_time = _probe_sheet_modified_time(spreadsheet)
+        if (
+            sync_state
+            and sheet_modified_time
+            and sheet_modified_time == sync_state.get("sheet_modified_time")
+            and sync_state.get("config_fingerprint") == _fingerprint_config(sync_config)
+        ):
+            preview["message"] = "ℹ️ لا توجد تغييرات في الجدول أو الإعدادات منذ آخر مزامنة."
+            return preview
+        header, rows = _fetch_all_rows(spreadsheet.worksheet("Form Responses 1"))
+    except gspread.exceptions.WorksheetNotFound:
+        preview.update(status="error", message="❌ خطأ: لم يتم العثور على ورقة 'Form Responses 1'. يرجى التأكد من إعدادات الربط وإعادة تسمية الورقة.")
+        return preview
+    except Exception as e:
+        preview.update(status="error", message=f"❌ خطأ أثناء سحب البيانات: {e}")
+        return preview
+
+    raw_data_df = _rows_to_df(header, rows)
+    if raw_data_df.empty:
+        # المزامنة الفعلية لا تغيّر شيئاً عندما يكون الجدول فارغاً
+        preview["message"] = "ℹ️ لا توجد بيانات في الجدول."
+        return preview
+
+    all_data = db.get_all_data_for_stats(user_id, config=sync_config)
+    desired_logs, desired_achievements, _ = plan_sheet_documents(raw_data_df, all_data, prune=True)
+    existing_logs = {log['logs_id']: log for log in all_data['logs']}
+    existing_achievements = {ach['achievements_id']: ach for ach in all_data['achievements']}
+
+    changed_logs = db.changed_documents(desired_logs, existing_logs)
+    changed_achievements = db.changed_documents(desired_achievements, existing_achievements)
+    preview["new_logs"] = sum(1 for doc_id in changed_logs if doc_id not in existing_logs)
+    preview["changed_logs"] = len(changed_logs) - preview["new_logs"]
+    preview["removed_logs"] = sum(1 for doc_id in existing_logs if doc_id not in desired_logs)
+    preview["new_achievements"] = sum(1 for doc_id in changed_achievements if doc_id not in existing_achievements)
+    preview["changed_achievements"] = len(changed_achievements) - preview["new_achievements"]
+    preview["removed_achievements"] = sum(1 for doc_id in existing_achievements if doc_id not in desired_achievements)
+
+    # النقاط كما هي الآن مقابل النقاط بعد المزامنة، بنفس محرك الحساب
+    members, periods = all_data["members"], all_data["periods"]
+    current_stats = compute_member_stats(members, pd.DataFrame(all_data["logs"]), pd.DataFrame(all_data["achievements"]), periods)
+    synced_stats = compute_member_stats(members, pd.DataFrame(list(desired_logs.values())), pd.DataFrame(list(desired_achievements.values())), periods)
+    names = {member['members_id']: member.get('name', '') for member in members}
+    for current, synced in zip(current_stats, synced_stats):
+        delta = synced["total_points"] - current["total_points"]
+        if delta:
+            preview["points"].append({
+                "member_id": current["member_id"], "name": names.get(current["member_id"], ''),
+                "old_points": current["total_points"], "new_points": synced["total_points"], "delta": delta,
+            })
+    preview["points"].sort(key=lambda entry: -abs(entry["delta"]))
+
+    counts = [preview[key] for key in ("new_logs", "changed_logs", "removed_logs", "new_achievements", "changed_achievements", "removed_achievements")]
+    if any(counts) or preview["points"]:
+        preview["status"] = "changes"
+        preview["message"] = "🔎 ستؤدي المزامنة إلى التغييرات التالية."
+    else:
+        preview["message"] = "✅ البيانات في قاعدة البيانات مطابقة للجدول."
+    return preview
+
+# أسماء الأعمدة في الشيت؛ لبعضها صيغتان (قديمة وجديدة) بحسب إصدار النموذج
+COMMON_MINUTES_COLUMNS = ['مدة قراءة الكتاب المشترك', 'مدة قراءة الكتاب المشترك (اختياري)']
+OTHER_MINUTES_COLUMNS = ['مدة قراءة كتاب آخر (إن وجد)', 'مدة قراءة كتاب آخر (اختياري)']
+QUOTES_COLUMNS = ['ما هي الاقتباسات التي أرسلتها اليوم؟ (اختر كل ما ينطبق)', 'ما هي الاقتباسات التي أرسلتها اليوم؟ (اختياري)']
+ACHIEVEMENTS_COLUMNS = ['إنجازات الكتب والنقاش', 'إنجازات الكتب والنقاش (اختر فقط عند حدوثه لأول مرة)']
+
+# مدة بصيغة h:m:s (أجزاء صحيحة مفصولة بنقطتين)، كما يرسلها سؤال المدة في النموذج
+DURATION_PATTERN = r'\s*[+-]?\d+\s*(?::\s*[+-]?\d+\s*)*'
+
+def _text_column(df, column):
+    """
+    Returns a sheet column as stripped strings, or empty strings if the column is missing.
+    """
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[column].fillna('').astype(str).str.strip()
+
+def _coalesce_columns(df, columns):
+    """
+    Resolves a header that exists in several variants: takes each row's value from
+    the first variant that holds a non-empty value.
+    """
+    result = pd.Series('', index=df.index, dtype=object)
+    for column in reversed(columns):
+        if column in df.columns:
+            values = df[column]
+            empty = values.isna() | (values.astype(str) == '')
+            result = values.where(~empty, result)
+    return result
+
+def parse_durations_to_minutes(values):
+    """
+    Vectorised parse of 'h:m:s' duration strings into whole minutes (h * 60 + m).
+    Non-string values and malformed durations count as 0 minutes.
+    """
+    is_text = values.map(type) == str
+    text = values.where(is_text, '').astype(str)
+    valid = text.str.fullmatch(DURATION_PATTERN).fillna(False).astype(bool)
+    parts = text.str.extract(r'^\s*([+-]?\d+)\s*(?::\s*([+-]?\d+))?')
+    hours = pd.to_numeric(parts[0], errors='coerce').fillna(0)
+    minutes = pd.to_numeric(parts[1], errors='coerce').fillna(0)
+    return (hours * 60 + minutes).where(valid, 0).astype(int)
+
+def normalize_sheet_rows(df):
+    """
+    Columnar normalisation stage for the raw `get_all_records` DataFrame.
+
+    Resolves the header variants once, parses reading dates and durations with
+    vectorised operations and derives the quote/achievement flags, dropping rows
+    without a Timestamp or with a date that is not DD/MM/YYYY.
+
+    Args:
+        df (pd.DataFrame): The raw sheet rows.
+
+    Returns:
+        pd.DataFrame: One row per valid response, sorted by Timestamp, with the columns
+            timestamp, member_name, submission_date_dt, submission_date, achievement_date,
+            common_book_minutes, other_book_minutes, submitted_common_quote,
+            submitted_other_quote, finished_common_book, attended_discussion, finished_other_book.
+    """
+    if 'Timestamp' in df.columns:
+        df = df.sort_values(by='Timestamp', kind='stable')
+    df = df.reset_index(drop=True)
+
+    rows = pd.DataFrame(index=df.index)
+    rows['timestamp'] = _text_column(df, 'Timestamp')
+    rows['member_name'] = _text_column(df, 'اسمك')
+
+    # الاعتماد على معيار تاريخ ثابت DD/MM/YYYY مع تجاهل أي جزء للوقت بعد المسافة
+    date_part = _text_column(df, 'تاريخ القراءة').str.split(' ').str[0]
+    rows['submission_date_dt'] = pd.to_datetime(date_part, format='%d/%m/%Y', errors='coerce')
+
+    rows['common_book_minutes'] = parse_durations_to_minutes(_coalesce_columns(df, COMMON_MINUTES_COLUMNS))
+    rows['other_book_minutes'] = parse_durations_to_minutes(_coalesce_columns(df, OTHER_MINUTES_COLUMNS))
+
+    quote_responses = _coalesce_columns(df, QUOTES_COLUMNS).astype(str)
+    rows['submitted_common_quote'] = quote_responses.str.contains('الكتاب المشترك', regex=False).astype(int)
+    rows['submitted_other_quote'] = quote_responses.str.contains('كتاب آخر', regex=False).astype(int)
+
+    achievement_responses = _coalesce_columns(df, ACHIEVEMENTS_COLUMNS).astype(str)
+    rows['finished_common_book'] = achievement_responses.str.contains('أنهيت الكتاب المشترك', regex=False)
+    rows['attended_discussion'] = achievement_responses.str.contains('حضرت جلسة النقاش', regex=False)
+    rows['finished_other_book'] = achievement_responses.str.contains('أنهيت كتاباً آخر', regex=False)
 
-def process_all_data(df, all_data, user_id: str):
+    # تجاهل أي صف بلا ختم زمني أو لا يتطابق تاريخه مع المعيار
+    rows = rows[(rows['timestamp'] != '') & rows['submission_date_dt'].notna()].reset_index(drop=True)
+    rows['submission_date'] = rows['submission_date_dt'].dt.strftime('%d/%m/%Y')
+    rows['achievement_date'] = rows['submission_date_dt'].dt.strftime('%Y-%m-%d')
+    return rows
+
+def _log_doc_id(timestamp: str, member_id: str, occurrence: int):
+    """
+    Derives a stable Firestore document ID for a form response. The occurrence
+    counter keeps repeated submissions with the same Timestamp apart.
+    """
+    return hashlib.sha1(f"{timestamp}|{member_id}|{occurrence}".encode('utf-8')).hexdigest()
+
+def _achievement_doc_id(member_id: str, achievement_type: str, period_id: str, log_id: str = None):
     """
-    Processes all rows from the Google Sheet and adds them to the user's
-    database space in Firestore.
+    Derives a stable Firestore document ID for an achievement. Common-book and
+    discussion achievements are unique per member and challenge, while
+    other-book achievements are tied to the log that reported them.
+    """
+    key = f"{member_id}|{achievement_type}|{period_id}" if log_id is None else f"{log_id}|{achievement_type}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def plan_sheet_documents(df, all_data, prune: bool = False):
+    """
+    Derives the log and achievement documents the given sheet rows map to,
+    keyed by their deterministic document IDs, without touching Firestore.
+
+    Args:
+        df (pd.DataFrame): The sheet rows to process.
+        all_data (dict): The current workspace data from `get_all_data_for_stats`.
+        prune (bool): When True, `df` is the complete sheet, so occurrence numbering and
+                      achievement de-duplication start from scratch instead of from the
+                      existing logs and achievements.
+
+    Returns:
+        tuple[dict, dict, int]: The desired logs, the desired achievements and the
+            number of rows that matched a member.
     """
     member_map = {member['name']: member['members_id'] for member in all_data['members']}
-    entries_processed_count = 0
-
-    df = df.sort_values(by='Timestamp').reset_index(drop=True)
-
-    for index, row in df.iterrows():
-        timestamp = str(row.get('Timestamp', '')).strip()
-        if not timestamp:
-            continue
-
-        submission_date_str = str(row.get('تاريخ القراءة', '')).strip()
-        
-        # --- التعديل النهائي هنا: الاعتماد على معيار تاريخ ثابت ---
-        try:
-            # بما أننا سنفرض معيار DD/MM/YYYY عبر إعدادات الشيت، يمكننا استخدامه بثقة
-            date_part = submission_date_str.split(' ')[0]
-            submission_date_obj = datetime.strptime(date_part, '%d/%m/%Y').date()
-        except (ValueError, TypeError, IndexError):
-            # تجاهل أي صف لا يتطابق تاريخه مع هذا المعيار
-            continue
-        
-        member_name = str(row.get('اسمك', '')).strip()
-        member_id = member_map.get(member_name)
-        if not member_id: continue
-
-        entries_processed_count += 1
-
-        quote_responses = str(row.get('ما هي الاقتباسات التي أرسلتها اليوم؟ (اختر كل ما ينطبق)', '') or row.get('ما هي الاقتباسات التي أرسلتها اليوم؟ (اختياري)', ''))
-        common_quote_today = 1 if 'الكتاب المشترك' in quote_responses else 0
-        other_quote_today = 1 if 'كتاب آخر' in quote_responses else 0
+    period_index = PeriodIndex(all_data['periods'])
+
+    # في المزامنة التزايدية تُكمل الصفوف الجديدة ترقيم السجلات الموجودة بنفس الختم الزمني
+    occurrences = {}
+    if not prune:
+        for log in all_data['logs']:
+            key = (str(log.get('timestamp', '')), log.get('member_id'))
+            occurrences[key] = occurrences.get(key, 0) + 1
+
+    # فهرس في الذاكرة للإنجازات الفريدة (عضو، نوع الإنجاز، تحدي) بدلاً من استعلام Firestore لكل صف.
+    # في المطابقة الكاملة يبدأ فارغاً لأن جميع الإنجازات يُعاد اشتقاقها من الجدول.
+    achievement_index = set()
+    if not prune:
+        achievement_index = {(ach.get('member_id'), ach.get('achievement_type'), ach.get('period_id')) for ach in all_data['achievements']}
+
+    desired_logs, desired_achievements = {}, {}
 
+    rows = normalize_sheet_rows(df)
+    rows['member_id'] = rows['member_name'].map(member_map)
+    rows = rows[rows['member_id'].notna()]
+    entries_processed_count = len(rows)
+    period_positions = period_index.positions(rows['submission_date_dt'])
+
+    for row, period_position in zip(rows.itertuples(index=False), period_positions):
+        member_id = row.member_id
         log_data = {
-            "timestamp": timestamp, "member_id": member_id, "submission_date": submission_date_obj.strftime('%d/%m/%Y'),
-            "common_book_minutes": parse_duration_to_minutes(row.get('مدة قراءة الكتاب المشترك') or row.get('مدة قراءة الكتاب المشترك (اختياري)')),
-            "other_book_minutes": parse_duration_to_minutes(row.get('مدة قراءة كتاب آخر (إن وجد)') or row.get('مدة قراءة كتاب آخر (اختياري)')),
-            "submitted_common_quote": common_quote_today,
-            "submitted_other_quote": other_quote_today,
+            "timestamp": row.timestamp, "member_id": member_id, "submission_date": row.submission_date,
+            "common_book_minutes": int(row.common_book_minutes),
+            "other_book_minutes": int(row.other_book_minutes),
+            "submitted_common_quote": int(row.submitted_common_quote),
+            "submitted_other_quote": int(row.submitted_other_quote),
         }
+        occurrence_key = (row.timestamp, member_id)
+        occurrence = occurrences.get(occurrence_key, 0)
+        occurrences[occurrence_key] = occurrence + 1
+        log_id = _log_doc_id(row.timestamp, member_id, occurrence)
+        desired_logs[log_id] = log_data
 
-        achievements_to_add = []
-        achievement_responses = str(row.get('إنجازات الكتب والنقاش', '') or row.get('إنجازات الكتب والنقاش (اختر فقط عند حدوثه لأول مرة)', ''))
-        current_period = next((p for p in all_data['periods'] if datetime.strptime(p['start_date'], '%Y-%m-%d').date() <= submission_date_obj <= datetime.strptime(p['end_date'], '%Y-%m-%d').date()), None)
-
-        if current_period:
+        if period_position >= 0:
+            current_period = period_index.periods[period_position]
             period_id = current_period['periods_id']
-            if 'أنهيت الكتاب المشترك' in achievement_responses and not db.has_achievement(user_id, member_id, 'FINISHED_COMMON_BOOK', period_id):
-                achievements_to_add.append({'member_id': member_id, 'achievement_type': 'FINISHED_COMMON_BOOK', 'achievement_date': str(submission_date_obj), 'period_id': period_id, 'book_id': current_period['common_book_id']})
-            if 'حضرت جلسة النقاش' in achievement_responses and not db.has_achievement(user_id, member_id, 'ATTENDED_DISCUSSION', period_id):
-                achievements_to_add.append({'member_id': member_id, 'achievement_type': 'ATTENDED_DISCUSSION', 'achievement_date': str(submission_date_obj), 'period_id': period_id, 'book_id': None})
-            if 'أنهيت كتاباً آخر' in achievement_responses:
-                achievements_to_add.append({'member_id': member_id, 'achievement_type': 'FINISHED_OTHER_BOOK', 'achievement_date': str(submission_date_obj), 'period_id': period_id, 'book_id': None})
+            achievement_date = row.achievement_date
+            if row.finished_common_book and (member_id, 'FINISHED_COMMON_BOOK', period_id) not in achievement_index:
+                achievement_index.add((member_id, 'FINISHED_COMMON_BOOK', period_id))
+                ach_id = _achievement_doc_id(member_id, 'FINISHED_COMMON_BOOK', period_id)
+                desired_achievements[ach_id] = {'member_id': member_id, 'achievement_type': 'FINISHED_COMMON_BOOK', 'achievement_date': achievement_date, 'period_id': period_id, 'book_id': current_period['common_book_id']}
+            if row.attended_discussion and (member_id, 'ATTENDED_DISCUSSION', period_id) not in achievement_index:
+                achievement_index.add((member_id, 'ATTENDED_DISCUSSION', period_id))
+                ach_id = _achievement_doc_id(member_id, 'ATTENDED_DISCUSSION', period_id)
+                desired_achievements[ach_id] = {'member_id': member_id, 'achievement_type': 'ATTENDED_DISCUSSION', 'achievement_date': achievement_date, 'period_id': period_id, 'book_id': None}
+            if row.finished_other_book:
+                ach_id = _achievement_doc_id(member_id, 'FINISHED_OTHER_BOOK', period_id, log_id=log_id)
+                desired_achievements[ach_id] = {'member_id': member_id, 'achievement_type': 'FINISHED_OTHER_BOOK', 'achievement_date': achievement_date, 'period_id': period_id, 'book_id': None}
 
-        db.add_log_and_achievements(user_id, log_data, achievements_to_add)
-    return entries_processed_count
+    return desired_logs, desired_achievements, entries_processed_count
 
-def calculate_and_update_stats(user_id: str):
+def process_all_data(df, all_data, user_id: str, prune: bool = False):
     """
-    Calculates all statistics for a given user and updates their
-    member_stats subcollection in Firestore.
+    Processes rows from the Google Sheet and upserts them into the user's
+    database space in Firestore under deterministic document IDs, so re-running
+    it only writes documents that are new or changed.
+
+    Args:
+        df (pd.DataFrame): The sheet rows to process.
+        all_data (dict): The current workspace data from `get_all_data_for_stats`.
+        user_id (str): The unique ID of the user (admin) to sync data for.
+        prune (bool): When True, `df` is the complete sheet and any existing log or
+                      achievement that no longer derives from it is deleted.
+
+    Returns:
+        dict: Counters describing what was processed, written and removed, plus all log
+            and achievement documents after the sync ('logs', 'achievements') and the documents that did not exist
+            before ('new_logs', 'new_achievements').
     """
-    all_data = db.get_all_data_for_stats(user_id)
-    if not all_data or not all_data.get("members"): return
+    desired_logs, desired_achievements, entries_processed_count = plan_sheet_documents(df, all_data, prune=prune)
+    existing_logs = {log['logs_id']: log for log in all_data['logs']}
+    existing_achievements = {ach['achievements_id']: ach for ach in all_data['achievements']}
+
+    # جميع الكتابات والحذوفات تمر عبر خط كتابة واحد يرسلها في دفعات كاملة متزامنة
+    logs_removed, achievements_removed = 0, 0
+    with db.BatchWriter() as writer:
+        logs_written = db.upsert_documents(user_id, 'logs', desired_logs, existing_logs, writer=writer)
+        achievements_written = db.upsert_documents(user_id, 'achievements', desired_achievements, existing_achievements, writer=writer)
+        if prune:
+            logs_removed = db.delete_documents(user_id, 'logs', [doc_id for doc_id in existing_logs if doc_id not in desired_logs], writer=writer)
+            achievements_removed = db.delete_documents(user_id, 'achievements', [doc_id for doc_id in existing_achievements if doc_id not in desired_achievements], writer=writer)
+
+    return {
+        "processed": entries_processed_count,
+        "logs_written": logs_written,
+        "logs_unchanged": len(desired_logs) - logs_written,
+        "logs_removed": logs_removed,
+        "achievements_written": achievements_written,
+        "achievements_removed": achievements_removed,
+        "ops_written": writer.written,
+        "ops_failed": writer.failed,
+        "logs": desired_logs if prune else {**existing_logs, **desired_logs},
+        "achievements": desired_achievements if prune else {**existing_achievements, **desired_achievements},
+        "new_logs": {doc_id: log for doc_id, log in desired_logs.items() if doc_id not in existing_logs},
+        "new_achievements": {doc_id: ach for doc_id, ach in desired_achievements.items() if doc_id not in existing_achievements},
+    }
 
-    periods_map = {p['periods_id']: p for p in all_data["periods"]}
-    logs_df = pd.DataFrame(all_data["logs"])
+# قواعد النقاط الخاصة بكل تحدي
+LOG_RULE_KEYS = ['minutes_per_point_common', 'minutes_per_point_other', 'quote_common_book_points', 'quote_other_book_points']
+ACHIEVEMENT_RULE_KEYS = {
+    'FINISHED_COMMON_BOOK': 'finish_common_book_points',
+    'ATTENDED_DISCUSSION': 'attend_discussion_points',
+    'FINISHED_OTHER_BOOK': 'finish_other_book_points',
+}
+LOG_NUMERIC_COLUMNS = ['common_book_minutes', 'other_book_minutes', 'submitted_common_quote', 'submitted_other_quote']
+
+def _rule_value(period: dict, key: str):
+    """
+    Returns a numeric rule of a period, treating missing values as 0.
+    """
+    value = pd.to_numeric(period.get(key, 0), errors='coerce')
+    return 0 if pd.isna(value) else value
 
+def prepare_logs(logs_df):
+    """
+    Returns a copy of the logs with a parsed `submission_date_dt` (datetime64, NaT when
+    invalid) and the numeric columns coerced to ints.
+    """
+    logs_df = logs_df.copy()
+    logs_df['submission_date_dt'] = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce')
+    for col in LOG_NUMERIC_COLUMNS:
+        logs_df[col] = pd.to_numeric(logs_df[col], errors='coerce').fillna(0).astype(int)
+    return logs_df
+
+def score_logs(logs_df, period_index: PeriodIndex):
+    """
+    Assigns every log to its challenge in one vectorised pass and computes the points
+    it earns under that challenge's `minutes_per_point_*` and `quote_*` rules.
+
+    Args:
+        logs_df (pd.DataFrame): Logs prepared with `prepare_logs`.
+        period_index (PeriodIndex): The workspace's challenges.
+
+    Returns:
+        pd.DataFrame: A copy of the logs with `period_position`, `common_reading_points`,
+            `other_reading_points`, `common_quote_points`, `other_quote_points` and `points`.
+            Logs outside every challenge earn no points.
+    """
+    scored = logs_df.copy()
+    positions = period_index.positions(scored['submission_date_dt'])
+    scored['period_position'] = positions
+
+    # عمود إضافي بقيمة 0 في نهاية كل مصفوفة قواعد بحيث يشير الموضع -1 إلى "لا نقاط"
+    rules = {key: np.array([_rule_value(p, key) for p in period_index.periods] + [0]) for key in LOG_RULE_KEYS}
+
+    for minutes_col, rule_key, points_col in [
+        ('common_book_minutes', 'minutes_per_point_common', 'common_reading_points'),
+        ('other_book_minutes', 'minutes_per_point_other', 'other_reading_points'),
+    ]:
+        minutes_per_point = rules[rule_key][positions]
+        divisor = np.where(minutes_per_point > 0, minutes_per_point, 1)
+        scored[points_col] = np.where(minutes_per_point > 0, scored[minutes_col].to_numpy() // divisor, 0)
+
+    scored['common_quote_points'] = scored['submitted_common_quote'].to_numpy() * rules['quote_common_book_points'][positions]
+    scored['other_quote_points'] = scored['submitted_other_quote'].to_numpy() * rules['quote_other_book_points'][positions]
+    scored['points'] = scored['common_reading_points'] + scored['other_reading_points'] + scored['common_quote_points'] + scored['other_quote_points']
+    return scored
+
+def score_achievements(achievements_df, periods_map: dict):
+    """
+    Returns a copy of the achievements with the `points` each one earns under the rules
+    of the challenge it belongs to (0 when the challenge no longer exists).
+    """
+    scored = achievements_df.copy()
+    period_ids = scored['period_id'] if 'period_id' in scored.columns else pd.Series(None, index=scored.index, dtype=object)
+    rule_keys = scored['achievement_type'].map(ACHIEVEMENT_RULE_KEYS)
+    scored['points'] = [
+        _rule_value(periods_map[period_id], rule_key) if isinstance(rule_key, str) and period_id in periods_map else 0
+        for period_id, rule_key in zip(period_ids, rule_keys)
+    ]
+    return scored
+
+def compute_member_stats(members: list, logs_df, achievements_df, periods: list):
+    """
+    Vectorised scoring engine: computes every member's `member_stats` record with one
+    groupby over the scored logs and one over the scored achievements.
+
+    Args:
+        members (list): Member records with 'members_id'.
+        logs_df (pd.DataFrame): Raw log records as stored in Firestore.
+        achievements_df (pd.DataFrame): Raw achievement records as stored in Firestore.
+        periods (list): Period records including their point rules.
+
+    Returns:
+        list: One stats dict per member, in the order of `members`.
+    """
+    periods_map = {p['periods_id']: p for p in periods}
+    log_totals, last_quote_dates = {}, {}
     if not logs_df.empty:
-        logs_df['submission_date_dt'] = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce').dt.date
-        numeric_cols = ['common_book_minutes', 'other_book_minutes', 'submitted_common_quote', 'submitted_other_quote']
-        for col in numeric_cols:
-            logs_df[col] = pd.to_numeric(logs_df[col], errors='coerce').fillna(0).astype(int)
+        scored_logs = score_logs(prepare_logs(logs_df), PeriodIndex(periods))
+        log_totals = scored_logs.groupby('member_id').agg(
+            points=('points', 'sum'),
+            total_reading_minutes_common=('common_book_minutes', 'sum'),
+            total_reading_minutes_other=('other_book_minutes', 'sum'),
+            common_quotes=('submitted_common_quote', 'sum'),
+            other_quotes=('submitted_other_quote', 'sum'),
+            last_log_date=('submission_date_dt', 'max'),
+        ).to_dict('index')
+        quote_logs = scored_logs[(scored_logs['submitted_common_quote'] == 1) | (scored_logs['submitted_other_quote'] == 1)]
+        last_quote_dates = quote_logs.groupby('member_id')['submission_date_dt'].max().to_dict()
 
-    achievements_df = pd.DataFrame(all_data["achievements"])
-    final_member_stats_data = []
+    achievement_totals = {}
+    if not achievements_df.empty:
+        scored_achievements = score_achievements(achievements_df, periods_map)
+        achievement_counts = scored_achievements.groupby(['member_id', 'achievement_type']).size().unstack(fill_value=0)
+        achievement_counts['points'] = scored_achievements.groupby('member_id')['points'].sum()
+        achievement_totals = achievement_counts.to_dict('index')
+
+    def _date_str(value):
+        return value.strftime('%Y-%m-%d') if value is not None and pd.notna(value) else None
 
-    for member in all_data["members"]:
+    final_member_stats_data = []
+    for member in members:
         member_id = member['members_id']
+        logs = log_totals.get(member_id, {})
+        achievements = achievement_totals.get(member_id, {})
+        final_member_stats_data.append({
+            "member_id": member_id,
+            "total_points": int(logs.get('points', 0) + achievements.get('points', 0)),
+            "total_reading_minutes_common": int(logs.get('total_reading_minutes_common', 0)),
+            "total_reading_minutes_other": int(logs.get('total_reading_minutes_other', 0)),
+            "total_common_books_read": int(achievements.get('FINISHED_COMMON_BOOK', 0)),
+            "total_other_books_read": int(achievements.get('FINISHED_OTHER_BOOK', 0)),
+            "total_quotes_submitted": int(logs.get('common_quotes', 0) + logs.get('other_quotes', 0)),
+            "meetings_attended": int(achievements.get('ATTENDED_DISCUSSION', 0)),
+            "last_log_date": _date_str(logs.get('last_log_date')),
+            "last_quote_date": _date_str(last_quote_dates.get(member_id)),
+        })
+    return final_member_stats_data
+
+# أعمدة الملخص اليومي التي تُجمع لكل عضو في كل يوم
+ROLLUP_SUM_COLUMNS = LOG_NUMERIC_COLUMNS + ['common_reading_points', 'other_reading_points', 'common_quote_points', 'other_quote_points']
+# حقول السجلات التي يحتاجها بناء الملخص اليومي (تُقرأ وحدها بدلاً من المستندات كاملة)
+ROLLUP_LOG_FIELDS = ['member_id', 'submission_date'] + LOG_NUMERIC_COLUMNS
+
+def build_daily_rollup(logs_df, periods: list):
+    """
+    Collapses logs into one row per member per day, the granularity every
+    dashboard chart and hero metric works at.
+
+    Points are scored per log under the challenge rules before summing, so the
+    rollup's point columns equal the sums the scoring engine produces.
+
+    Returns:
+        pd.DataFrame: 'member_id', 'date' ('YYYY-MM-DD'), 'logs_count' and the
+            summed `ROLLUP_SUM_COLUMNS`, as ints. Logs without a valid date are dropped.
+    """
+    columns = ['member_id', 'date', 'logs_count'] + ROLLUP_SUM_COLUMNS
+    if logs_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    scored = score_logs(prepare_logs(logs_df), PeriodIndex(periods))
+    scored = scored[scored['submission_date_dt'].notna()]
+    scored['date'] = scored['submission_date_dt'].dt.strftime('%Y-%m-%d')
+    rollup = scored.groupby(['member_id', 'date']).agg(
+        logs_count=('member_id', 'size'),
+        **{col: (col, 'sum') for col in ROLLUP_SUM_COLUMNS}
+    ).reset_index()
+    for col in ['logs_count'] + ROLLUP_SUM_COLUMNS:
+        rollup[col] = rollup[col].astype(int)
+    return rollup[columns]
+
+def load_daily_rollup(user_id: str, periods: list, data_versions: dict = None):
+    """
+    Returns the stored daily rollup, or builds it from the raw logs when it has
+    not been written yet (e.g. for a workspace not synced since the rollup existed).
+    `data_versions` (see `db.get_data_versions`) lets the reads use the local snapshot.
+    """
+    data_versions = data_versions or {}
+    rollup_df = db.get_daily_rollup_df(user_id, data_versions.get('daily_rollup'))
+    if rollup_df.empty:
+        rollup_df = build_daily_rollup(db.get_subcollection_as_df(user_id, 'logs', data_versions.get('logs'), fields=ROLLUP_LOG_FIELDS), periods)
+    return rollup_df
+
+def merge_daily_rollups(rollups: list):
+    """
+    Combines daily rollups built from disjoint sets of logs into one, as
+    `build_daily_rollup` would have returned for all of them together.
+    """
+    columns = ['member_id', 'date', 'logs_count'] + ROLLUP_SUM_COLUMNS
+    rollups = [rollup for rollup in rollups if not rollup.empty]
+    if not rollups:
+        return pd.DataFrame(columns=columns)
+    merged = pd.concat(rollups, ignore_index=True).groupby(['member_id', 'date'])[columns[2:]].sum().reset_index()
+    return merged[columns].astype({col: int for col in columns[2:]})
+
+def rebuild_daily_rollup(user_id: str):
+    """
+    Rebuilds the stored daily rollup from all logs. The logs are read and
+    rolled up one page at a time, so they are never all held in memory.
+    """
+    periods = db.get_sync_config(user_id)['periods']
+    rollups = [build_daily_rollup(chunk, periods) for chunk in db.iter_subcollection_chunks(user_id, 'logs', fields=ROLLUP_LOG_FIELDS)]
+    db.save_daily_rollup(user_id, merge_daily_rollups(rollups))
+
+# أعمدة لوحة الشرف في لقطة التحدي
+PODIUM_COLUMNS = ['member_id', 'name', 'total_points', 'total_reading_minutes_common', 'total_reading_minutes_other', 'total_quotes_submitted']
+
+def _columns_dict(df, columns):
+    """
+    Packs a DataFrame as one plain-Python list per column (the Firestore-friendly
+    layout also used by the daily rollup).
+    """
+    return {col: [value.item() if isinstance(value, np.generic) else value for value in df[col].tolist()] for col in columns}
+
+def build_challenge_snapshots(members: list, rollup_df, achievements_df, periods: list):
+    """
+    Precomputes everything the challenge analytics page shows for each challenge,
+    so the page renders a challenge from a single document.
+
+    Podium points follow the page's rules: a member's minutes in the challenge are
+    summed before dividing by `minutes_per_point_*`, and only members who logged
+    reading in the challenge are ranked.
+
+    Args:
+        members (list): Member records with 'members_id' and 'name'.
+        rollup_df (pd.DataFrame): The daily rollup from `build_daily_rollup`, or its compact form.
+        achievements_df (pd.DataFrame): Raw achievement records as stored in Firestore.
+        periods (list): Period records including their point rules.
+
+    Returns:
+        dict: A snapshot per period ID holding the 'podium' and 'daily_totals' (as column
+            lists), the 'participants', 'finishers' and 'attendees' names, the challenge's
+            'achievements' and the KPI totals 'total_minutes', 'total_quotes' and
+            'active_participants'.
+    """
+    period_index = PeriodIndex(periods)
+    members_df = pd.DataFrame(members, columns=['members_id', 'name'])
+    member_names = dict(zip(members_df['members_id'], members_df['name']))
+    member_order = {member_id: i for i, member_id in enumerate(members_df['members_id'])}
+
+    def _names(member_ids):
+        # بنفس ترتيب قائمة الأعضاء، مع تجاهل من لم يعد موجوداً
+        return [member_names[m] for m in sorted(set(member_ids) & member_names.keys(), key=member_order.get)]
 
-        member_stats = {
-            "member_id": member_id, "total_points": 0, "total_reading_minutes_common": 0,
-            "total_reading_minutes_other": 0, "total_common_books_read": 0,
-            "total_other_books_read": 0, "total_quotes_submitted": 0,
-            "meetings_attended": 0, "last_log_date": None, "last_quote_date": None
+    rollup = pd.DataFrame(columns=['member_id', 'date'] + LOG_NUMERIC_COLUMNS)
+    if not rollup_df.empty:
+        # يقبل أيضاً الملخص بالمخطط المضغوط (db.compact_logs_frame) الذي يحمل التاريخ كـ datetime
+        dates = rollup_df['date'] if 'date' in rollup_df.columns else rollup_df['submission_date_dt'].dt.strftime('%Y-%m-%d')
+        # أعمدة المخطط المضغوط من أنواع صغيرة (uint8/uint16) تبقى كذلك بعد الجمع، فتُوسَّع قبل جمع عمودين أو ضربهما
+        rollup = rollup_df.assign(
+            member_id=rollup_df['member_id'].astype(object), date=dates,
+            period_position=period_index.positions(dates),
+            **{col: rollup_df[col].astype('int64') for col in LOG_NUMERIC_COLUMNS},
+        )
+        rollup = rollup[rollup['period_position'] >= 0]
+    rollup_by_period = dict(tuple(rollup.groupby('period_position'))) if not rollup.empty else {}
+
+    achievements = pd.DataFrame(columns=['member_id', 'achievement_type', 'achievement_date', 'period_id'])
+    if not achievements_df.empty:
+        # ترتيب ثابت حتى لا تتغير اللقطة (وتُعاد كتابتها) بتغير ترتيب القراءة فقط
+        achievements = achievements_df.reindex(columns=achievements.columns).astype(object).fillna({'achievement_date': ''})
+        achievements = achievements.sort_values(['achievement_date', 'member_id', 'achievement_type'], kind='stable')
+    achievements_by_period = dict(tuple(achievements.groupby('period_id'))) if not achievements.empty else {}
+
+    snapshots = {}
+    for position, period in enumerate(period_index.periods):
+        period_id = period['periods_id']
+        period_rollup = rollup_by_period.get(position, rollup.iloc[0:0])
+        period_achievements = achievements_by_period.get(period_id, achievements.iloc[0:0])
+
+        totals = period_rollup.groupby('member_id')[LOG_NUMERIC_COLUMNS].sum()
+        totals = totals[totals.index.isin(member_names.keys())]
+        points = pd.Series(0, index=totals.index, dtype='int64')
+        for minutes_col, rule_key in [('common_book_minutes', 'minutes_per_point_common'), ('other_book_minutes', 'minutes_per_point_other')]:
+            minutes_per_point = _rule_value(period, rule_key)
+            if minutes_per_point > 0:
+                points += (totals[minutes_col] // minutes_per_point).astype('int64')
+        points += (totals['submitted_common_quote'] * _rule_value(period, 'quote_common_book_points')).astype('int64')
+        points += (totals['submitted_other_quote'] * _rule_value(period, 'quote_other_book_points')).astype('int64')
+        achievement_points = period_achievements['achievement_type'].map(
+            lambda t: _rule_value(period, ACHIEVEMENT_RULE_KEYS[t]) if t in ACHIEVEMENT_RULE_KEYS else 0
+        )
+        points += achievement_points.groupby(period_achievements['member_id']).sum().reindex(totals.index, fill_value=0).astype('int64')
+
+        podium = pd.DataFrame({
+            'member_id': totals.index,
+            'name': totals.index.map(member_names),
+            'total_points': points.to_numpy(),
+            'total_reading_minutes_common': totals['common_book_minutes'].astype(int).to_numpy(),
+            'total_reading_minutes_other': totals['other_book_minutes'].astype(int).to_numpy(),
+            'total_quotes_submitted': (totals['submitted_common_quote'] + totals['submitted_other_quote']).astype(int).to_numpy(),
+        })
+        podium = podium.sort_values('member_id', key=lambda ids: ids.map(member_order))
+
+        daily = period_rollup.groupby('date').agg(
+            common_book_minutes=('common_book_minutes', 'sum'),
+            other_book_minutes=('other_book_minutes', 'sum'),
+            submitted_common_quote=('submitted_common_quote', 'sum'),
+            submitted_other_quote=('submitted_other_quote', 'sum'),
+            active_members=('member_id', 'nunique'),
+        ).reset_index()
+        daily['total_minutes'] = daily['common_book_minutes'] + daily['other_book_minutes']
+        daily['total_quotes'] = daily['submitted_common_quote'] + daily['submitted_other_quote']
+
+        snapshots[period_id] = {
+            'podium': _columns_dict(podium, PODIUM_COLUMNS),
+            'daily_totals': _columns_dict(daily, ['date', 'total_minutes', 'total_quotes', 'active_members']),
+            'participants': _names(period_rollup['member_id']),
+            'finishers': _names(period_achievements.loc[period_achievements['achievement_type'] == 'FINISHED_COMMON_BOOK', 'member_id']),
+            'attendees': _names(period_achievements.loc[period_achievements['achievement_type'] == 'ATTENDED_DISCUSSION', 'member_id']),
+            'achievements': _columns_dict(period_achievements, ['member_id', 'achievement_type', 'achievement_date']),
+            'total_minutes': int(daily['total_minutes'].sum()),
+            'total_quotes': int(daily['total_quotes'].sum()),
+            'active_participants': int(period_rollup['member_id'].nunique()),
         }
+    return snapshots
+
+def rebuild_challenge_snapshots(user_id: str):
+    """
+    Rebuilds the stored challenge snapshots from the daily rollup and all achievements.
+    """
+    sync_config = db.get_sync_config(user_id)
+    rollup_df = load_daily_rollup(user_id, sync_config['periods'])
+    achievements_df = db.get_subcollection_as_df(user_id, 'achievements')
+    db.save_challenge_snapshots(user_id, build_challenge_snapshots(sync_config['members'], rollup_df, achievements_df, sync_config['periods']))
+
+# حقول member_stats التي تُجمع، وتلك التي يؤخذ أحدثها، عند تطبيق الفروقات
+STATS_SUM_FIELDS = [
+    'total_points', 'total_reading_minutes_common', 'total_reading_minutes_other',
+    'total_common_books_read', 'total_other_books_read', 'total_quotes_submitted', 'meetings_attended',
+]
+STATS_LATEST_FIELDS = ['last_log_date', 'last_quote_date']
+
+def apply_stats_deltas(user_id: str, members: list, periods: list, new_logs: list, new_achievements: list):
+    """
+    Adds the contribution of newly synced logs and achievements to the
+    `member_stats` documents of the members they belong to, instead of
+    recomputing every member from all logs.
+
+    Every stat is additive per log or achievement (points only depend on the
+    log's own challenge rules), except the last log/quote dates, which take
+    the latest of the stored and new values.
+
+    Args:
+        members (list): Member records with 'members_id'.
+        periods (list): Period records including their point rules.
+        new_logs (list): Log documents that did not exist before this sync.
+        new_achievements (list): Achievement documents that did not exist before this sync.
+
+    Returns:
+        dict | None: 'updated' (the number of members updated) and 'failed' (member_stats
+            writes that failed), or None if a member's stats document is missing and a full
+            recompute (`calculate_and_update_stats`) is needed instead.
+    """
+    member_ids = {member['members_id'] for member in members}
+    affected_ids = {doc['member_id'] for doc in new_logs + new_achievements if doc.get('member_id') in member_ids}
+    if not affected_ids:
+        return {'updated': 0, 'failed': 0}
+
+    affected_members = [member for member in members if member['members_id'] in affected_ids]
+    deltas = compute_member_stats(affected_members, pd.DataFrame(new_logs), pd.DataFrame(new_achievements), periods)
+    current_stats = db.get_documents(user_id, 'member_stats', sorted(affected_ids))
+    if len(current_stats) != len(affected_ids):
+        return None
+
+    updated_stats = {}
+    for delta in deltas:
+        member_id = delta['member_id']
+        stats = dict(current_stats[member_id])
+        for field in STATS_SUM_FIELDS:
+            stats[field] = int(stats.get(field) or 0) + delta[field]
+        for field in STATS_LATEST_FIELDS:
+            # التواريخ محفوظة بصيغة YYYY-MM-DD فتكفي المقارنة النصية
+            stats[field] = max((value for value in (stats.get(field), delta[field]) if value), default=None)
+        updated_stats[member_id] = stats
+    with db.BatchWriter() as writer:
+        written = db.upsert_documents(user_id, 'member_stats', updated_stats, current_stats, writer=writer)
+    if written:
+        db.bump_data_versions(user_id, ['member_stats'])
+    return {'updated': len(updated_stats), 'failed': writer.failed}
+
+def calculate_and_update_stats(user_id: str):
+    """
+    Calculates all statistics for a given user from scratch and rebuilds
+    their member_stats subcollection in Firestore. Incremental syncs use
+    `apply_stats_deltas` instead; this is the explicit full rebuild.
+
+    Returns:
+        dict: The 'written', 'removed' and 'failed' counts from `db.rebuild_stats_tables`.
+    """
+    all_data = db.get_all_data_for_stats(user_id)
+    if not all_data or not all_data.get("members"):
+        return {'written': 0, 'removed': 0, 'failed': 0}
 
-        member_logs_df = logs_df[logs_df['member_id'] == member_id] if not logs_df.empty else pd.DataFrame()
-        member_achievements_df = achievements_df[achievements_df['member_id'] == member_id] if not achievements_df.empty else pd.DataFrame()
-
-        if not member_logs_df.empty:
-            for index, log in member_logs_df.iterrows():
-                log_date = log['submission_date_dt']
-                if pd.isna(log_date): continue
-
-                log_period = next((p for p in all_data['periods'] if datetime.strptime(p['start_date'], '%Y-%m-%d').date() <= log_date <= datetime.strptime(p['end_date'], '%Y-%m-%d').date()), None)
-
-                if log_period:
-                    if log_period.get('minutes_per_point_common', 0) > 0:
-                        member_stats['total_points'] += log['common_book_minutes'] // log_period['minutes_per_point_common']
-                    if log_period.get('minutes_per_point_other', 0) > 0:
-                        member_stats['total_points'] += log['other_book_minutes'] // log_period['minutes_per_point_other']
-
-                    member_stats['total_points'] += log['submitted_common_quote'] * log_period.get('quote_common_book_points', 0)
-                    member_stats['total_points'] += log['submitted_other_quote'] * log_period.get('quote_other_book_points', 0)
-
-        if not member_achievements_df.empty:
-            for index, achievement in member_achievements_df.iterrows():
-                period_id = achievement.get('period_id')
-                if period_id in periods_map:
-                    achievement_period_rules = periods_map[period_id]
-
-                    if achievement['achievement_type'] == 'FINISHED_COMMON_BOOK':
-                        member_stats['total_points'] += achievement_period_rules.get('finish_common_book_points', 0)
-                    elif achievement['achievement_type'] == 'ATTENDED_DISCUSSION':
-                        member_stats['total_points'] += achievement_period_rules.get('attend_discussion_points', 0)
-                    elif achievement['achievement_type'] == 'FINISHED_OTHER_BOOK':
-                        member_stats['total_points'] += achievement_period_rules.get('finish_other_book_points', 0)
-
-        if not member_logs_df.empty:
-            member_stats['total_reading_minutes_common'] = int(member_logs_df['common_book_minutes'].sum())
-            member_stats['total_reading_minutes_other'] = int(member_logs_df['other_book_minutes'].sum())
-            member_stats['total_quotes_submitted'] = int(member_logs_df['submitted_common_quote'].sum() + member_logs_df['submitted_other_quote'].sum())
-            if not member_logs_df['submission_date_dt'].isnull().all():
-                member_stats['last_log_date'] = str(member_logs_df['submission_date_dt'].max())
-            quote_logs = member_logs_df[(member_logs_df['submitted_common_quote'] == 1) | (member_logs_df['submitted_other_quote'] == 1)]
-            if not quote_logs.empty and not quote_logs['submission_date_dt'].isnull().all():
-                member_stats['last_quote_date'] = str(quote_logs['submission_date_dt'].max())
-
-        if not member_achievements_df.empty:
-            member_stats['total_common_books_read'] = len(member_achievements_df[member_achievements_df['achievement_type'] == 'FINISHED_COMMON_BOOK'])
-            member_stats['total_other_books_read'] = len(member_achievements_df[member_achievements_df['achievement_type'] == 'FINISHED_OTHER_BOOK'])
-            member_stats['meetings_attended'] = len(member_achievements_df[member_achievements_df['achievement_type'] == 'ATTENDED_DISCUSSION'])
-
-        final_member_stats_data.append(member_stats)
-
-    db.rebuild_stats_tables(user_id, final_member_stats_data)
\ No newline at end of file
+    final_member_stats_data = compute_member_stats(
+        all_data["members"],
+        pd.DataFrame(all_data["logs"]),
+        pd.DataFrame(all_data["achievements"]),
+        all_data["periods"],
+    )
+    return db.rebuild_stats_tables(user_id, final_member_stats_data)
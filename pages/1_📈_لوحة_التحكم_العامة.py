@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, timedelta, datetime
-import db_manager as db
 import chart_generator as charts # <-- استيراد الوحدة الجديدة
 from pdf_reporter import PDFReporter
 import auth_manager
+import data_service
 import style_manager
 
 style_manager.apply_sidebar_styles()
@@ -189,15 +189,19 @@ def get_heroes_at_date(target_date, logs_df, achievements_df, members_df):
 
     # Calculate stats
     # 1. Total Points and Reading Minutes from logs
-    member_stats = logs_past.groupby('member_id').agg(
+    member_stats = logs_past.groupby('member_id', observed=True).agg(
         total_reading_minutes_common=('common_book_minutes', 'sum'),
         total_reading_minutes_other=('other_book_minutes', 'sum'),
         total_quotes_submitted=('total_quotes_submitted', 'sum')
     ).reset_index()
+    # Sums of the compact (uint8/uint16) columns keep their narrow dtype; widen before adding them
+    member_stats = member_stats.astype({
+        'total_reading_minutes_common': 'int64', 'total_reading_minutes_other': 'int64', 'total_quotes_submitted': 'int64',
+    })
 
     # 2. Total books and meetings attended from achievements
     if not achievements_past.empty:
-        ach_stats = achievements_past.groupby('member_id').agg(
+        ach_stats = achievements_past.groupby('member_id', observed=True).agg(
             total_common_books_read=('achievement_type', lambda x: (x == 'FINISHED_COMMON_BOOK').sum()),
             total_other_books_read=('achievement_type', lambda x: (x == 'FINISHED_OTHER_BOOK').sum()),
         ).reset_index()
@@ -316,31 +320,11 @@ def generate_headline_news(logs_df, achievements_df, members_df):
 
 
 # --- Data Loading ---
-@st.cache_data(ttl=300)
-def load_all_data(user_id):
-    all_data = db.get_all_data_for_stats(user_id)
-    members_df = pd.DataFrame(all_data.get('members', []))
-    periods_df = pd.DataFrame(all_data.get('periods', []))
-    logs_df = pd.DataFrame(all_data.get('logs', []))
-    achievements_df = pd.DataFrame(all_data.get('achievements', []))
-    member_stats_df = db.get_subcollection_as_df(user_id, 'member_stats')
-    return members_df, periods_df, logs_df, achievements_df, member_stats_df
-
-members_df, periods_df, logs_df, achievements_df, member_stats_df = load_all_data(user_id)
-
-# --- Data Processing ---
-if not logs_df.empty:
-    logs_df['submission_date_dt'] = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce')
-    logs_df['total_minutes'] = logs_df['common_book_minutes'] + logs_df['other_book_minutes']
-    logs_df['total_quotes_submitted'] = logs_df['submitted_common_quote'] + logs_df['submitted_other_quote']
-
-
-if not achievements_df.empty:
-    achievements_df['achievement_date_dt'] = pd.to_datetime(achievements_df['achievement_date'], errors='coerce')
-    
-if not member_stats_df.empty and not members_df.empty:
-    member_stats_df.rename(columns={'member_stats_id': 'members_id'}, inplace=True, errors='ignore')
-    member_stats_df = pd.merge(member_stats_df, members_df[['members_id', 'name']], on='members_id', how='left')
+# نسخة واحدة مشتركة من بيانات مساحة العمل لجميع الصفحات؛ جميع حسابات هذه الصفحة على مستوى اليوم،
+# لذا تكون السجلات هي الملخص اليومي (صف لكل عضو لكل يوم) بمخطط مضغوط
+workspace = data_service.get_workspace(user_id)
+members_df, periods_df = workspace['members'], workspace['periods']
+logs_df, achievements_df, member_stats_df = workspace['logs'], workspace['achievements'], workspace['member_stats']
 
 
 # --- Page Rendering ---
@@ -7,6 +7,8 @@ import plotly.graph_objects as go
 from pdf_reporter import PDFReporter
 import auth_manager
 from utils import apply_chart_theme
+from main import build_challenge_snapshots
+import data_service
 import style_manager
 
 style_manager.apply_sidebar_styles()
@@ -136,18 +138,11 @@ def calculate_detailed_points_sources(member_id, member_logs_df, member_achievem
     }
 
     if not member_logs_df.empty:
-        for _, log in member_logs_df.iterrows():
-            log_date = log['submission_date_dt'].date()
-            log_period = next((p for p in periods_map.values() if datetime.strptime(p['start_date'], '%Y-%m-%d').date() <= log_date <= datetime.strptime(p['end_date'], '%Y-%m-%d').date()), None)
-            
-            if log_period:
-                if log_period.get('minutes_per_point_common', 0) > 0:
-                    points_breakdown['قراءة الكتاب المشترك'] += log['common_book_minutes'] // log_period['minutes_per_point_common']
-                if log_period.get('minutes_per_point_other', 0) > 0:
-                    points_breakdown['قراءة كتب أخرى'] += log['other_book_minutes'] // log_period['minutes_per_point_other']
-                
-                points_breakdown['اقتباسات (الكتاب المشترك)'] += log['submitted_common_quote'] * log_period.get('quote_common_book_points', 0)
-                points_breakdown['اقتباسات (كتب أخرى)'] += log['submitted_other_quote'] * log_period.get('quote_other_book_points', 0)
+        # نقاط القراءة والاقتباسات محسوبة لكل سجل وفق قواعد تحديه عند كتابة الملخص اليومي
+        points_breakdown['قراءة الكتاب المشترك'] += int(member_logs_df['common_reading_points'].sum())
+        points_breakdown['قراءة كتب أخرى'] += int(member_logs_df['other_reading_points'].sum())
+        points_breakdown['اقتباسات (الكتاب المشترك)'] += int(member_logs_df['common_quote_points'].sum())
+        points_breakdown['اقتباسات (كتب أخرى)'] += int(member_logs_df['other_quote_points'].sum())
 
     if not member_achievements_df.empty:
         for _, ach in member_achievements_df.iterrows():
@@ -285,28 +280,15 @@ def generate_challenge_news(period_achievements_df, members_df, start_date_obj,
 
 # --- Data Loading ---
 @st.cache_data(ttl=300)
-def load_all_data(user_id):
-    all_data = db.get_all_data_for_stats(user_id)
-    members_df = pd.DataFrame(all_data.get('members', []))
-    periods_df = pd.DataFrame(all_data.get('periods', []))
-    logs_df = pd.DataFrame(all_data.get('logs', []))
-    achievements_df = pd.DataFrame(all_data.get('achievements', []))
-    member_stats_df = db.get_subcollection_as_df(user_id, 'member_stats')
-    if not member_stats_df.empty and not members_df.empty:
-        member_stats_df.rename(columns={'member_stats_id': 'members_id'}, inplace=True, errors='ignore')
-        member_stats_df = pd.merge(member_stats_df, members_df[['members_id', 'name']], on='members_id', how='left')
-
-    return members_df, periods_df, logs_df, achievements_df, member_stats_df
-
-members_df, periods_df, logs_df, achievements_df, member_stats_df = load_all_data(user_id)
-
-# --- Data Processing ---
-if not logs_df.empty:
-    logs_df['submission_date_dt'] = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce')
-    logs_df['total_minutes'] = logs_df['common_book_minutes'] + logs_df['other_book_minutes']
+def load_challenge_snapshot(user_id, period_id, snapshots_version):
+    # إصدار اللقطات جزء من مفتاح الذاكرة المؤقتة فقط: كل كتابة للقطات تغيّره فتُقرأ اللقطة من جديد
+    return db.get_challenge_snapshot(user_id, period_id)
 
-if not achievements_df.empty:
-    achievements_df['achievement_date_dt'] = pd.to_datetime(achievements_df['achievement_date'], errors='coerce')
+# نسخة واحدة مشتركة من بيانات مساحة العمل لجميع الصفحات؛ السجلات هي الملخص اليومي
+# (صف لكل عضو لكل يوم، مع نقاط محسوبة لكل سجل) بمخطط مضغوط
+workspace = data_service.get_workspace(user_id)
+members_df, periods_df = workspace['members'], workspace['periods']
+logs_df, achievements_df, member_stats_df = workspace['logs'], workspace['achievements'], workspace['member_stats']
 
 # --- Page Rendering ---
 st.header("🎯 تحليلات التحديات")
@@ -365,67 +347,26 @@ if selected_period_id:
     start_date_obj = datetime.strptime(selected_challenge_data['start_date'], '%Y-%m-%d').date()
     end_date_obj = datetime.strptime(selected_challenge_data['end_date'], '%Y-%m-%d').date()
     
-    period_logs_df = pd.DataFrame()
-    if not logs_df.empty:
-        period_logs_df = logs_df[(logs_df['submission_date_dt'].notna()) & (logs_df['submission_date_dt'].dt.date >= start_date_obj) & (logs_df['submission_date_dt'].dt.date <= end_date_obj)].copy()
-    
-    period_achievements_df = pd.DataFrame()
-    if not achievements_df.empty:
-        period_achievements_df = achievements_df[achievements_df['period_id'] == selected_period_id].copy()
-
-    podium_df = pd.DataFrame()
-    all_participants_names = []
+    snapshot = load_challenge_snapshot(user_id, selected_period_id, workspace['data_versions'].get('challenge_snapshots'))
+    if snapshot is None:
+        # لم تُكتب لقطة هذا التحدي بعد (مثلاً قبل أول مزامنة)، فتُحسب من البيانات المحملة
+        snapshot = build_challenge_snapshots(
+            members_df.to_dict('records'), logs_df, achievements_df, periods_df.to_dict('records')
+        ).get(selected_period_id, {})
+
+    # الإجماليات اليومية للفريق تكفي لرسوم النمو والإيقاع والنشاط الأسبوعي
+    period_logs_df = pd.DataFrame(snapshot.get('daily_totals') or {})
     if not period_logs_df.empty:
-        period_participants_ids = period_logs_df['member_id'].unique()
-        period_members_df = members_df[members_df['members_id'].isin(period_participants_ids)]
-        all_participants_names = period_members_df['name'].tolist()
-
-        podium_data = []
-        period_rules = selected_challenge_data
-
-        for _, member in period_members_df.iterrows():
-            member_id = member['members_id']
-            member_logs = period_logs_df[period_logs_df['member_id'] == member_id]
-            member_achievements = pd.DataFrame()
-            if not period_achievements_df.empty:
-                member_achievements = period_achievements_df[period_achievements_df['member_id'] == member_id]
-
-            points = 0
-            common_minutes, other_minutes, common_quotes, other_quotes = 0, 0, 0, 0
-            if not member_logs.empty:
-                common_minutes = member_logs['common_book_minutes'].sum()
-                other_minutes = member_logs['other_book_minutes'].sum()
-                common_quotes = member_logs['submitted_common_quote'].sum()
-                other_quotes = member_logs['submitted_other_quote'].sum()
-
-                if period_rules.get('minutes_per_point_common', 0) > 0: points += common_minutes // period_rules['minutes_per_point_common']
-                if period_rules.get('minutes_per_point_other', 0) > 0: points += other_minutes // period_rules['minutes_per_point_other']
-                points += common_quotes * period_rules.get('quote_common_book_points', 0)
-                points += other_quotes * period_rules.get('quote_other_book_points', 0)
-            
-            if not member_achievements.empty:
-                for _, ach in member_achievements.iterrows():
-                    ach_type = ach['achievement_type']
-                    if ach_type == 'FINISHED_COMMON_BOOK': points += period_rules.get('finish_common_book_points', 0)
-                    elif ach_type == 'ATTENDED_DISCUSSION': points += period_rules.get('attend_discussion_points', 0)
-                    elif ach_type == 'FINISHED_OTHER_BOOK': points += period_rules.get('finish_other_book_points', 0)
-
-            podium_data.append({
-                'member_id': member_id, 
-                'name': member['name'], 
-                'total_points': int(points), 
-                'total_reading_minutes_common': common_minutes,
-                'total_reading_minutes_other': other_minutes,
-                'total_quotes_submitted': common_quotes + other_quotes
-            })
-        podium_df = pd.DataFrame(podium_data)
-
-    finishers_names, attendees_names = [], []
+        period_logs_df['submission_date_dt'] = pd.to_datetime(period_logs_df['date'], format='%Y-%m-%d', errors='coerce')
+
+    period_achievements_df = pd.DataFrame(snapshot.get('achievements') or {})
     if not period_achievements_df.empty:
-        finisher_ids = period_achievements_df[period_achievements_df['achievement_type'] == 'FINISHED_COMMON_BOOK']['member_id'].unique()
-        attendee_ids = period_achievements_df[period_achievements_df['achievement_type'] == 'ATTENDED_DISCUSSION']['member_id'].unique()
-        finishers_names = members_df[members_df['members_id'].isin(finisher_ids)]['name'].tolist()
-        attendees_names = members_df[members_df['members_id'].isin(attendee_ids)]['name'].tolist()
+        period_achievements_df['achievement_date_dt'] = pd.to_datetime(period_achievements_df['achievement_date'], errors='coerce')
+
+    podium_df = pd.DataFrame(snapshot.get('podium') or {})
+    all_participants_names = snapshot.get('participants', [])
+    finishers_names = snapshot.get('finishers', [])
+    attendees_names = snapshot.get('attendees', [])
 
 
     tab1, tab2 = st.tabs(["📝 ملخص التحدي", "🧑‍💻 بطاقة القارئ"])
@@ -468,11 +409,11 @@ if selected_period_id:
                     fig_gauge.update_layout(height=250, margin=dict(l=20, r=20, t=50, b=20), paper_bgcolor='rgba(0,0,0,0)')
                     st.plotly_chart(fig_gauge, use_container_width=True)
 
-                total_period_minutes = period_logs_df['total_minutes'].sum()
+                total_period_minutes = snapshot['total_minutes']
                 total_period_hours = int(total_period_minutes // 60)
-                active_participants = period_logs_df['member_id'].nunique()
+                active_participants = snapshot['active_participants']
                 avg_daily_reading = (total_period_minutes / days_passed / active_participants) if days_passed > 0 and active_participants > 0 else 0
-                total_period_quotes = period_logs_df['submitted_common_quote'].sum() + period_logs_df['submitted_other_quote'].sum()
+                total_period_quotes = snapshot['total_quotes']
 
                 with c2:
                     st.markdown(f"""
@@ -3,7 +3,9 @@ import pandas as pd
 from datetime import date, timedelta, datetime
 import db_manager as db
 import auth_manager 
-from main import run_data_update
+import sync_jobs
+import data_service
+from main import preview_data_update, calculate_and_update_stats, load_daily_rollup, rebuild_daily_rollup, rebuild_challenge_snapshots
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import gspread
@@ -166,21 +168,20 @@ def update_form_members(forms_service, form_id, question_id, active_member_names
 gc = auth_manager.get_gspread_client(creds)
 forms_service = build('forms', 'v1', credentials=creds)
 
+# عرض تقدم المزامنة الجارية في الخلفية (إن وجدت)
+with st.sidebar:
+    sync_jobs.render_sync_status(user_id)
+
 # --- Data Loading ---
 @st.cache_data(ttl=300)
-def load_management_data(user_id):
-    members_df = db.get_subcollection_as_df(user_id, 'members')
-    periods_df = db.get_subcollection_as_df(user_id, 'periods')
-    books_df = db.get_subcollection_as_df(user_id, 'books')
-    user_settings = db.get_user_settings(user_id)
-
-    if not periods_df.empty and not books_df.empty:
-        books_df.rename(columns={'title': 'book_title', 'author': 'book_author', 'publication_year': 'book_year'}, inplace=True)
-        periods_df = pd.merge(periods_df, books_df, left_on='common_book_id', right_on='books_id', how='left')
+def load_sync_preview(_gc, user_id, data_versions):
+    # معاينة المزامنة لا تكتب شيئاً؛ إصدارات المجموعات في المفتاح تجعلها تُعاد بعد كل مزامنة أو تعديل يغيّر البيانات
+    return preview_data_update(_gc, user_id)
 
-    return members_df, periods_df, user_settings
-
-members_df, periods_df, user_settings = load_management_data(user_id)
+# الأعضاء والتحديات (مدمجة مع كتبها) من نسخة بيانات مساحة العمل المشتركة بين الصفحات
+workspace = data_service.get_workspace(user_id)
+members_df, periods_df = workspace['members'], workspace['periods']
+user_settings = db.get_user_settings(user_id)
 
 # --- Page Title ---
 st.header("⚙️ الإدارة والإعدادات")
@@ -376,6 +377,44 @@ with st.container(border=True):
             st.code(form_url)
         else:
             st.warning("لم يتم إنشاء رابط النموذج بعد. يرجى إكمال خطوات الإعداد أولاً.")
+
+        st.subheader("🔁 إعادة المزامنة الكاملة")
+        st.info("تقرأ المزامنة العادية الصفوف الجديدة فقط. استخدم هذا الزر لقراءة الجدول كاملاً ومطابقته مع السجلات الحالية إذا عدّلت أو حذفت صفوفاً سبقت مزامنتها.")
+        if st.button("🔁 إعادة المزامنة الكاملة", key="full_resync", use_container_width=True):
+            job, started = sync_jobs.start_sync_job(gc, user_id, full_rebuild=True)
+            st.toast("بدأت إعادة المزامنة الكاملة في الخلفية." if started else "توجد مزامنة قيد التشغيل بالفعل؛ ستبدأ إعادة المزامنة الكاملة بعدها.", icon="🔁")
+            st.rerun()
+
+        st.subheader("🧮 إعادة حساب الإحصائيات")
+        st.info("تُحدَّث إحصائيات الأعضاء تلقائياً بعد كل مزامنة. استخدم هذا الزر لإعادة حسابها (مع الملخص اليومي للوحات المتابعة) بالكامل من جميع السجلات إذا بدت غير دقيقة.")
+        if st.button("🧮 إعادة بناء إحصائيات الأعضاء", key="rebuild_member_stats", use_container_width=True):
+            with st.spinner("جاري إعادة حساب جميع الإحصائيات..."):
+                stats_summary = calculate_and_update_stats(user_id)
+                rebuild_daily_rollup(user_id)
+                rebuild_challenge_snapshots(user_id)
+            data_service.invalidate(user_id)
+            if stats_summary['failed']:
+                st.error(f"⚠️ فشلت كتابة {stats_summary['failed']} من مستندات إحصائيات الأعضاء. يرجى المحاولة مرة أخرى.")
+            else:
+                st.toast("✅ تمت إعادة بناء الإحصائيات بنجاح!", icon="🧮")
+
+        with st.expander("📊 تقرير استهلاك الذاكرة"):
+            st.caption("يقارن حجم بيانات النشاط في الذاكرة كما تُقرأ من قاعدة البيانات وبعد تحويلها إلى المخطط المضغوط الذي تستخدمه لوحات المتابعة.")
+            if st.button("📊 حساب التقرير", key="memory_usage_report", use_container_width=True):
+                with st.spinner("جاري قراءة البيانات وحساب استهلاك الذاكرة..."):
+                    data_versions = db.get_data_versions(user_id)
+                    rollup_df = load_daily_rollup(user_id, db.get_sync_config(user_id, data_versions)['periods'], data_versions)
+                    raw_logs_df = db.get_subcollection_as_df(user_id, 'logs', data_versions.get('logs'))
+                    raw_achievements_df = db.get_subcollection_as_df(user_id, 'achievements', data_versions.get('achievements'))
+                    report_df = db.memory_usage_report({
+                        'daily_rollup': (rollup_df, db.compact_logs_frame(rollup_df)),
+                        'logs': (raw_logs_df, db.compact_logs_frame(raw_logs_df)),
+                        'achievements': (raw_achievements_df, db.compact_achievements_frame(raw_achievements_df)),
+                    })
+                st.dataframe(report_df.rename(columns={
+                    'table': 'الجدول', 'rows': 'الصفوف', 'loaded_mb': 'الحجم كما يُقرأ (MB)',
+                    'compact_mb': 'الحجم المضغوط (MB)', 'ratio': 'النسبة',
+                }), use_container_width=True, hide_index=True)
     
     with settings_tab3:
         st.subheader("📝 محرر السجلات الذكي")
@@ -480,9 +519,8 @@ with st.container(border=True):
                             if batch_updates:
                                 worksheet.batch_update(batch_updates)
                                 st.success(f"✅ تم تحديث {len(changes)} سجل بنجاح في Google Sheet.")
-                                st.info("سيتم الآن إعادة مزامنة التطبيق بالكامل لتعكس التغييرات.")
-                                with st.spinner("جاري المزامنة الكاملة..."): run_data_update(gc, user_id)
-                                st.success("🎉 اكتملت المزامنة!")
+                                sync_jobs.start_sync_job(gc, user_id, full_rebuild=True)
+                                st.info("بدأت إعادة المزامنة الكاملة في الخلفية لتعكس التغييرات.")
                             else:
                                 st.info("لم يتم العثور على أي تغييرات لحفظها.")
                             del st.session_state.editor_data
@@ -491,6 +529,42 @@ with st.container(border=True):
                     except Exception as e:
                         st.error(f"حدث خطأ فادح أثناء عملية الحفظ: {e}")
 
+# --- Spacer ---
+st.write("")
+
+# --- Container 3: Sync Preview (Dry Run) ---
+with st.container(border=True):
+    st.markdown('<div class="section-header"><h3>🔎 معاينة المزامنة</h3></div>', unsafe_allow_html=True)
+    st.caption("ما الذي ستغيّره المزامنة القادمة في قاعدة البيانات، دون كتابة أي شيء.")
+    preview = load_sync_preview(gc, user_id, workspace['data_versions'])
+    if preview['status'] == 'error':
+        st.error(preview['message'])
+    elif preview['status'] == 'unchanged':
+        st.success(preview['message'])
+    else:
+        st.info(preview['message'])
+        c1, c2, c3, c4, c5, c6 = st.columns(6)
+        c1.metric("سجلات جديدة", preview['new_logs'])
+        c2.metric("سجلات معدّلة", preview['changed_logs'])
+        c3.metric("سجلات محذوفة", preview['removed_logs'])
+        c4.metric("إنجازات جديدة", preview['new_achievements'])
+        c5.metric("إنجازات معدّلة", preview['changed_achievements'])
+        c6.metric("إنجازات محذوفة", preview['removed_achievements'])
+        if preview['points']:
+            points_df = pd.DataFrame(preview['points'])[['name', 'old_points', 'new_points', 'delta']]
+            points_df.columns = ['العضو', 'النقاط الحالية', 'النقاط بعد المزامنة', 'الفرق']
+            st.dataframe(points_df, use_container_width=True, hide_index=True)
+        if st.button("🔄 تنفيذ المزامنة الآن", key="run_sync_from_preview", use_container_width=True, type="primary"):
+            # المزامنة التزايدية لا تلتقط إلا الصفوف المضافة؛ أي تعديل أو حذف يتطلب مطابقة كاملة
+            full_rebuild = bool(preview['changed_logs'] or preview['removed_logs']
+                                or preview['changed_achievements'] or preview['removed_achievements'])
+            job, started = sync_jobs.start_sync_job(gc, user_id, full_rebuild=full_rebuild)
+            st.toast("بدأت المزامنة في الخلفية." if started else "توجد مزامنة قيد التشغيل بالفعل.", icon="🔄")
+            st.rerun()
+    if st.button("↻ تحديث المعاينة", key="refresh_sync_preview"):
+        load_sync_preview.clear(gc, user_id, workspace['data_versions'])
+        st.rerun()
+
 # --- NEW SECTION: Delete Account ---
 st.divider()
 st.subheader("🗑️ منطقة الخطر: حذف الحساب")
@@ -518,7 +592,7 @@ if 'show_add_member_dialog' in st.session_state and st.session_state.show_add_me
                         form_id, q_id = user_settings.get('form_id'), user_settings.get('member_question_id')
                         update_form_members(forms_service, form_id, q_id, active_member_names)
                         st.toast(f"✅ تمت إضافة '{new_member_name}' وتحديث النموذج.", icon="👍")
-                        st.cache_data.clear()
+                        data_service.invalidate(user_id)
                         st.session_state.show_add_member_dialog = False
                         st.rerun()
                 else:
@@ -535,7 +609,7 @@ for _, member in members_df.iterrows():
             form_id, q_id = user_settings.get('form_id'), user_settings.get('member_question_id')
             update_form_members(forms_service, form_id, q_id, current_active_names)
             st.toast(f"تم تعطيل {member['name']} وإزالته من النموذج.", icon="🚫")
-            st.cache_data.clear()
+            data_service.invalidate(user_id)
             st.rerun()
     else:
         if st.session_state.get(f"reactivate_{member_id}"):
@@ -544,7 +618,7 @@ for _, member in members_df.iterrows():
             form_id, q_id = user_settings.get('form_id'), user_settings.get('member_question_id')
             update_form_members(forms_service, form_id, q_id, final_active_names)
             st.toast(f"تم إعادة تنشيط {member['name']} وإضافته للنموذج.", icon="🔄")
-            st.cache_data.clear()
+            data_service.invalidate(user_id)
             st.rerun()
 
 # --- Challenge Management Logic ---
@@ -578,8 +652,11 @@ if 'challenge_to_delete' in st.session_state:
             if db.delete_challenge(user_id, st.session_state['challenge_to_delete']):
                 del st.session_state['challenge_to_delete']
                 st.toast("🗑️ اكتمل الحذف.", icon="✅")
-                st.cache_data.clear()
+                data_service.invalidate(user_id)
                 st.rerun()
+            else:
+                data_service.invalidate(user_id)
+                st.error("⚠️ تعذر حذف بعض بيانات التحدي. يرجى المحاولة مرة أخرى لإكمال الحذف.")
         if st.button("إلغاء"):
             del st.session_state['challenge_to_delete']
             st.rerun()
@@ -619,7 +696,7 @@ if 'show_rules_choice' in st.session_state and st.session_state.show_rules_choic
             if success: st.toast(f"✅ {message}", icon="🎉")
             else: st.error(f"❌ {message}")
             del st.session_state.show_rules_choice, st.session_state.new_challenge_data
-            st.cache_data.clear()
+            data_service.invalidate(user_id)
             st.rerun()
         if c2.button("🛠️ تخصيص القوانين لهذا التحدي", type="primary", use_container_width=True):
             st.session_state.show_custom_rules_form = True
@@ -647,7 +724,7 @@ if 'show_custom_rules_form' in st.session_state and st.session_state.show_custom
                 if success: st.toast(f"✅ {message}", icon="🎉")
                 else: st.error(f"❌ {message}")
                 del st.session_state.show_custom_rules_form, st.session_state.new_challenge_data
-                st.cache_data.clear()
+                data_service.invalidate(user_id)
                 st.rerun()
     show_custom_rules_dialog()
 
@@ -683,9 +760,17 @@ if 'show_delete_account_dialog' in st.session_state and st.session_state.show_de
                 except Exception as e:
                     st.write(f"⚠️ لم نتمكن من حذف ملفات جوجل (ربما تم حذفها يدوياً): {e}")
 
-                # 3. حذف بيانات Firestore
-                db.delete_user_workspace(user_id)
-                st.write("✅ تم حذف بياناتك من قاعدة بيانات التطبيق.")
+                # 3. حذف بيانات Firestore (على دفعات، مع عرض التقدم)
+                deletion_status = st.empty()
+                workspace_deleted = db.delete_user_workspace(
+                    user_id, progress=lambda collection_name, sent: deletion_status.write(f"🗑️ جاري حذف {collection_name}: {sent} مستند...")
+                )
+                if not workspace_deleted:
+                    deletion_status.error("⚠️ تعذر حذف بعض بياناتك. يرجى المحاولة مرة أخرى لإكمال الحذف.")
+                    st.stop()
+                # إسقاط نسخة مساحة العمل من ذاكرة التطبيق ولقطاتها المحلية
+                data_service.invalidate(user_id, remove_snapshots=True)
+                deletion_status.write("✅ تم حذف بياناتك من قاعدة بيانات التطبيق.")
 
                 # 4. إلغاء صلاحيات الوصول
                 # if refresh_token:
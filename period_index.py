@@ -0,0 +1,61 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+
+class PeriodIndex:
+    """
+    Interval index used to assign reading dates to challenges (periods).
+
+    Each period's 'start_date' / 'end_date' strings are parsed once and the
+    periods are sorted by start date, so a date -> period lookup is a binary
+    search instead of a scan that re-parses every period. Challenges created
+    from the management page never overlap, which is what allows a single
+    predecessor search to find the containing period.
+    """
+
+    def __init__(self, periods):
+        """
+        Args:
+            periods (list[dict] | pd.DataFrame): Period records holding 'start_date'
+                and 'end_date' as 'YYYY-MM-DD' strings.
+        """
+        if isinstance(periods, pd.DataFrame):
+            periods = periods.to_dict('records')
+
+        parsed = []
+        for period in periods:
+            try:
+                start = datetime.strptime(period['start_date'], '%Y-%m-%d').date()
+                end = datetime.strptime(period['end_date'], '%Y-%m-%d').date()
+            except (KeyError, TypeError, ValueError):
+                continue # A period without valid dates can never contain a log
+            parsed.append((start, end, period))
+        parsed.sort(key=lambda item: item[0])
+
+        self.periods = [period for _, _, period in parsed]
+        self._starts_np = np.array([start for start, _, _ in parsed], dtype='datetime64[D]')
+        self._ends_np = np.array([end for _, end, _ in parsed], dtype='datetime64[D]')
+
+    def __len__(self):
+        return len(self.periods)
+
+    def positions(self, values):
+        """
+        Returns the position (in start-date order) of the period containing each date.
+
+        Args:
+            values (array-like): Dates, datetimes or date strings understood by pd.to_datetime.
+                Missing or unparsable values map to -1.
+
+        Returns:
+            np.ndarray: An int array of period positions, -1 where no period contains the date.
+        """
+        dates = pd.to_datetime(pd.Series(values).reset_index(drop=True), errors='coerce').to_numpy().astype('datetime64[D]')
+        if len(self.periods) == 0 or len(dates) == 0:
+            return np.full(len(dates), -1, dtype=np.int64)
+        idx = np.searchsorted(self._starts_np, dates, side='right') - 1
+        safe_idx = idx.clip(0)
+        # Comparisons against NaT are always False, so missing dates fall out here
+        valid = (idx >= 0) & (dates >= self._starts_np[safe_idx]) & (dates <= self._ends_np[safe_idx])
+        return np.where(valid, idx, -1).astype(np.int64)
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# مجلد اللقطات المحلية: مجلد لكل مساحة عمل فيه ملف Arrow لكل مجموعة، موسوم بإصدار تلك المجموعة
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'workspaces')
+VERSION_KEY = b'data_version'
+
+def _frame_path(user_id: str, collection_name: str):
+    return os.path.join(CACHE_DIR, re.sub(r'[^\w.-]', '_', str(user_id)), f'{collection_name}.arrow')
+
+def projection_name(collection_name: str, fields: list):
+    """
+    Returns the name under which a projection (a read of only `fields`) of a
+    collection is stored, apart from the collection's full snapshot.
+    """
+    return f"{collection_name}.select-{hashlib.sha1(','.join(sorted(fields)).encode('utf-8')).hexdigest()[:10]}"
+
+def read_frame(user_id: str, collection_name: str, data_version: str, columns: list = None):
+    """
+    Returns a workspace collection from its local Arrow snapshot, memory-mapped,
+    or None when the snapshot is missing or was written for another data version.
+    When `columns` is given only those (of the ones the snapshot has) are returned.
+    """
+    if not data_version:
+        return None
+    try:
+        table = feather.read_table(_frame_path(user_id, collection_name), memory_map=True)
+    except (OSError, pa.ArrowException):
+        return None
+    if (table.schema.metadata or {}).get(VERSION_KEY) != data_version.encode('utf-8'):
+        return None
+    if columns is not None:
+        table = table.select([col for col in columns if col in table.column_names])
+    return table.to_pandas()
+
+def write_frames(user_id: str, data_version: str, frames: dict):
+    """
+    Stores collections as local Arrow snapshots tagged with `data_version`.
+
+    The version is kept in each file's schema metadata, so a file and its version
+    are always replaced together. The cache is best-effort: a frame Arrow cannot
+    represent (e.g. a column mixing numbers and text) is skipped and keeps being
+    read from Firestore.
+
+    Args:
+        frames (dict): {collection name: DataFrame as returned by db_manager.get_subcollection_as_df}.
+
+    Returns:
+        list: The collections that were written.
+    """
+    if not data_version:
+        return []
+
+    written = []
+    for collection_name, df in frames.items():
+        path = _frame_path(user_id, collection_name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), VERSION_KEY: data_version.encode('utf-8')})
+            # دون ضغط حتى يمكن قراءة الملف بـ memory map دون نسخه، ثم استبدال ذري للملف القديم
+            feather.write_feather(table, tmp_path, compression='uncompressed')
+            os.replace(tmp_path, path)
+            written.append(collection_name)
+        except (OSError, pa.ArrowException):
+            continue
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return written
+
+def remove_workspace(user_id: str):
+    """
+    Deletes all local snapshots of a workspace, e.g. when the workspace itself is deleted.
+    """
+    shutil.rmtree(os.path.dirname(_frame_path(user_id, '_')), ignore_errors=True)
@@ -0,0 +1,127 @@
+"""
+Headless sync for all reading-group workspaces.
+
+Runs `run_data_update` for every workspace under `users` (or the given ones)
+across a bounded pool of worker processes, using each admin's stored
+refresh_token, and prints a per-workspace timing and outcome summary.
+Intended for scheduled (e.g. nightly) runs outside of Streamlit:
+
+    python sync_cli.py --secrets .streamlit/secrets.toml --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# يجب ضبط HEADLESS_SECRETS_ENV قبل استيراد db_manager حتى تُهيأ قاعدة البيانات دون Streamlit
+from firebase_config import HEADLESS_SECRETS_ENV, load_secrets_file
+
+_secrets = None
+
+def _load_secrets():
+    global _secrets
+    if _secrets is None:
+        _secrets = load_secrets_file(os.environ[HEADLESS_SECRETS_ENV])
+    return _secrets
+
+def _outcome(update_log: list):
+    """
+    Classifies a `run_data_update` log as 'failed', 'partial', 'unchanged' or 'synced',
+    and picks the line that best explains it.
+    """
+    errors = [line for line in update_log if line.startswith("❌")]
+    if errors:
+        return 'failed', errors[0]
+    footer = update_log[-1] if update_log else ''
+    if "⚠️" in footer:
+        warnings = [line for line in update_log if line.startswith("⚠️")]
+        return 'partial', warnings[-1] if warnings else footer.strip()
+    body = [line for line in update_log[1:-1] if line.strip()]
+    message = body[-1] if body else ''
+    if any(line.startswith("ℹ️") for line in body):
+        return 'unchanged', message
+    return 'synced', message
+
+def sync_workspace(user_id: str, full_rebuild: bool = False):
+    """
+    Syncs one workspace inside a worker process.
+
+    Returns:
+        dict: 'user_id', 'status', 'seconds' and a one-line 'message'.
+    """
+    started = time.perf_counter()
+    try:
+        import gspread
+        import auth_manager
+        import db_manager as db
+        from main import run_data_update
+
+        refresh_token = db.get_refresh_token(user_id)
+        if not refresh_token:
+            status, message = 'skipped', "no stored refresh_token"
+        else:
+            creds = auth_manager.build_credentials(refresh_token, dict(_load_secrets()["google_oauth_credentials"]))
+            if creds is None:
+                status, message = 'auth_failed', "could not refresh the stored refresh_token"
+            else:
+                update_log = run_data_update(gspread.authorize(creds), user_id, full_rebuild=full_rebuild)
+                status, message = _outcome(update_log)
+    except Exception as e:
+        status, message = 'error', f"{type(e).__name__}: {e}"
+    return {
+        'user_id': user_id,
+        'status': status,
+        'seconds': time.perf_counter() - started,
+        'message': message,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync every reading-group workspace from its Google Sheet.")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"),
+                        help="Path to the secrets.toml holding firebase_credentials and google_oauth_credentials.")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1),
+                        help="Maximum number of workspaces synced in parallel (one process each).")
+    parser.add_argument("--user", dest="user_ids", action="append",
+                        help="Sync only this workspace (user ID). Can be repeated.")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Force a full read and reconciliation instead of incremental syncs.")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.secrets):
+        parser.error(f"secrets file not found: {args.secrets}")
+    # يرثه كل عامل في مجمع العمليات
+    os.environ[HEADLESS_SECRETS_ENV] = os.path.abspath(args.secrets)
+
+    import db_manager as db
+    user_ids = args.user_ids or db.list_user_ids()
+    if not user_ids:
+        print("No workspaces found.")
+        return 0
+
+    print(f"Syncing {len(user_ids)} workspace(s) with {args.workers} worker(s)...")
+    started = time.perf_counter()
+    results = []
+    # spawn: عملاء gRPC الخاصة بـ Firestore لا تتحمل fork بعد تهيئتها في العملية الرئيسية
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(sync_workspace, user_id, args.full_rebuild) for user_id in user_ids]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"{result['status']:<12} {result['seconds']:8.1f}s  {result['user_id']}  {result['message']}", flush=True)
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    elapsed = time.perf_counter() - started
+    slowest = max(results, key=lambda r: r['seconds'])
+    print("\nSummary: " + ", ".join(f"{status}={count}" for status, count in sorted(counts.items())))
+    print(f"Wall time: {elapsed:.1f}s, summed workspace time: {sum(r['seconds'] for r in results):.1f}s, "
+          f"slowest: {slowest['user_id']} ({slowest['seconds']:.1f}s)")
+
+    failed = counts.get('failed', 0) + counts.get('error', 0) + counts.get('auth_failed', 0)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import threading
+import uuid
+from datetime import datetime
+import streamlit as st
+import data_service
+from main import run_data_update
+
+# وصف كل خطوة من خطوات المزامنة كما يظهر للمستخدم أثناء التنفيذ
+STEP_LABELS = {
+    'queued': "⏳ في انتظار البدء...",
+    'fetching': "📥 جاري سحب البيانات من Google Sheet...",
+    'fetched': "📥 تم سحب البيانات من Google Sheet.",
+    'writing': "💾 جاري كتابة السجلات والإنجازات...",
+    'written': "💾 تمت كتابة السجلات والإنجازات.",
+    'stats': "🧮 جاري حساب الإحصائيات...",
+    'done': "✅ اكتملت المزامنة.",
+    'partial': "⚠️ اكتملت المزامنة مع وجود أخطاء.",
+    'failed': "❌ فشلت المزامنة.",
+}
+
+class SyncJob:
+    """
+    State of one background sync for one user: the current step, the progress
+    counters reported by `run_data_update`, and the final update log.
+
+    The worker thread writes to the job while the UI reads it, so every access
+    goes through the job's lock; the UI should read `snapshot()`.
+    """
+
+    def __init__(self, user_id: str, full_rebuild: bool = False):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.full_rebuild = full_rebuild
+        self.status = 'running'
+        self.step = 'queued'
+        self.progress = {}
+        self.update_log = []
+        self.error = None
+        self.started_at = datetime.now()
+        self.finished_at = None
+        # طلب مزامنة كاملة وصل أثناء تشغيل هذه المهمة، فتُعاد كاملة بعد انتهائها
+        self.full_rebuild_requested = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self):
+        with self._lock:
+            return self.status == 'running'
+
+    def report(self, step: str, **counters):
+        """
+        Progress callback passed to `run_data_update`.
+        """
+        with self._lock:
+            self.step = step
+            self.progress.update(counters)
+
+    def finish(self, status: str, update_log: list, error: str = None):
+        with self._lock:
+            self.status = status
+            self.step = status
+            self.update_log = update_log
+            self.error = error
+            self.finished_at = datetime.now()
+
+    def snapshot(self):
+        """
+        Returns a consistent copy of the job state for display.
+        """
+        with self._lock:
+            return {
+                'job_id': self.job_id,
+                'status': self.status,
+                'step': self.step,
+                'step_label': STEP_LABELS.get(self.step, self.step),
+                'progress': dict(self.progress),
+                'update_log': list(self.update_log),
+                'error': self.error,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+def _log_status(update_log: list):
+    """
+    Returns the final job status for a `run_data_update` log: 'failed' if it contains
+    an error, 'partial' if the sync finished with failed writes, otherwise 'done'.
+    """
+    if any(line.startswith("❌") for line in update_log):
+        return 'failed'
+    if update_log and "⚠️" in update_log[-1]:
+        return 'partial'
+    return 'done'
+
+# سجل المهام داخل العملية: مهمة واحدة (الأخيرة) لكل مستخدم
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def _run_job(job: SyncJob, gc):
+    """
+    Worker thread body: runs the sync (again as a full rebuild if one was requested
+    meanwhile), clears the dashboards' data caches and records the outcome.
+    """
+    full_rebuild = job.full_rebuild
+    update_log = []
+    try:
+        while True:
+            update_log += run_data_update(gc, job.user_id, full_rebuild=full_rebuild, progress=job.report)
+            # إسقاط بيانات هذا المستخدم من الذاكرة المؤقتة حتى تعكس جميع الصفحات البيانات الجديدة
+            data_service.invalidate(job.user_id)
+            with _jobs_lock:
+                if job.full_rebuild_requested:
+                    job.full_rebuild_requested = False
+                    full_rebuild = True
+                    continue
+                job.finish(_log_status(update_log), update_log)
+                return
+    except Exception as e:
+        update_log.append(f"❌ خطأ غير متوقع أثناء المزامنة: {e}")
+        data_service.invalidate(job.user_id)
+        with _jobs_lock:
+            job.finish('failed', update_log, error=str(e))
+
+def start_sync_job(gc, user_id: str, full_rebuild: bool = False):
+    """
+    Starts a background sync for a user unless one is already running.
+
+    Args:
+        gc (gspread.Client): The authenticated gspread client of the user.
+        user_id (str): The unique ID of the user (admin) to sync data for.
+        full_rebuild (bool): Forwarded to `run_data_update`. If a sync is already running,
+            a full rebuild is queued to run right after it instead.
+
+    Returns:
+        tuple[SyncJob, bool]: The user's current job and whether a new job was started.
+    """
+    with _jobs_lock:
+        job = _jobs.get(user_id)
+        if job is not None and job.is_running:
+            if full_rebuild:
+                job.full_rebuild_requested = True
+            return job, False
+        job = SyncJob(user_id, full_rebuild=full_rebuild)
+        _jobs[user_id] = job
+
+    threading.Thread(target=_run_job, args=(job, gc), name=f"sync-{user_id}", daemon=True).start()
+    return job, True
+
+def get_sync_job(user_id: str):
+    """
+    Returns the user's running or most recent sync job, or None.
+    """
+    with _jobs_lock:
+        return _jobs.get(user_id)
+
+def render_sync_status(user_id: str, poll_seconds: int = 2):
+    """
+    Shows the progress of the user's sync job, polling while it runs.
+
+    When the job finishes, its update log and final status are handed to
+    `st.session_state['update_log']` and `st.session_state['update_status']` (once per job)
+    and the whole page is rerun so it picks up the fresh data. A failed or partial
+    outcome stays visible afterwards.
+    """
+    job = get_sync_job(user_id)
+    if job is None:
+        return
+
+    @st.fragment(run_every=poll_seconds if job.is_running else None)
+    def _status():
+        state = job.snapshot()
+        if state['status'] == 'running':
+            progress = state['progress']
+            st.info(state['step_label'])
+            details = []
+            if 'rows_fetched' in progress:
+                details.append(f"الصفوف المسحوبة: {progress['rows_fetched']}")
+            if 'ops_written' in progress:
+                details.append(f"عمليات الكتابة: {progress['ops_written']} ناجحة، {progress.get('ops_failed', 0)} فاشلة")
+            if details:
+                st.caption(" | ".join(details))
+            st.caption("يمكنك متابعة تصفح لوحات المتابعة أثناء المزامنة.")
+        elif st.session_state.get('seen_sync_job') != state['job_id']:
+            st.session_state['seen_sync_job'] = state['job_id']
+            st.session_state['update_log'] = state['update_log']
+            st.session_state['update_status'] = state['status']
+            st.rerun()
+        elif state['status'] == 'failed':
+            st.error(state['step_label'])
+        elif state['status'] == 'partial':
+            st.warning(state['step_label'])
+
+    _status()
@@ -0,0 +1,56 @@
+import os
+import sys
+import types
+import pytest
+from fake_firestore import FakeFirestore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# firebase_config يهيئ عميل Firestore الحقيقي من أسرار التطبيق، فيُستبدل بعميل في الذاكرة
+# قبل أن تستورد db_manager المتغير db منه
+fake_db = FakeFirestore()
+firebase_config = types.ModuleType('firebase_config')
+firebase_config.db = fake_db
+sys.modules['firebase_config'] = firebase_config
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+    An empty in-memory Firestore, with the local Arrow snapshots kept in a temporary directory.
+    """
+    import snapshot_cache
+    monkeypatch.setattr(snapshot_cache, 'CACHE_DIR', str(tmp_path / 'workspaces'))
+    fake_db.reset()
+    yield fake_db
+    fake_db.reset()
+
+@pytest.fixture
+def members():
+    return [{'members_id': f'm{i}', 'name': f'عضو {i}', 'is_active': True} for i in range(4)]
+
+@pytest.fixture
+def periods():
+    """
+    Two challenges with different point rules, a gap between them and a
+    third one that disables points per reading minutes.
+    """
+    return [
+        {
+            'periods_id': 'p1', 'start_date': '2024-01-01', 'end_date': '2024-01-31', 'common_book_id': 'b1',
+            'minutes_per_point_common': 10, 'minutes_per_point_other': 5,
+            'quote_common_book_points': 3, 'quote_other_book_points': 1,
+            'finish_common_book_points': 50, 'finish_other_book_points': 25, 'attend_discussion_points': 25,
+        },
+        {
+            'periods_id': 'p2', 'start_date': '2024-02-05', 'end_date': '2024-03-10', 'common_book_id': 'b2',
+            'minutes_per_point_common': 7, 'minutes_per_point_other': 4,
+            'quote_common_book_points': 2, 'quote_other_book_points': 1,
+            'finish_common_book_points': 40, 'finish_other_book_points': 20, 'attend_discussion_points': 10,
+        },
+        {
+            'periods_id': 'p3', 'start_date': '2024-04-01', 'end_date': '2024-04-30', 'common_book_id': 'b1',
+            'minutes_per_point_common': 0, 'minutes_per_point_other': 0,
+            'quote_common_book_points': 5, 'quote_other_book_points': 2,
+            'finish_common_book_points': 30, 'finish_other_book_points': 15, 'attend_discussion_points': 5,
+        },
+    ]
@@ -0,0 +1,224 @@
+import copy
+import threading
+import uuid
+
+class FakeFirestore:
+    """
+    In-memory stand-in for the Firestore client, covering the calls db_manager
+    makes: documents and subcollections, '==' / 'in' filters and document-ID
+    ranges, select / order_by / limit / start_after, batches and get_all.
+
+    Documents are stored by their path tuple. `reads` and `writes` count
+    document reads and writes so tests can check how much a sync touched, and
+    `fail_commits` makes every batch commit raise.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.writes = 0
+        self.fail_commits = False
+        self.lock = threading.RLock()
+
+    def reset(self):
+        with self.lock:
+            self.docs.clear()
+            self.reset_counters()
+            self.fail_commits = False
+
+    def reset_counters(self):
+        with self.lock:
+            self.reads = 0
+            self.writes = 0
+
+    def collection(self, name):
+        return CollectionReference(self, (name,))
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def get_all(self, refs, **kwargs):
+        return [ref.get() for ref in refs]
+
+    def subcollection(self, user_id, collection_name):
+        """
+        Returns a user's subcollection as {document ID: data}, without counting reads.
+        """
+        prefix = ('users', user_id, collection_name)
+        with self.lock:
+            return {path[-1]: copy.deepcopy(data) for path, data in self.docs.items() if len(path) == 4 and path[:3] == prefix}
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = None
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+class DocumentReference:
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return CollectionReference(self.store, self.path + (name,))
+
+    def collections(self):
+        depth = len(self.path)
+        with self.store.lock:
+            names = sorted({path[depth] for path in self.store.docs if len(path) > depth + 1 and path[:depth] == self.path})
+        return [self.collection(name) for name in names]
+
+    def get(self, **kwargs):
+        with self.store.lock:
+            self.store.reads += 1
+            return DocumentSnapshot(self, copy.deepcopy(self.store.docs.get(self.path)))
+
+    def set(self, data, merge=False):
+        with self.store.lock:
+            self.store.writes += 1
+            current = self.store.docs.get(self.path) if merge else None
+            document = dict(current or {})
+            for key, value in data.items():
+                if type(value).__name__ == 'Increment':
+                    document[key] = document.get(key, 0) + value.value
+                else:
+                    document[key] = copy.deepcopy(value)
+            self.store.docs[self.path] = document
+
+    def update(self, data):
+        with self.store.lock:
+            if self.path not in self.store.docs:
+                raise KeyError(f"No document to update: {'/'.join(self.path)}")
+            self.set(data, merge=True)
+
+    def delete(self):
+        with self.store.lock:
+            self.store.writes += 1
+            self.store.docs.pop(self.path, None)
+
+class Query:
+    def __init__(self, collection, filters=(), fields=None, limit=None, start_after=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._fields = fields
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = {
+            'filters': self._filters, 'fields': self._fields,
+            'limit': self._limit, 'start_after': self._start_after,
+        }
+        state.update(changes)
+        return Query(self._collection, **state)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def order_by(self, field, **kwargs):
+        # المستندات تُعاد دائماً بترتيب معرّفاتها، وهو الترتيب الوحيد الذي تطلبه db_manager
+        return self
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document):
+        return self._copy(start_after=document.id)
+
+    def _matches(self, doc_id, data):
+        for field, op, value in self._filters:
+            actual = doc_id if field == '__name__' else data.get(field)
+            expected = value.id if isinstance(value, DocumentReference) else value
+            if op == '==' and actual != expected:
+                return False
+            if op == 'in' and actual not in expected:
+                return False
+            if op == '>=' and not actual >= expected:
+                return False
+            if op == '<' and not actual < expected:
+                return False
+        return True
+
+    def stream(self, **kwargs):
+        store, prefix = self._collection.store, self._collection.path
+        depth = len(prefix)
+        with store.lock:
+            documents = sorted(
+                (path[-1], copy.deepcopy(data)) for path, data in store.docs.items()
+                if len(path) == depth + 1 and path[:depth] == prefix
+            )
+            results = [
+                (doc_id, data) for doc_id, data in documents
+                if self._matches(doc_id, data) and (self._start_after is None or doc_id > self._start_after)
+            ]
+            if self._limit is not None:
+                results = results[:self._limit]
+            store.reads += len(results)
+        for doc_id, data in results:
+            if self._fields is not None:
+                data = {key: value for key, value in data.items() if key in self._fields}
+            yield DocumentSnapshot(DocumentReference(store, prefix + (doc_id,)), data)
+
+    def get(self, **kwargs):
+        return list(self.stream())
+
+class CollectionReference(Query):
+    def __init__(self, store, path):
+        super().__init__(self)
+        self.store = store
+        self.path = path
+        self.id = path[-1]
+
+    def document(self, doc_id=None):
+        return DocumentReference(self.store, self.path + (doc_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data):
+        doc_ref = self.document()
+        doc_ref.set(data)
+        return None, doc_ref
+
+    def list_documents(self):
+        depth = len(self.path)
+        with self.store.lock:
+            doc_ids = sorted({path[depth] for path in self.store.docs if len(path) > depth and path[:depth] == self.path})
+        return [self.document(doc_id) for doc_id in doc_ids]
+
+class WriteBatch:
+    def __init__(self, store):
+        self.store = store
+        self._ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._ops.append(lambda: doc_ref.set(data, merge=merge))
+
+    def update(self, doc_ref, data):
+        self._ops.append(lambda: doc_ref.update(data))
+
+    def delete(self, doc_ref):
+        self._ops.append(doc_ref.delete)
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("A batch can contain at most 500 operations.")
+        if self.store.fail_commits:
+            raise RuntimeError("Batch commit failed.")
+        with self.store.lock:
+            for op in self._ops:
+                op()
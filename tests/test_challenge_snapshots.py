@@ -0,0 +1,77 @@
+import random
+import pandas as pd
+import db_manager as db
+import main
+
+def random_logs(rng, member_ids, count):
+    return pd.DataFrame([
+        {
+            'member_id': rng.choice(member_ids),
+            'submission_date': f"{rng.randint(1, 28):02d}/{rng.randint(1, 4):02d}/2024",
+            'common_book_minutes': rng.randint(0, 240),
+            'other_book_minutes': rng.choice([0, rng.randint(1, 240)]),
+            'submitted_common_quote': rng.randint(0, 1),
+            'submitted_other_quote': rng.randint(0, 1),
+        }
+        for _ in range(count)
+    ])
+
+def achievements_frame(rows):
+    return pd.DataFrame(rows, columns=['member_id', 'achievement_type', 'achievement_date', 'period_id', 'book_id'])
+
+def test_compact_rollup_gives_the_same_snapshots(members, periods):
+    rng = random.Random(7)
+    member_ids = [member['members_id'] for member in members]
+    rollup_df = main.build_daily_rollup(random_logs(rng, member_ids, 400), periods)
+    achievements = achievements_frame([
+        {'member_id': 'm1', 'achievement_type': 'FINISHED_COMMON_BOOK', 'achievement_date': '2024-01-20', 'period_id': 'p1', 'book_id': 'b1'},
+        {'member_id': 'm2', 'achievement_type': 'ATTENDED_DISCUSSION', 'achievement_date': '2024-02-25', 'period_id': 'p2', 'book_id': None},
+    ])
+
+    raw = main.build_challenge_snapshots(members, rollup_df, achievements, periods)
+    compact = main.build_challenge_snapshots(members, db.compact_logs_frame(rollup_df), achievements, periods)
+    assert compact == raw
+
+def test_snapshot_totals_do_not_overflow_compact_columns(members, periods):
+    # كل يوم يتسع لـ uint8 لكن مجموع الأيام (ومجموع العمودين) يتجاوزه
+    rollup_df = main.build_daily_rollup(pd.DataFrame([
+        {'member_id': 'm0', 'submission_date': f'{day:02d}/01/2024', 'common_book_minutes': 200, 'other_book_minutes': 150,
+         'submitted_common_quote': 1, 'submitted_other_quote': 1}
+        for day in range(1, 31)
+    ]), periods)
+    compact = db.compact_logs_frame(rollup_df)
+    assert compact['common_book_minutes'].dtype == 'uint8'
+
+    for frame in [rollup_df, compact]:
+        snapshot = main.build_challenge_snapshots(members, frame, achievements_frame([]), periods)['p1']
+        assert snapshot['podium']['total_reading_minutes_common'] == [6000]
+        assert snapshot['podium']['total_reading_minutes_other'] == [4500]
+        assert snapshot['podium']['total_quotes_submitted'] == [60]
+        assert snapshot['podium']['total_points'] == [6000 // 10 + 4500 // 5 + 30 * 3 + 30 * 1]
+        assert snapshot['total_minutes'] == 10500
+        assert snapshot['daily_totals']['total_minutes'] == [350] * 30
+
+def test_snapshot_contents(members, periods):
+    rollup_df = main.build_daily_rollup(pd.DataFrame([
+        {'member_id': 'm2', 'submission_date': '10/02/2024', 'common_book_minutes': 30, 'other_book_minutes': 0, 'submitted_common_quote': 1, 'submitted_other_quote': 0},
+        {'member_id': 'm0', 'submission_date': '10/02/2024', 'common_book_minutes': 15, 'other_book_minutes': 8, 'submitted_common_quote': 0, 'submitted_other_quote': 0},
+        # عضو محذوف: لا يظهر في لوحة الشرف ولا في الأسماء
+        {'member_id': 'gone', 'submission_date': '11/02/2024', 'common_book_minutes': 99, 'other_book_minutes': 0, 'submitted_common_quote': 0, 'submitted_other_quote': 0},
+    ]), periods)
+    achievements = achievements_frame([
+        {'member_id': 'm2', 'achievement_type': 'ATTENDED_DISCUSSION', 'achievement_date': '2024-02-12', 'period_id': 'p2', 'book_id': None},
+        {'member_id': 'm0', 'achievement_type': 'FINISHED_COMMON_BOOK', 'achievement_date': '2024-02-11', 'period_id': 'p2', 'book_id': 'b2'},
+    ])
+    snapshots = main.build_challenge_snapshots(members, rollup_df, achievements, periods)
+
+    assert sorted(snapshots) == ['p1', 'p2', 'p3']
+    assert snapshots['p1']['podium']['member_id'] == [] and snapshots['p1']['total_minutes'] == 0
+
+    p2 = snapshots['p2']
+    assert p2['podium']['member_id'] == ['m0', 'm2']
+    assert p2['podium']['total_points'] == [15 // 7 + 8 // 4 + 40, 30 // 7 + 2 + 10]
+    assert p2['participants'] == ['عضو 0', 'عضو 2']
+    assert p2['finishers'] == ['عضو 0'] and p2['attendees'] == ['عضو 2']
+    assert p2['achievements']['achievement_date'] == ['2024-02-11', '2024-02-12']
+    assert p2['daily_totals'] == {'date': ['2024-02-10', '2024-02-11'], 'total_minutes': [53, 99], 'total_quotes': [1, 0], 'active_members': [2, 1]}
+    assert p2['active_participants'] == 3
@@ -0,0 +1,59 @@
+import pandas as pd
+import db_manager as db
+import main
+
+def month_rollup(month: str, members: int, days: int = 28):
+    rows = [
+        {'member_id': f'member-{m:03d}', 'date': f'{month}-{d:02d}', 'logs_count': 1,
+         **{col: (m + d) % 50 for col in main.ROLLUP_SUM_COLUMNS}}
+        for d in range(1, days + 1) for m in range(members)
+    ]
+    return pd.DataFrame(rows, columns=['member_id', 'date', 'logs_count'] + main.ROLLUP_SUM_COLUMNS)
+
+def concat_parts(docs: dict):
+    return pd.concat([pd.DataFrame(docs[doc_id]) for doc_id in sorted(docs, key=db.rollup_doc_order)], ignore_index=True)
+
+def test_split_rollup_month_keeps_a_small_month_whole():
+    month_df = month_rollup('2024-01', members=3)
+    docs = db._split_rollup_month('2024-01', month_df)
+    assert list(docs) == ['2024-01']
+    assert docs['2024-01']['member_id'] == month_df['member_id'].tolist()
+
+def test_split_rollup_month_splits_an_oversized_month(monkeypatch):
+    monkeypatch.setattr(db, 'MAX_ROLLUP_DOCUMENT_BYTES', 20_000)
+    month_df = month_rollup('2024-01', members=12)
+    docs = db._split_rollup_month('2024-01', month_df)
+
+    assert len(docs) > 1
+    assert all(doc_id.startswith('2024-01-p') for doc_id in docs)
+    assert all(db._document_size(doc) <= db.MAX_ROLLUP_DOCUMENT_BYTES for doc in docs.values())
+    pd.testing.assert_frame_equal(concat_parts(docs), month_df.reset_index(drop=True))
+
+def test_split_rollup_month_single_row_parts(monkeypatch):
+    # صف واحد أكبر من الحد لا يمكن تقسيمه أكثر، فيُكتب كما هو بدلاً من الدوران بلا نهاية
+    monkeypatch.setattr(db, 'MAX_ROLLUP_DOCUMENT_BYTES', 10)
+    docs = db._split_rollup_month('2024-01', month_rollup('2024-01', members=1, days=3))
+    assert list(docs) == ['2024-01-p0', '2024-01-p1', '2024-01-p2']
+
+def test_rollup_doc_order_sorts_parts_numerically():
+    doc_ids = ['2024-02', '2024-01-p10', '2024-01-p2', '2024-01-p9', '2024-01-p0']
+    assert sorted(doc_ids, key=db.rollup_doc_order) == ['2024-01-p0', '2024-01-p2', '2024-01-p9', '2024-01-p10', '2024-02']
+
+def test_save_and_read_split_months(store, monkeypatch):
+    monkeypatch.setattr(db, 'MAX_ROLLUP_DOCUMENT_BYTES', 20_000)
+    rollup_df = pd.concat([month_rollup('2024-01', members=12), month_rollup('2024-02', members=2)], ignore_index=True)
+
+    summary = db.save_daily_rollup('u', rollup_df)
+    stored = store.subcollection('u', 'daily_rollup')
+    assert summary['failed'] == 0 and summary['written'] == len(stored)
+    assert '2024-02' in stored and '2024-01' not in stored
+
+    pd.testing.assert_frame_equal(db.get_daily_rollup_df('u'), rollup_df)
+    pd.testing.assert_frame_equal(db.get_daily_rollup_df('u', months=['2024-02']), month_rollup('2024-02', members=2))
+
+    # إعادة كتابة شهر واحد لا تمس الشهر الآخر، وتحذف أجزاءه التي لم تعد لازمة
+    january = month_rollup('2024-01', members=1)
+    db.save_daily_rollup('u', january, months=['2024-01'])
+    stored = store.subcollection('u', 'daily_rollup')
+    assert sorted(stored) == ['2024-01', '2024-02']
+    pd.testing.assert_frame_equal(db.get_daily_rollup_df('u', months=['2024-01']), january)
@@ -0,0 +1,141 @@
+import random
+from datetime import datetime
+import pandas as pd
+import pytest
+import main
+
+def reference_member_stats(members, logs, achievements, periods):
+    """
+    The original per-member, per-row scoring loop that `compute_member_stats` replaced.
+    """
+    periods_map = {p['periods_id']: p for p in periods}
+    logs_df = pd.DataFrame(logs)
+    if not logs_df.empty:
+        logs_df['submission_date_dt'] = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce').dt.date
+        for col in ['common_book_minutes', 'other_book_minutes', 'submitted_common_quote', 'submitted_other_quote']:
+            logs_df[col] = pd.to_numeric(logs_df[col], errors='coerce').fillna(0).astype(int)
+    achievements_df = pd.DataFrame(achievements)
+
+    def find_period(log_date):
+        return next((p for p in periods if datetime.strptime(p['start_date'], '%Y-%m-%d').date() <= log_date <= datetime.strptime(p['end_date'], '%Y-%m-%d').date()), None)
+
+    results = []
+    for member in members:
+        member_id = member['members_id']
+        stats = {
+            "member_id": member_id, "total_points": 0, "total_reading_minutes_common": 0,
+            "total_reading_minutes_other": 0, "total_common_books_read": 0,
+            "total_other_books_read": 0, "total_quotes_submitted": 0,
+            "meetings_attended": 0, "last_log_date": None, "last_quote_date": None,
+        }
+        member_logs = logs_df[logs_df['member_id'] == member_id] if not logs_df.empty else pd.DataFrame()
+        member_achievements = achievements_df[achievements_df['member_id'] == member_id] if not achievements_df.empty else pd.DataFrame()
+
+        for _, log in member_logs.iterrows():
+            log_date = log['submission_date_dt']
+            if pd.isna(log_date):
+                continue
+            period = find_period(log_date)
+            if period:
+                if period.get('minutes_per_point_common', 0) > 0:
+                    stats['total_points'] += log['common_book_minutes'] // period['minutes_per_point_common']
+                if period.get('minutes_per_point_other', 0) > 0:
+                    stats['total_points'] += log['other_book_minutes'] // period['minutes_per_point_other']
+                stats['total_points'] += log['submitted_common_quote'] * period.get('quote_common_book_points', 0)
+                stats['total_points'] += log['submitted_other_quote'] * period.get('quote_other_book_points', 0)
+
+        for _, achievement in member_achievements.iterrows():
+            rules = periods_map.get(achievement.get('period_id'))
+            if rules:
+                if achievement['achievement_type'] == 'FINISHED_COMMON_BOOK':
+                    stats['total_points'] += rules.get('finish_common_book_points', 0)
+                elif achievement['achievement_type'] == 'ATTENDED_DISCUSSION':
+                    stats['total_points'] += rules.get('attend_discussion_points', 0)
+                elif achievement['achievement_type'] == 'FINISHED_OTHER_BOOK':
+                    stats['total_points'] += rules.get('finish_other_book_points', 0)
+
+        if not member_logs.empty:
+            stats['total_reading_minutes_common'] = int(member_logs['common_book_minutes'].sum())
+            stats['total_reading_minutes_other'] = int(member_logs['other_book_minutes'].sum())
+            stats['total_quotes_submitted'] = int(member_logs['submitted_common_quote'].sum() + member_logs['submitted_other_quote'].sum())
+            # dropna: مع pandas الحديثة يفشل max على عمود تواريخ فيه قيم مفقودة
+            if not member_logs['submission_date_dt'].isnull().all():
+                stats['last_log_date'] = str(member_logs['submission_date_dt'].dropna().max())
+            quote_logs = member_logs[(member_logs['submitted_common_quote'] == 1) | (member_logs['submitted_other_quote'] == 1)]
+            if not quote_logs.empty and not quote_logs['submission_date_dt'].isnull().all():
+                stats['last_quote_date'] = str(quote_logs['submission_date_dt'].dropna().max())
+
+        if not member_achievements.empty:
+            stats['total_common_books_read'] = int((member_achievements['achievement_type'] == 'FINISHED_COMMON_BOOK').sum())
+            stats['total_other_books_read'] = int((member_achievements['achievement_type'] == 'FINISHED_OTHER_BOOK').sum())
+            stats['meetings_attended'] = int((member_achievements['achievement_type'] == 'ATTENDED_DISCUSSION').sum())
+
+        stats['total_points'] = int(stats['total_points'])
+        results.append(stats)
+    return results
+
+def random_logs(rng, member_ids, count):
+    logs = []
+    for _ in range(count):
+        # أيام خارج جميع التحديات وتواريخ غير صالحة مقصودة
+        submission_date = rng.choice([
+            f"{rng.randint(1, 28):02d}/{rng.randint(1, 5):02d}/2024",
+            f"{rng.randint(1, 28):02d}/{rng.randint(1, 5):02d}/2024",
+            f"{rng.randint(1, 28):02d}/{rng.randint(1, 5):02d}/2024",
+            "", "2024-01-05",
+        ])
+        logs.append({
+            'member_id': rng.choice(member_ids),
+            'submission_date': submission_date,
+            'common_book_minutes': rng.randint(0, 180),
+            'other_book_minutes': rng.choice([0, 0, rng.randint(1, 120)]),
+            'submitted_common_quote': rng.randint(0, 1),
+            'submitted_other_quote': rng.randint(0, 1),
+        })
+    return logs
+
+def random_achievements(rng, member_ids, count):
+    return [
+        {
+            'member_id': rng.choice(member_ids),
+            'achievement_type': rng.choice(['FINISHED_COMMON_BOOK', 'ATTENDED_DISCUSSION', 'FINISHED_OTHER_BOOK']),
+            'achievement_date': '2024-01-10',
+            'period_id': rng.choice(['p1', 'p2', 'p3', 'deleted-period']),
+            'book_id': None,
+        }
+        for _ in range(count)
+    ]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_compute_member_stats_matches_reference_loop(seed, members, periods):
+    rng = random.Random(seed)
+    # يتضمن سجلات لعضو محذوف لا تظهر في الإحصائيات
+    member_ids = [member['members_id'] for member in members] + ['removed-member']
+    logs = random_logs(rng, member_ids, 300)
+    achievements = random_achievements(rng, member_ids, 40)
+
+    expected = reference_member_stats(members, logs, achievements, periods)
+    actual = main.compute_member_stats(members, pd.DataFrame(logs), pd.DataFrame(achievements), periods)
+    assert actual == expected
+
+def test_compute_member_stats_without_logs_or_achievements(members, periods):
+    stats = main.compute_member_stats(members, pd.DataFrame(), pd.DataFrame(), periods)
+    assert stats == reference_member_stats(members, [], [], periods)
+    assert all(entry['total_points'] == 0 and entry['last_log_date'] is None for entry in stats)
+
+def test_compute_member_stats_per_period_rules(members, periods):
+    logs = [
+        # 25 دقيقة في p1 (10 دقائق لكل نقطة) و 25 دقيقة في p2 (7 دقائق لكل نقطة) واقتباس مشترك في كل منهما
+        {'member_id': 'm0', 'submission_date': '15/01/2024', 'common_book_minutes': 25, 'other_book_minutes': 0, 'submitted_common_quote': 1, 'submitted_other_quote': 0},
+        {'member_id': 'm0', 'submission_date': '15/02/2024', 'common_book_minutes': 25, 'other_book_minutes': 0, 'submitted_common_quote': 1, 'submitted_other_quote': 0},
+        # بين التحديين: تُحسب الدقائق دون نقاط
+        {'member_id': 'm0', 'submission_date': '02/02/2024', 'common_book_minutes': 60, 'other_book_minutes': 0, 'submitted_common_quote': 0, 'submitted_other_quote': 0},
+    ]
+    achievements = [{'member_id': 'm0', 'achievement_type': 'ATTENDED_DISCUSSION', 'achievement_date': '2024-02-20', 'period_id': 'p2', 'book_id': None}]
+
+    stats = main.compute_member_stats(members, pd.DataFrame(logs), pd.DataFrame(achievements), periods)[0]
+    assert stats['total_points'] == (2 + 3) + (3 + 2) + 10
+    assert stats['total_reading_minutes_common'] == 110
+    assert stats['meetings_attended'] == 1
+    assert stats['last_log_date'] == '2024-02-15'
+    assert stats['last_quote_date'] == '2024-02-15'
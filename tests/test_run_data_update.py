@@ -0,0 +1,190 @@
+import copy
+import pytest
+import db_manager as db
+import main
+
+USER_ID = 'u'
+HEADER = [
+    'Timestamp', 'اسمك', 'تاريخ القراءة', 'مدة قراءة الكتاب المشترك', 'مدة قراءة كتاب آخر (إن وجد)',
+    'ما هي الاقتباسات التي أرسلتها اليوم؟ (اختر كل ما ينطبق)', 'إنجازات الكتب والنقاش',
+]
+SYNCED_COLLECTIONS = ['logs', 'achievements', 'member_stats', 'daily_rollup', 'challenge_snapshots']
+
+def sheet_row(i: int):
+    """
+    The i-th form response. Timestamps only grow, as in a real form, while the
+    reading dates cycle through January to April, so rows fall in every challenge
+    and in the gaps between them, and appended rows may report earlier days.
+    """
+    month, day = 1 + (i // 28) % 4, 1 + i % 28
+    achievement = {3: 'أنهيت الكتاب المشترك', 4: 'حضرت جلسة النقاش', 5: 'أنهيت كتاباً آخر'}.get(i % 11, '')
+    quote = ['', 'أرسلت اقتباساً من الكتاب المشترك', 'أرسلت اقتباساً من كتاب آخر'][i % 3]
+    return [
+        f'2024/05/01 {i // 60:02d}:{i % 60:02d}:00', f'عضو {i % 5}', f'{day:02d}/{month:02d}/2024',
+        f'0:{(i * 7) % 60}:00', str((i * 13) % 50) if i % 4 else '', quote, achievement,
+    ]
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    @property
+    def row_count(self):
+        # ورقة النموذج تحتفظ بصفوف فارغة بعد آخر رد
+        return len(self.spreadsheet.values) + 20
+
+    def get_all_values(self):
+        self.spreadsheet.full_reads += 1
+        return copy.deepcopy(self.spreadsheet.values)
+
+    def batch_get(self, ranges):
+        self.spreadsheet.tail_reads += 1
+        first_row = int(ranges[1].split(':')[0])
+        return [[list(self.spreadsheet.values[0])], copy.deepcopy(self.spreadsheet.values[first_row - 1:])]
+
+class FakeSpreadsheet:
+    def __init__(self, rows):
+        self.values = [HEADER] + rows
+        self.modified_time = '2024-05-01T00:00:00Z'
+        self.full_reads = 0
+        self.tail_reads = 0
+
+    def get_lastUpdateTime(self):
+        if self.modified_time is None:
+            raise PermissionError("Drive metadata is not available.")
+        return self.modified_time
+
+    def worksheet(self, name):
+        assert name == "Form Responses 1"
+        return FakeWorksheet(self)
+
+    def append(self, rows):
+        self.values += rows
+        self.modified_time = f'2024-05-{len(self.values) % 28 + 1:02d}T00:00:00Z'
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_url(self, url):
+        return self.spreadsheet
+
+def seed_workspace(store, members, periods):
+    db.create_new_user_workspace(USER_ID, 'admin@example.com')
+    user_ref = store.collection('users').document(USER_ID)
+    user_ref.collection('settings').document('config').update({'spreadsheet_url': 'https://docs.google.com/spreadsheets/d/sheet'})
+    for member in members:
+        user_ref.collection('members').document(member['members_id']).set({k: v for k, v in member.items() if k != 'members_id'})
+    for book_id in ['b1', 'b2']:
+        user_ref.collection('books').document(book_id).set({'title': book_id, 'author': 'A', 'publication_year': 2000})
+    for period in periods:
+        user_ref.collection('periods').document(period['periods_id']).set({k: v for k, v in period.items() if k != 'periods_id'})
+
+def synced_data(store):
+    return {name: store.subcollection(USER_ID, name) for name in SYNCED_COLLECTIONS}
+
+def sync_state():
+    return db.get_user_settings(USER_ID).get('sync_state')
+
+@pytest.fixture
+def sheet():
+    return FakeSpreadsheet([sheet_row(i) for i in range(120)])
+
+@pytest.fixture
+def synced(store, members, periods, sheet):
+    """
+    A workspace after its first (full) sync of `sheet`.
+    """
+    seed_workspace(store, members, periods)
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "🔄 جاري المزامنة الكاملة ومطابقة جميع الصفوف مع السجلات الحالية..." in log
+    assert sync_state()['state_version'] == main.SYNC_STATE_VERSION
+    sheet.full_reads = sheet.tail_reads = 0
+    store.reset_counters()
+    return store
+
+def full_sync_result(store, members, periods, sheet):
+    """
+    What a first full sync of the same sheet into an empty workspace stores.
+    """
+    store.reset()
+    seed_workspace(store, members, periods)
+    main.run_data_update(FakeClient(FakeSpreadsheet(copy.deepcopy(sheet.values[1:]))), USER_ID)
+    return synced_data(store)
+
+def test_unchanged_sheet_stops_after_the_probe(synced, sheet):
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "ℹ️ لا توجد تغييرات في الجدول أو الإعدادات منذ آخر مزامنة." in log
+    assert (sheet.full_reads, sheet.tail_reads, synced.writes) == (0, 0, 0)
+
+def test_appended_rows_sync_incrementally(synced, sheet, members, periods):
+    total_logs = len(synced.subcollection(USER_ID, 'logs'))
+    sheet.append([sheet_row(i) for i in range(120, 130)])
+
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "➕ مزامنة تزايدية: 10 صف جديد منذ آخر مزامنة." in log
+    assert (sheet.full_reads, sheet.tail_reads) == (0, 1)
+    # لا تُقرأ السجلات كلها، بل ما تعتمد عليه الصفوف الجديدة فقط
+    assert synced.reads < total_logs
+    assert sync_state()['row_count'] == 130
+
+    assert synced_data(synced) == full_sync_result(synced, members, periods, sheet)
+
+def test_edited_row_with_known_modified_time_forces_a_full_reconcile(synced, sheet, members, periods):
+    sheet.values[5][3] = '2:00:00'
+    sheet.modified_time = '2024-06-01T00:00:00Z'
+
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert any(line.startswith("⚠️ تغيّر الجدول دون إضافة صفوف جديدة فقط") for line in log)
+    assert sheet.full_reads == 1
+    assert sync_state()['sheet_modified_time'] == '2024-06-01T00:00:00Z'
+    assert synced_data(synced) == full_sync_result(synced, members, periods, sheet)
+
+def test_without_modified_time_an_empty_tail_means_no_changes(synced, sheet):
+    sheet.modified_time = None
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "ℹ️ لا توجد صفوف جديدة منذ آخر مزامنة." in log
+    assert (sheet.full_reads, sheet.tail_reads, synced.writes) == (0, 1, 0)
+
+def test_changed_last_synced_row_forces_a_full_read(synced, sheet):
+    sheet.values[-1][1] = 'عضو 0'
+    sheet.modified_time = None
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "🔄 جاري المزامنة الكاملة ومطابقة جميع الصفوف مع السجلات الحالية..." in log
+    assert sheet.full_reads == 1
+
+def test_config_change_forces_a_full_read(synced, sheet):
+    synced.collection('users').document(USER_ID).collection('members').document('m9').set({'name': 'عضو 9', 'is_active': True})
+    sheet.append([sheet_row(200)])
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "⚠️ تم اكتشاف تغيير في الأعضاء أو التحديات." in log
+    assert sheet.full_reads == 1
+
+@pytest.mark.parametrize('state_change', [{'state_version': 1}, None])
+def test_outdated_or_missing_sync_state_forces_a_full_read(synced, sheet, state_change):
+    db.save_sync_state(USER_ID, {**sync_state(), **state_change} if state_change else {})
+    sheet.append([sheet_row(200)])
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "🔄 جاري المزامنة الكاملة ومطابقة جميع الصفوف مع السجلات الحالية..." in log
+    assert (sheet.full_reads, sheet.tail_reads) == (1, 0)
+
+def test_full_rebuild_skips_the_probe(synced, sheet):
+    log = main.run_data_update(FakeClient(sheet), USER_ID, full_rebuild=True)
+    assert "🔄 جاري المزامنة الكاملة ومطابقة جميع الصفوف مع السجلات الحالية..." in log
+    assert sheet.full_reads == 1
+    # لا شيء تغيّر في الجدول، فلا يُكتب أي سجل
+    assert "💾 تم إرسال 0 سجل و 0 إنجاز للكتابة." in log
+
+def test_failed_writes_clear_the_sync_state(synced, sheet):
+    sheet.append([sheet_row(i) for i in range(120, 125)])
+    synced.fail_commits = True
+
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert log[-1] == "\n--- ⚠️ انتهت عملية المزامنة مع وجود أخطاء ---"
+    assert sync_state() == {}
+
+    # المزامنة التالية تعيد المطابقة كاملة (صفوف 'عضو 4' لعضو غير مسجل فلا تُكتب)
+    synced.fail_commits = False
+    log = main.run_data_update(FakeClient(sheet), USER_ID)
+    assert "🔄 جاري المزامنة الكاملة ومطابقة جميع الصفوف مع السجلات الحالية..." in log
+    assert len(synced.subcollection(USER_ID, 'logs')) == 100
@@ -0,0 +1,102 @@
+import pandas as pd
+import main
+
+HEADER = [
+    'Timestamp', 'اسمك', 'تاريخ القراءة', 'مدة قراءة الكتاب المشترك', 'مدة قراءة كتاب آخر (إن وجد)',
+    'ما هي الاقتباسات التي أرسلتها اليوم؟ (اختر كل ما ينطبق)', 'إنجازات الكتب والنقاش',
+]
+
+def sheet(rows, header=HEADER):
+    return main._rows_to_df(header, [main._pad_row(row, len(header)) for row in rows])
+
+def workspace(members, periods, logs=(), achievements=()):
+    return {'members': members, 'periods': periods, 'logs': list(logs), 'achievements': list(achievements)}
+
+def test_normalize_sheet_rows_parses_and_filters():
+    df = sheet([
+        ['2024/01/03 09:00:00', ' عضو 1 ', '03/01/2024', '1:30:00', '0:45', 'أرسلت اقتباساً من الكتاب المشترك', 'أنهيت الكتاب المشترك, حضرت جلسة النقاش'],
+        ['2024/01/02 09:00:00', 'عضو 0', '02/01/2024 10:00', '', 'abc', 'أرسلت اقتباساً من كتاب آخر', 'أنهيت كتاباً آخر'],
+        ['', 'عضو 0', '02/01/2024', '1:00:00', '', '', ''],
+        ['2024/01/04 09:00:00', 'عضو 0', '2024-01-04', '1:00:00', '', '', ''],
+        ['2024/01/05 09:00:00', 'عضو 0', '31/02/2024', '1:00:00', '', '', ''],
+    ])
+    rows = main.normalize_sheet_rows(df)
+
+    # بلا ختم زمني أو بتاريخ لا يطابق DD/MM/YYYY (أو تاريخ غير موجود) تُستبعد، والباقي مرتب بالختم الزمني
+    assert rows['timestamp'].tolist() == ['2024/01/02 09:00:00', '2024/01/03 09:00:00']
+    assert rows['member_name'].tolist() == ['عضو 0', 'عضو 1']
+    assert rows['submission_date'].tolist() == ['02/01/2024', '03/01/2024']
+    assert rows['achievement_date'].tolist() == ['2024-01-02', '2024-01-03']
+    assert rows['common_book_minutes'].tolist() == [0, 90]
+    assert rows['other_book_minutes'].tolist() == [0, 45]
+    assert rows['submitted_common_quote'].tolist() == [0, 1]
+    assert rows['submitted_other_quote'].tolist() == [1, 0]
+    assert rows['finished_common_book'].tolist() == [False, True]
+    assert rows['attended_discussion'].tolist() == [False, True]
+    assert rows['finished_other_book'].tolist() == [True, False]
+
+def test_normalize_sheet_rows_reads_the_older_header_variants():
+    old_header = [
+        'Timestamp', 'اسمك', 'تاريخ القراءة', 'مدة قراءة الكتاب المشترك (اختياري)', 'مدة قراءة كتاب آخر (اختياري)',
+        'ما هي الاقتباسات التي أرسلتها اليوم؟ (اختياري)', 'إنجازات الكتب والنقاش (اختر فقط عند حدوثه لأول مرة)',
+    ]
+    df = sheet([['2024/01/03 09:00:00', 'عضو 1', '03/01/2024', '0:20:00', '2:05:00', 'أرسلت اقتباساً من الكتاب المشترك', 'حضرت جلسة النقاش']], header=old_header)
+    row = main.normalize_sheet_rows(df).iloc[0]
+    assert (row['common_book_minutes'], row['other_book_minutes']) == (20, 125)
+    assert row['submitted_common_quote'] == 1
+    assert row['attended_discussion']
+
+def test_normalize_sheet_rows_empty_sheet():
+    rows = main.normalize_sheet_rows(pd.DataFrame())
+    assert rows.empty
+    assert 'submission_date' in rows.columns
+
+def test_plan_sheet_documents_full_sheet(members, periods):
+    df = sheet([
+        ['2024/01/02 09:00:00', 'عضو 0', '02/01/2024', '0:30:00', '', '', 'أنهيت الكتاب المشترك'],
+        ['2024/01/09 09:00:00', 'عضو 0', '09/01/2024', '0:30:00', '', '', 'أنهيت الكتاب المشترك, أنهيت كتاباً آخر'],
+        ['2024/01/10 09:00:00', 'عضو 0', '10/01/2024', '0:10:00', '', '', 'أنهيت كتاباً آخر'],
+        # نفس الختم الزمني لنفس العضو مرتين: سجلان منفصلان
+        ['2024/01/10 09:00:00', 'عضو 0', '10/01/2024', '0:10:00', '', '', ''],
+        # خارج جميع التحديات: سجل دون إنجازات
+        ['2024/02/02 09:00:00', 'عضو 1', '02/02/2024', '0:15:00', '', '', 'حضرت جلسة النقاش'],
+        # عضو غير مسجل
+        ['2024/01/11 09:00:00', 'زائر', '11/01/2024', '0:15:00', '', '', 'حضرت جلسة النقاش'],
+    ])
+    logs, achievements, processed = main.plan_sheet_documents(df, workspace(members, periods), prune=True)
+
+    assert processed == 5
+    assert len(logs) == 5
+    assert sorted(log['member_id'] for log in logs.values()) == ['m0', 'm0', 'm0', 'm0', 'm1']
+    assert main._log_doc_id('2024/01/10 09:00:00', 'm0', 1) in logs
+
+    types = sorted(ach['achievement_type'] for ach in achievements.values())
+    # الكتاب المشترك مرة واحدة لكل عضو في كل تحدي، والكتب الأخرى مرة لكل سجل
+    assert types == ['FINISHED_COMMON_BOOK', 'FINISHED_OTHER_BOOK', 'FINISHED_OTHER_BOOK']
+    common = achievements[main._achievement_doc_id('m0', 'FINISHED_COMMON_BOOK', 'p1')]
+    assert common == {'member_id': 'm0', 'achievement_type': 'FINISHED_COMMON_BOOK', 'achievement_date': '2024-01-02', 'period_id': 'p1', 'book_id': 'b1'}
+
+    # المعرّفات ثابتة: نفس الجدول ينتج نفس المستندات
+    assert main.plan_sheet_documents(df, workspace(members, periods), prune=True) == (logs, achievements, processed)
+
+def test_plan_sheet_documents_continues_from_existing_documents(members, periods):
+    first = sheet([['2024/01/02 09:00:00', 'عضو 0', '02/01/2024', '0:30:00', '', '', 'أنهيت الكتاب المشترك']])
+    existing_logs, existing_achievements, _ = main.plan_sheet_documents(first, workspace(members, periods), prune=True)
+    current = workspace(members, periods, existing_logs.values(), existing_achievements.values())
+
+    # صف جديد بنفس الختم الزمني، ويكرر إنجاز الكتاب المشترك في نفس التحدي
+    new_rows = sheet([['2024/01/02 09:00:00', 'عضو 0', '05/01/2024', '0:20:00', '', '', 'أنهيت الكتاب المشترك']])
+    logs, achievements, processed = main.plan_sheet_documents(new_rows, current)
+
+    assert processed == 1
+    assert list(logs) == [main._log_doc_id('2024/01/02 09:00:00', 'm0', 1)]
+    assert achievements == {}
+
+    # والمطابقة الكاملة للجدول كاملاً تنتج نفس المستندات
+    full = sheet([
+        ['2024/01/02 09:00:00', 'عضو 0', '02/01/2024', '0:30:00', '', '', 'أنهيت الكتاب المشترك'],
+        ['2024/01/02 09:00:00', 'عضو 0', '05/01/2024', '0:20:00', '', '', 'أنهيت الكتاب المشترك'],
+    ])
+    full_logs, full_achievements, _ = main.plan_sheet_documents(full, current, prune=True)
+    assert full_logs == {**existing_logs, **logs}
+    assert full_achievements == existing_achievements